@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from telemetry import Counter, record, register_metric
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+SHARED_LLM_CONCURRENCY = int(os.getenv("SHARED_LLM_CONCURRENCY", "8"))  # Gemini calls in flight on the admin key
+SHARED_LLM_QUEUE_SIZE = int(os.getenv("SHARED_LLM_QUEUE_SIZE", "64"))  # requests waiting for a slot, beyond that: 429
+SHARED_LLM_QUEUE_PER_USER = int(os.getenv("SHARED_LLM_QUEUE_PER_USER", "2"))
+SHARED_LLM_QUEUE_TIMEOUT = float(os.getenv("SHARED_LLM_QUEUE_TIMEOUT", "15"))  # seconds a request may wait for a slot
+BUSY_RETRY_AFTER_SECONDS = 5
+# Peers (e.g. a reverse proxy) whose X-Forwarded-For is believed; anyone else could spoof it
+TRUSTED_PROXIES = {host.strip() for host in os.getenv("TRUSTED_PROXIES", "").split(",") if host.strip()}
+
+ADMISSION_TOTAL = register_metric(Counter("ai_llm_admission_total", "Shared-key LLM admission decisions by outcome"))
+COALESCED_TOTAL = register_metric(Counter("ai_coalesced_requests_total", "Requests served by an identical in-flight request"))
+
+
+def client_address(http_request, trusted_proxies=None):
+    """
+    The caller's address: the socket peer, or the last X-Forwarded-For hop if
+    the peer is a trusted proxy. A peer without an address is a Unix socket,
+    i.e. the serve.py router, which always sets the header itself.
+    """
+    trusted_proxies = TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    peer = http_request.client.host if http_request.client else None
+    if not peer or peer in trusted_proxies:
+        forwarded = http_request.headers.get("x-forwarded-for", "").split(",")[-1].strip()
+        return forwarded or peer
+    return peer
+
+
+class Overloaded(Exception):
+    """The shared LLM key is saturated; the request should be retried later (HTTP 429)."""
+
+    def __init__(self, reason, retry_after=BUSY_RETRY_AFTER_SECONDS):
+        super().__init__(f"AI service is busy ({reason}), please retry in a few seconds")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """
+    Bounds concurrent LLM calls on the shared API key. Requests beyond
+    capacity wait in a queue served round-robin by requester (user id, or
+    forwarded client address), so one busy user can't starve the others.
+    A request is rejected with Overloaded at once if the queue is full or its
+    requester already has max_per_user waiting, and after timeout seconds of
+    waiting. Unidentified requests share one "anonymous" turn and no per-user
+    cap. Event-loop only: all state is touched from one loop.
+    """
+
+    def __init__(self, capacity=SHARED_LLM_CONCURRENCY, max_queue=SHARED_LLM_QUEUE_SIZE,
+                 max_per_user=SHARED_LLM_QUEUE_PER_USER, timeout=SHARED_LLM_QUEUE_TIMEOUT):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.timeout = timeout
+        self.active = 0
+        self.depth = 0
+        self._waiting = OrderedDict()  # requester -> deque of futures; order is the round-robin order
+
+    @asynccontextmanager
+    async def slot(self, requester):
+        await self._acquire(requester)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, requester):
+        if self.active < self.capacity and not self._waiting:
+            self.active += 1
+            ADMISSION_TOTAL.inc(outcome="admitted")
+            return
+        if self.depth >= self.max_queue:
+            self._reject("queue_full")
+        if requester is not None and len(self._waiting.get(requester, ())) >= self.max_per_user:
+            self._reject("user_limit")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(requester, deque()).append(future)
+        self.depth += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self._release()  # granted just as we gave up: pass the slot on
+            else:
+                self._discard(requester, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout")
+            raise
+        finally:
+            record("llm_queue", time.perf_counter() - started)
+        ADMISSION_TOTAL.inc(outcome="queued")
+
+    def _release(self):
+        # Hand the slot straight to the next requester in round-robin order
+        while self._waiting:
+            requester, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            self.depth -= 1
+            if queue:
+                self._waiting.move_to_end(requester)
+            else:
+                del self._waiting[requester]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, requester, future):
+        queue = self._waiting.get(requester)
+        if queue and future in queue:
+            queue.remove(future)
+            self.depth -= 1
+            if not queue:
+                del self._waiting[requester]
+
+    def _reject(self, reason):
+        ADMISSION_TOTAL.inc(outcome=f"rejected_{reason}")
+        raise Overloaded(reason)
+
+    def stats(self):
+        return {"active": self.active, "capacity": self.capacity, "queued": self.depth, "requesters": len(self._waiting)}
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent work: the first caller for a key starts
+    it as a task, later callers with the same key wait for that task instead
+    of starting their own. The task isn't cancelled if a caller goes away, so
+    the others (and the answer cache) still get the result.
+    """
+
+    def __init__(self):
+        self._flights = {}  # key -> asyncio.Task | _Broadcast
+
+    async def run(self, key, make_coroutine):
+        """Returns the result of make_coroutine() run once per key at a time."""
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make_coroutine())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            return await asyncio.shield(task)
+
+        COALESCED_TOTAL.inc(kind="answer")
+        started = time.perf_counter()
+        try:
+            return await asyncio.shield(task)
+        finally:
+            record("coalesced_wait", time.perf_counter() - started)
+
+    async def stream(self, key, make_generator):
+        """Yields the events of make_generator() run once per key; late subscribers replay from the start."""
+        broadcast = self._flights.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._flights[key] = broadcast
+            task = asyncio.ensure_future(broadcast.pump(make_generator()))
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            COALESCED_TOTAL.inc(kind="stream")
+        async for event in broadcast.subscribe():
+            yield event
+
+    def _done(self, key, task):
+        self._flights.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved by the waiters; keeps asyncio from logging it again
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class _Broadcast:
+    """Events of one generator, replayed to every subscriber as they arrive."""
+
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    async def pump(self, generator):
+        try:
+            async for event in generator:
+                self._publish(event)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._changed.set()
+
+    def _publish(self, event):
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.finished:
+                if self.error:
+                    raise self.error
+                return
+            await self._changed.wait()
@@ -0,0 +1,94 @@
+"""
+Compares two bench.run reports metric by metric.
+
+    python -m bench.compare bench/results/baseline.json bench/results/new.json [--tolerance 0.1]
+
+Exits 1 if any latency, duration, memory or error metric got worse (or any
+throughput metric dropped) by more than the tolerance.
+"""
+import sys
+import json
+import argparse
+
+HIGHER_IS_BETTER = ("_rps", "per_second")
+LOWER_IS_BETTER = ("_ms", "seconds", "errors", "failed_jobs", "service", "largest_worker", "live_workers_total")
+
+
+def flatten(report, prefix=""):
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def direction(metric):
+    """+1 if higher is better, -1 if lower is better, 0 for counts that aren't compared."""
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf.endswith(HIGHER_IS_BETTER):
+        return 1
+    if leaf.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline, current, tolerance=0.10):
+    """Returns [(metric, baseline, current, relative change or None, verdict)] for comparable metrics."""
+    old, new = flatten(baseline), flatten(current)
+    rows = []
+    for metric in sorted(set(old) & set(new)):
+        if metric.startswith("meta.") or not direction(metric):
+            continue
+        before, after = old[metric], new[metric]
+        change = (after - before) / before if before else None
+        worse = (after - before) * -direction(metric)
+        if change is None:
+            verdict = "regression" if worse > 0 else "ok"
+        elif worse > 0 and abs(change) > tolerance:
+            verdict = "regression"
+        elif worse < 0 and abs(change) > tolerance:
+            verdict = "improvement"
+        else:
+            verdict = "ok"
+        rows.append((metric, before, after, change, verdict))
+    return rows
+
+
+def compare_files(baseline_path, current_path, tolerance=0.10):
+    """Prints the comparison table; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+
+    for section in ("size", "seed", "concurrency", "requests"):
+        if baseline["meta"].get(section) != current["meta"].get(section):
+            print(f"⚠️  {section} differs ({baseline['meta'].get(section)} vs {current['meta'].get(section)}); "
+                  f"numbers are not directly comparable")
+
+    rows = compare(baseline, current, tolerance)
+    marks = {"regression": "❌", "improvement": "✅", "ok": "  "}
+    print(f"{'metric':<60} {'baseline':>12} {'current':>12} {'change':>9}")
+    for metric, before, after, change, verdict in rows:
+        change_text = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"{marks[verdict]} {metric:<58} {before:>12.3f} {after:>12.3f} {change_text:>9}")
+    regressions = sum(1 for row in rows if row[4] == "regression")
+    print(f"\n{regressions} regression(s) beyond {tolerance:.0%} "
+          f"({baseline['meta'].get('git_revision')} → {current['meta'].get('git_revision')})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (default 10%%)")
+    args = parser.parse_args(argv)
+    sys.exit(1 if compare_files(args.baseline, args.current, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+
+# Corpus sizes: markdown docs, MongoDB resources, users, uploads per user, pages per PDF
+SIZES = {
+    "small": {"docs": 20, "resources": 100, "users": 6, "files_per_user": 2, "pdf_pages": 4, "paragraphs": 6},
+    "medium": {"docs": 200, "resources": 1000, "users": 20, "files_per_user": 4, "pdf_pages": 12, "paragraphs": 10},
+    "large": {"docs": 1000, "resources": 10000, "users": 50, "files_per_user": 8, "pdf_pages": 40, "paragraphs": 12},
+}
+SHARED_UPLOAD_RATIO = 0.3  # users who also upload the same handbook PDF (members share course material)
+
+TOPICS = {
+    "Web Development": ["react", "javascript", "css", "html", "node", "express", "rest", "api", "frontend", "routing"],
+    "Machine Learning": ["model", "training", "dataset", "gradient", "regression", "classifier", "pytorch", "features", "overfitting", "inference"],
+    "Cybersecurity": ["encryption", "firewall", "phishing", "vulnerability", "exploit", "authentication", "hashing", "malware", "ctf", "audit"],
+    "Cloud": ["docker", "kubernetes", "container", "deployment", "scaling", "serverless", "storage", "region", "load", "balancer"],
+    "Competitive Programming": ["algorithm", "graph", "dynamic", "programming", "complexity", "sorting", "tree", "recursion", "greedy", "contest"],
+}
+CLUB_TERMS = ["adroit", "club", "member", "workshop", "event", "mentor", "project", "hackathon", "session", "team"]
+FILLER = ["the", "a", "of", "and", "to", "in", "for", "with", "on", "is", "we", "our", "this", "that", "each", "every"]
+RESOURCE_TYPES = ["video", "article", "course", "book", "tool"]
+DIFFICULTIES = ["beginner", "intermediate", "advanced"]
+QUESTION_TEMPLATES = [
+    "What is {term} in {domain}?",
+    "How do I get started with {term}?",
+    "Explain {term} and {other} for a {difficulty} member",
+    "Which {domain} resources cover {term}?",
+    "When is the next {club} about {term}?",
+    "{term} {other}",
+]
+
+
+def sentence(rng, domain):
+    words = rng.sample(TOPICS[domain], 3) + [rng.choice(CLUB_TERMS)] + rng.sample(FILLER, 6)
+    rng.shuffle(words)
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng, domain, sentences=5):
+    return " ".join(sentence(rng, domain) for _ in range(sentences))
+
+
+def markdown_doc(rng, i, paragraphs):
+    domain = rng.choice(list(TOPICS))
+    sections = [f"# {domain} notes {i}\n"]
+    for n in range(paragraphs):
+        sections.append(f"## {rng.choice(TOPICS[domain]).title()} {n}\n\n{paragraph(rng, domain)}\n")
+    return "\n".join(sections)
+
+
+def resource(rng, i, now):
+    domain = rng.choice(list(TOPICS))
+    return {
+        "_id": ObjectId(rng.randbytes(12)),
+        "title": f"{rng.choice(TOPICS[domain]).title()} {rng.choice(RESOURCE_TYPES)} #{i}",
+        "description": paragraph(rng, domain, sentences=3),
+        "type": rng.choice(RESOURCE_TYPES),
+        "domain": domain,
+        "difficulty": rng.choice(DIFFICULTIES),
+        "url": f"https://example.com/resources/{i}",
+        "tags": rng.sample(TOPICS[domain], 3),
+        "updatedAt": now - timedelta(minutes=i),
+    }
+
+
+def pdf_bytes(pages):
+    """A minimal valid PDF with one Helvetica text page per entry of pages (readable by pypdf)."""
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] /Count {len(pages)} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        lines = " ".join(f"({escape(line)}) Tj 0 -12 Td" for line in text.split("\n"))
+        stream = f"BT /F1 9 Tf 40 760 Td {lines} ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def pdf_page(rng, domain, lines=40):
+    return "\n".join(sentence(rng, domain) for _ in range(lines))
+
+
+def user_upload(rng, user_index, file_index, pdf_pages, paragraphs):
+    """One upload as (filename, bytes): alternately a PDF and a text file."""
+    domain = rng.choice(list(TOPICS))
+    if file_index % 2 == 0:
+        pages = [pdf_page(rng, domain) for _ in range(pdf_pages)]
+        return f"user{user_index}_notes_{file_index}.pdf", pdf_bytes(pages)
+    text = "\n\n".join(paragraph(rng, domain) for _ in range(paragraphs * 2))
+    return f"user{user_index}_notes_{file_index}.txt", text.encode("utf-8")
+
+
+def queries(rng, n, repeat_ratio=0.3):
+    """n chat questions; about repeat_ratio of them repeat an earlier one (announcement-style bursts)."""
+    asked = []
+    for _ in range(n):
+        if asked and rng.random() < repeat_ratio:
+            asked.append(rng.choice(asked))
+            continue
+        domain = rng.choice(list(TOPICS))
+        term, other = rng.sample(TOPICS[domain], 2)
+        asked.append(rng.choice(QUESTION_TEMPLATES).format(
+            term=term, other=other, domain=domain, difficulty=rng.choice(DIFFICULTIES), club=rng.choice(CLUB_TERMS)))
+    return asked
+
+
+class Corpus:
+    def __init__(self, size, resources, users, uploads, followup_uploads):
+        self.size = size
+        self.resources = resources
+        self.users = users  # MongoDB user documents
+        self.uploads = uploads  # user id -> [(filename, bytes)]
+        self.followup_uploads = followup_uploads  # a new file per user, uploaded under load in the mixed scenario
+
+    def summary(self):
+        files = [f for files in self.uploads.values() for f in files]
+        return {
+            "size": self.size,
+            "markdown_docs": SIZES[self.size]["docs"],
+            "resources": len(self.resources),
+            "users": len(self.users),
+            "uploads": len(files),
+            "upload_bytes": sum(len(data) for _, data in files),
+        }
+
+
+def build_corpus(storage_dir, size="small", seed=42):
+    """
+    Writes the markdown docs under storage_dir/data/docs and returns the
+    Corpus with the MongoDB resources, users and per-user uploads to serve.
+    The same size and seed always produce the same corpus.
+    """
+    spec = SIZES[size]
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    docs_dir = os.path.join(storage_dir, "data", "docs")
+    os.makedirs(docs_dir, exist_ok=True)
+    for i in range(spec["docs"]):
+        with open(os.path.join(docs_dir, f"doc_{i:05d}.md"), "w", encoding="utf-8") as f:
+            f.write(markdown_doc(rng, i, spec["paragraphs"]))
+
+    resources = [resource(rng, i, now) for i in range(spec["resources"])]
+
+    # Half the users are approved members (they also search the resources index)
+    users = [{"_id": ObjectId(rng.randbytes(12)), "name": f"bench user {i}", "approved": i % 2 == 0} for i in range(spec["users"])]
+
+    handbook = ("club_handbook.pdf", pdf_bytes([pdf_page(rng, domain) for domain in TOPICS for _ in range(spec["pdf_pages"] // 2 or 1)]))
+    uploads = {}
+    followup_uploads = {}
+    for i, user in enumerate(users):
+        files = [user_upload(rng, i, n, spec["pdf_pages"], spec["paragraphs"]) for n in range(spec["files_per_user"])]
+        if rng.random() < SHARED_UPLOAD_RATIO:
+            files.append(handbook)
+        uploads[str(user["_id"])] = files
+        followup_uploads[str(user["_id"])] = [user_upload(rng, i, 2 * spec["files_per_user"] + 1, spec["pdf_pages"], spec["paragraphs"])]
+
+    return Corpus(size, resources, users, uploads, followup_uploads)
@@ -0,0 +1,111 @@
+"""
+Embedding backend microbenchmark: sentences/s for bulk ingestion, single
+query latency and memory of each backend, each measured in a fresh process.
+
+Run from ai-service/ (export the ONNX models first: python embeddings.py export):
+    python -m bench.embeddings [--backends torch,onnx,onnx-int8] [--sentences 1024] [--output report.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+
+
+def _rss_mb():
+    # Current and peak resident set size (Linux /proc; None elsewhere)
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    values[line.split(":")[0]] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def measure(backend, sentences, queries, seed, results):
+    """Runs in a fresh process so each backend's import and model memory is measured alone."""
+    if SERVICE_DIR not in sys.path:
+        sys.path.insert(0, SERVICE_DIR)
+    from bench.corpus import TOPICS, paragraph, queries as make_queries
+    from bench.run import latency_summary
+
+    rng = random.Random(seed)
+    texts = [paragraph(rng, rng.choice(list(TOPICS)), sentences=rng.randint(2, 12)) for _ in range(sentences)]
+    questions = make_queries(rng, queries, repeat_ratio=0)
+    baseline_rss, _ = _rss_mb()
+
+    started = time.perf_counter()
+    from embeddings import load_embeddings
+    model = load_embeddings(backend)
+    model.embed_query("warm up")
+    load_seconds = time.perf_counter() - started
+    loaded_rss, _ = _rss_mb()
+
+    started = time.perf_counter()
+    model.embed_documents(texts)
+    bulk_seconds = time.perf_counter() - started
+
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        model.embed_query(question)
+        latencies.append(time.perf_counter() - started)
+
+    _, peak_rss = _rss_mb()
+    results[backend] = {
+        "load_seconds": round(load_seconds, 3),
+        "sentences": sentences,
+        "sentences_per_second": round(sentences / bulk_seconds, 1),
+        "query_latency": latency_summary(latencies),
+        "model_rss_mb": round(loaded_rss - baseline_rss, 1) if loaded_rss and baseline_rss else None,
+        "peak_rss_mb": peak_rss,
+        "torch_loaded": "torch" in sys.modules,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the embedding backends.")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--sentences", type=int, default=1024, help="texts embedded in bulk")
+    parser.add_argument("--queries", type=int, default=200, help="single queries timed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        results = manager.dict()
+        for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            process = ctx.Process(target=measure, args=(backend, args.sentences, args.queries, args.seed, results))
+            process.start()
+            process.join()
+            if backend not in results:
+                print(f"⚠️  {backend}: failed (exit code {process.exitcode})", file=sys.stderr)
+        results = dict(results)
+
+    print(f"{'backend':<10} {'load s':>7} {'sent/s':>9} {'query p50 ms':>13} {'query p95 ms':>13} {'model MB':>9} {'peak MB':>8}")
+    for backend, r in results.items():
+        print(f"{backend:<10} {r['load_seconds']:>7.2f} {r['sentences_per_second']:>9.1f} "
+              f"{r['query_latency']['p50_ms']:>13.2f} {r['query_latency']['p95_ms']:>13.2f} "
+              f"{r['model_rss_mb'] or 0:>9.1f} {r['peak_rss_mb'] or 0:>8.1f}")
+    if "torch" in results:
+        for backend, r in results.items():
+            if backend != "torch":
+                speedup = r["sentences_per_second"] / results["torch"]["sentences_per_second"]
+                print(f"   {backend}: {speedup:.2f}x torch throughput")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import time
+import asyncio
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_ANSWER = ("AdroIT runs weekly workshops and project sessions for members; "
+                  "the documents above describe the topics, mentors and resources in more detail.")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Stand-in for Gemini with a configurable latency: the first token arrives
+    after first_token_seconds, the rest at tokens_per_second (one word per token).
+    """
+
+    answer: str = DEFAULT_ANSWER
+    first_token_seconds: float = 0.5
+    tokens_per_second: float = 50.0
+
+    @property
+    def _llm_type(self):
+        return "bench-fake-chat"
+
+    def _tokens(self):
+        return [word + " " for word in self.answer.split()]
+
+    def _total_seconds(self):
+        return self.first_token_seconds + len(self._tokens()) / self.tokens_per_second
+
+    def _result(self):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._total_seconds())
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._total_seconds())
+        return self._result()
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_seconds)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_seconds)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def install_fake_mongo():
+    """
+    Routes every pymongo.MongoClient(...) in this process to one shared
+    in-memory mongomock client. Must run before main/ingest are imported.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("❌ The benchmark needs mongomock: pip install -r bench/requirements.txt")
+    import pymongo
+
+    client = mongomock.MongoClient("mongodb://localhost:27017/club-members")
+    pymongo.MongoClient = lambda *args, **kwargs: client
+    return client
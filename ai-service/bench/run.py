@@ -0,0 +1,422 @@
+"""
+Reproducible benchmark of the AI service.
+
+Builds a seeded synthetic corpus in a scratch storage directory, serves it
+with main.app in-process (Gemini replaced by FakeChatModel, MongoDB by
+mongomock) and drives /chat, /user/upload and /ingest concurrently. Writes a
+JSON report with throughput, p50/p95/p99 latency per request stage,
+ingestion chunks/s and peak RSS; compare two reports with bench.compare.
+
+Run from ai-service/:
+    python -m bench.run --size small --output bench/results/baseline.json
+    python -m bench.run --size small --baseline bench/results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import secrets
+import argparse
+import platform
+import tempfile
+import shutil
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+SCENARIOS = ("upload", "chat", "ingest", "mixed")
+JOB_POLL_SECONDS = 0.2
+JOB_TIMEOUT_SECONDS = 3600
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def latency_summary(seconds):
+    """count, mean, p50/p95/p99 and max of a list of durations, in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    summary = {"count": len(seconds), "mean_ms": sum(seconds) / len(seconds) * 1000}
+    for name, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        summary[name] = percentile(seconds, q) * 1000
+    summary["max_ms"] = max(seconds) * 1000
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in summary.items()}
+
+
+class TraceCollector:
+    """Keeps the request traces finished since the last take() (see telemetry.add_trace_listener)."""
+
+    def __init__(self):
+        self.traces = []
+
+    def __call__(self, trace):
+        self.traces.append(trace)
+
+    def take(self):
+        traces, self.traces = self.traces, []
+        return traces
+
+
+def stage_summary(traces):
+    """Per-stage latency percentiles over request traces (a stage's time summed within each request)."""
+    per_stage = {}
+    for trace in traces:
+        for stage, seconds in trace.stage_totals().items():
+            per_stage.setdefault(stage, []).append(seconds)
+    stages = {stage: latency_summary(values) for stage, values in sorted(per_stage.items())}
+    stages["request"] = latency_summary([t.elapsed for t in traces if t.elapsed is not None])
+    return stages
+
+
+def _peak_kb(pid):
+    # VmHWM: the process's peak resident set size so far (Linux only)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def peak_rss_mb():
+    """Peak RSS of the service process, plus its worker processes (ingestion pools)."""
+    try:
+        import resource
+    except ImportError:
+        return None  # not available on Windows
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes on macOS, KB on Linux
+    live = [_peak_kb(child.pid) for child in multiprocessing.active_children()]
+    return {
+        "service": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "largest_worker": round(max([resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale] + [kb / 1024 for kb in live]), 1),
+        "live_workers_total": round(sum(live) / 1024, 1),
+    }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=SERVICE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def shared_chunks(service):
+    """Chunks in the live global + resources indexes."""
+    bot = service.rag_bot
+    if not bot:
+        return 0
+    stores = (bot.indexes.global_vectorstore, bot.indexes.resources_vectorstore)
+    return sum(store.index.ntotal for store in stores if store is not None)
+
+
+# ---------------------------------------------------------------------------
+# Load drivers
+# ---------------------------------------------------------------------------
+
+async def drive_chat(client, corpus, questions, concurrency, seed, anonymous_ratio=0.4):
+    """Sends every question to /chat from `concurrency` concurrent clients, as a mix of anonymous users and members."""
+    rng = random.Random(seed)
+    member_ids = [str(user["_id"]) for user in corpus.users]
+    requests = [(q, None if rng.random() < anonymous_ratio else rng.choice(member_ids)) for q in questions]
+    pending = list(reversed(requests))
+    latencies, errors, modes = [], 0, {}
+
+    async def client_loop():
+        nonlocal errors
+        while pending:
+            question, user_id = pending.pop()
+            started = time.perf_counter()
+            try:
+                response = await client.post("/chat", json={"message": question, "userId": user_id})
+                mode = response.json().get("mode") if response.status_code == 200 else f"http_{response.status_code}"
+            except Exception:
+                mode = "exception"
+            latencies.append(time.perf_counter() - started)
+            modes[mode] = modes.get(mode, 0) + 1
+            if mode in ("error", "exception") or mode.startswith("http_"):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(requests),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(requests) / elapsed, 3) if elapsed else None,
+        "latency": latency_summary(latencies),
+        "modes": modes,
+    }
+
+
+async def drive_uploads(client, uploads, concurrency):
+    """Uploads every file through /user/upload and waits for the ingestion jobs to finish."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def upload(user_id, filename, data):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/user/upload", data={"userId": user_id}, files={"file": (filename, data)})
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+            return response.json()["jobId"]
+
+    started = time.perf_counter()
+    job_ids = set(await asyncio.gather(*(upload(user_id, filename, data)
+                                         for user_id, files in uploads.items() for filename, data in files)))
+    statuses = {}
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while len(statuses) < len(job_ids) and time.monotonic() < deadline:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        for job_id in job_ids - set(statuses):
+            status = (await client.get(f"/user/ingest/status/{job_id}")).json()
+            if status["status"] in ("done", "failed"):
+                statuses[job_id] = status
+    elapsed = time.perf_counter() - started
+
+    def total(counter):
+        return sum(status["progress"].get(counter, 0) for status in statuses.values())
+
+    # Chunks embedded for new content; files and chunks already in the content store are reused
+    chunks = total("chunks_embedded")
+    return {
+        "files": sum(len(files) for files in uploads.values()),
+        "users": len(uploads),
+        "jobs": len(job_ids),
+        "failed_jobs": sum(1 for status in statuses.values() if status["status"] == "failed") + len(job_ids) - len(statuses),
+        "chunks": chunks,
+        "chunks_reused": total("chunks_reused"),
+        "files_reused": total("files_reused"),
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(chunks / elapsed, 3) if elapsed else None,
+        "upload_latency": latency_summary(latencies),
+    }
+
+
+async def drive_reindex(client, service):
+    """Triggers a full /ingest and waits until the service serves the new index version."""
+    before = service.rag_bot.indexes.version if service.rag_bot else None
+    started = time.perf_counter()
+    response = await client.post("/ingest", params={"mode": "full"})
+    response.raise_for_status()
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if service.rag_bot and service.rag_bot.indexes.version != before:
+            break
+        await asyncio.sleep(JOB_POLL_SECONDS)
+    elapsed = time.perf_counter() - started
+    chunks = shared_chunks(service)
+    return {
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(chunks / elapsed, 3) if elapsed else None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+async def wait_ready(client, timeout=JOB_TIMEOUT_SECONDS):
+    """Polls /readyz until the service has warmed up; returns its startup breakdown."""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = await client.get("/readyz")
+        state = response.json()
+        if response.status_code == 200:
+            return state
+        if state["status"] != "starting" or time.monotonic() > deadline:
+            raise RuntimeError(f"service did not become ready: {state}")
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+async def run_scenarios(args, corpus, service, collector):
+    """Starts the app, runs the scenarios in order; returns (results, startup breakdown, shared chunks)."""
+    import httpx
+    from bench.corpus import queries
+    from bench.fakes import FakeChatModel
+
+    rng = random.Random(args.seed)
+    results = {}
+    transport = httpx.ASGITransport(app=service.app)
+    async with service.app.router.lifespan_context(service.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            startup = await wait_ready(client)
+            service.rag_bot.llm = FakeChatModel(first_token_seconds=args.llm_latency, tokens_per_second=args.llm_tokens_per_second)
+            setup_chunks = shared_chunks(service)
+
+            # First-request costs (thread pools, lazy imports) stay out of the numbers
+            await client.post("/chat", json={"message": "warm up"})
+            collector.take()
+
+            for name in args.scenarios:
+                print(f"▶️  {name}...", file=sys.stderr)
+                if name == "upload":
+                    results[name] = await drive_uploads(client, corpus.uploads, args.concurrency)
+                elif name == "chat":
+                    questions = queries(rng, args.requests, args.repeat_ratio)
+                    results[name] = await drive_chat(client, corpus, questions, args.concurrency, args.seed)
+                    results[name]["stages"] = stage_summary(collector.take())
+                elif name == "ingest":
+                    results[name] = await drive_reindex(client, service)
+                elif name == "mixed":
+                    # Chat load while user uploads are embedded and the shared indexes are rebuilt
+                    questions = queries(rng, args.requests, args.repeat_ratio)
+                    chat, uploads, reindex = await asyncio.gather(
+                        drive_chat(client, corpus, questions, args.concurrency, args.seed + 1),
+                        drive_uploads(client, corpus.followup_uploads, args.concurrency),
+                        drive_reindex(client, service),
+                    )
+                    chat["stages"] = stage_summary(collector.take())
+                    results[name] = {"chat": chat, "upload": uploads, "ingest": reindex}
+                results[name]["peak_rss_mb"] = peak_rss_mb()
+    return results, startup, setup_chunks
+
+
+def prepare_environment(args, storage_dir):
+    """Points the service at the scratch storage dir; must run before any service module is imported."""
+    os.environ["AI_STORAGE_DIR"] = storage_dir
+    os.environ.setdefault("ENCRYPTION_KEY", secrets.token_hex(32))
+    os.environ["RESOURCES_CHANGE_STREAM"] = "false"
+    os.environ.setdefault("LOG_LEVEL", "INFO" if args.verbose else "WARNING")
+    if SERVICE_DIR not in sys.path:
+        sys.path.insert(0, SERVICE_DIR)
+
+
+def run(args):
+    storage_dir = args.workdir or tempfile.mkdtemp(prefix="ai-bench-")
+    prepare_environment(args, storage_dir)
+
+    from bench.corpus import build_corpus
+    from bench.fakes import install_fake_mongo
+    from telemetry import configure_logging
+
+    configure_logging()
+
+    print(f"📦 Building {args.size} corpus in {storage_dir}...", file=sys.stderr)
+    corpus = build_corpus(storage_dir, args.size, args.seed)
+    mongo = install_fake_mongo()
+    db = mongo.get_database()
+    db.user.delete_many({})
+    db.resources.delete_many({})
+    db.user.insert_many([dict(user) for user in corpus.users])
+    db.resources.insert_many([dict(resource) for resource in corpus.resources])
+
+    import ingest
+    from embeddings import EMBEDDING_MODEL, get_embeddings
+
+    # Initial shared index build, measured directly (model load excluded)
+    get_embeddings()
+    started = time.perf_counter()
+    ingest.ingest_docs()
+    setup_seconds = time.perf_counter() - started
+
+    import main as service
+    from telemetry import add_trace_listener
+
+    collector = TraceCollector()
+    add_trace_listener(collector)
+
+    try:
+        scenarios, startup, setup_chunks = asyncio.run(run_scenarios(args, corpus, service, collector))
+    finally:
+        if not args.workdir and not args.keep_workdir:
+            shutil.rmtree(storage_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding_model": EMBEDDING_MODEL,
+            "size": args.size,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "repeat_ratio": args.repeat_ratio,
+            "llm_first_token_seconds": args.llm_latency,
+            "llm_tokens_per_second": args.llm_tokens_per_second,
+        },
+        "setup": {
+            "corpus": corpus.summary(),
+            "startup_seconds": startup["steps"],
+            "ingest": {
+                "chunks": setup_chunks,
+                "seconds": round(setup_seconds, 3),
+                "chunks_per_second": round(setup_chunks / setup_seconds, 3) if setup_seconds else None,
+            },
+        },
+        "scenarios": scenarios,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def parse_args(argv=None):
+    from bench.corpus import SIZES
+
+    parser = argparse.ArgumentParser(description="Benchmark the AI service on a synthetic corpus.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated, run in order (default {','.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="chat requests per chat scenario")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="share of repeated questions")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake LLM seconds to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--output", help="report path (default bench/results/<size>-<time>.json)")
+    parser.add_argument("--baseline", help="report to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (default 10%%)")
+    parser.add_argument("--workdir", help="storage dir to use (kept); default: a temporary dir")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="service logs at INFO")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", f"{args.size}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Report written to {output}", file=sys.stderr)
+
+    if args.baseline:
+        from bench.compare import compare_files
+        sys.exit(1 if compare_files(args.baseline, output, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional weight budget and TTL.
+    Each entry has a weight (e.g. bytes on disk); least recently used
+    entries are evicted until the total weight fits in max_weight.
+    With sliding=True the TTL counts from the last access (idle timeout).
+    """
+
+    def __init__(self, max_entries=None, max_weight=None, ttl=None, sliding=False):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self.sliding = sliding
+        self._data = OrderedDict()  # key -> (value, weight, stored_at)
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None, is_valid=None):
+        """Returns the cached value; entries rejected by is_valid(value) are dropped and count as misses."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, weight, stored_at = entry
+            expired = self.ttl is not None and time.monotonic() - stored_at > self.ttl
+            if expired or (is_valid is not None and not is_valid(value)):
+                self._remove(key)
+                self.misses += 1
+                return default
+            if self.sliding:
+                self._data[key] = (value, weight, time.monotonic())
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, weight=1):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, weight, time.monotonic())
+            self._weight += weight
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def items(self):
+        """Snapshot of unexpired (key, value) pairs; doesn't touch LRU order or counters."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value)
+                for key, (value, _, stored_at) in self._data.items()
+                if self.ttl is None or now - stored_at <= self.ttl
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "weight": self._weight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        _, weight, _ = self._data.pop(key)
+        self._weight -= weight
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while len(self._data) > 1 and (
+            (self.max_entries is not None and len(self._data) > self.max_entries)
+            or (self.max_weight is not None and self._weight > self.max_weight)
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+
+class GenerationCounter:
+    """Per-key counters bumped by writers so readers can detect stale cache entries."""
+
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def bump(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            return self._generations[key]
+
+
+# Bumped by user_ingest after a user's index is rewritten
+user_index_generations = GenerationCounter()
@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+import faiss
+from dotenv import load_dotenv
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+# On-disk layout of an index directory:
+#   index.faiss     FAISS vectors (opened memory-mapped for serving)
+#   chunks.sqlite   one row per vector: position, docstore id, text, metadata,
+#                   plus an FTS5 keyword index (BM25) over the chunk text and
+#                   inverted position lists for the FILTER_FIELDS metadata
+# Directories holding index.pkl instead of chunks.sqlite are the old pickled
+# format and are still loaded through FAISS.load_local.
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+FILTER_FIELDS = ("domain", "type", "difficulty", "tags")
+# Left out of keyword queries: with every term ORed, "what is ..." would match almost any chunk
+KEYWORD_STOPWORDS = frozenset("""
+a about an and any are as at be by can could do does for from how i in is it me my of on or our should
+tell that the there this to was we were what when where which who why will with would you your
+""".split())
+
+
+class ChunkFile:
+    """Shared read-only connection to a chunks.sqlite file, opened on first use (or by open())."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._has_keyword_index = None
+        self._has_facet_index = None
+
+    def open(self):
+        with self._lock:
+            self._connect()
+        return self
+
+    def _connect(self):
+        if self._conn is None:
+            # immutable: published index directories are never modified in place
+            uri = Path(self.path).resolve().as_uri() + "?mode=ro&immutable=1"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def query(self, sql, params=()):
+        with self._lock:
+            self._connect()
+            return self._conn.execute(sql, params).fetchall()
+
+    def has_keyword_index(self):
+        # Chunk files written before the keyword index was added don't have one
+        if self._has_keyword_index is None:
+            rows = self.query("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'")
+            self._has_keyword_index = bool(rows)
+        return self._has_keyword_index
+
+    def has_facet_index(self):
+        if self._has_facet_index is None:
+            rows = self.query("SELECT 1 FROM sqlite_master WHERE name = 'chunk_facets'")
+            self._has_facet_index = bool(rows)
+        return self._has_facet_index
+
+
+class SQLiteDocstore(Docstore):
+    """Docstore that reads a chunk's text and metadata only when a search returns it."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def search(self, search):
+        rows = self.chunks.query("SELECT content, metadata FROM chunks WHERE id = ?", (search,))
+        if not rows:
+            return f"ID {search} not found."
+        content, metadata = rows[0]
+        return Document(id=search, page_content=content, metadata=json.loads(metadata))
+
+
+class ChunkIdMap(Mapping):
+    """FAISS position -> docstore id, looked up in chunks.sqlite instead of held in memory."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __getitem__(self, position):
+        rows = self.chunks.query("SELECT id FROM chunks WHERE pos = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __len__(self):
+        return self.chunks.query("SELECT COUNT(*) FROM chunks")[0][0]
+
+    def __iter__(self):
+        return iter(pos for (pos,) in self.chunks.query("SELECT pos FROM chunks ORDER BY pos"))
+
+    def items(self):
+        return self.chunks.query("SELECT pos, id FROM chunks ORDER BY pos")
+
+    def values(self):
+        return [doc_id for _, doc_id in self.items()]
+
+
+def save_store(vectorstore, directory):
+    """Writes a FAISS vector store as index.faiss + chunks.sqlite (no pickle)."""
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(vectorstore.index, os.path.join(directory, INDEX_FILE))
+
+    path = os.path.join(directory, CHUNKS_FILE)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(
+            "CREATE TABLE chunks (pos INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        conn.execute("CREATE TABLE chunk_facets (field TEXT NOT NULL, value TEXT NOT NULL, pos INTEGER NOT NULL)")
+        rows = []
+        facets = []
+        for pos, doc_id in sorted(vectorstore.index_to_docstore_id.items()):
+            doc = vectorstore.docstore.search(doc_id)
+            rows.append((int(pos), doc_id, doc.page_content, json.dumps(doc.metadata, default=str)))
+            facets.extend((field, value, int(pos)) for field in FILTER_FIELDS for value in facet_values(doc.metadata, field))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO chunk_facets VALUES (?, ?, ?)", facets)
+        conn.execute("CREATE INDEX chunk_facets_lookup ON chunk_facets (field, value)")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE chunks_fts USING fts5(content, content='chunks', content_rowid='pos')")
+            conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            logger.warning("⚠️ SQLite FTS5 unavailable, keyword search disabled for this index: %s", e)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+def load_store(directory, embeddings, writable=False):
+    """
+    Opens the vector store in directory. By default nothing but the FAISS
+    header is read up front: vectors are memory-mapped and chunks are fetched
+    from SQLite as searches return them. Pass writable=True to load everything
+    into memory for adding or deleting vectors (then save with save_store).
+    """
+    chunks_path = os.path.join(directory, CHUNKS_FILE)
+    if not os.path.exists(chunks_path):
+        # Index written in the old pickled format
+        return FAISS.load_local(directory, embeddings, allow_dangerous_deserialization=True)
+
+    index_path = os.path.join(directory, INDEX_FILE)
+    if writable or not FAISS_MMAP:
+        index = faiss.read_index(index_path)
+    else:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+    chunks = ChunkFile(chunks_path)
+    if not writable:
+        # Open now rather than on the first search: once the file is open it
+        # stays readable even if index_store prunes the version directory
+        chunks.open()
+        return FAISS(embeddings, index, SQLiteDocstore(chunks), ChunkIdMap(chunks))
+
+    rows = chunks.query("SELECT pos, id, content, metadata FROM chunks ORDER BY pos")
+    docstore = InMemoryDocstore({
+        doc_id: Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+        for _, doc_id, content, metadata in rows
+    })
+    return FAISS(embeddings, index, docstore, {pos: doc_id for pos, doc_id, _, _ in rows})
+
+
+def keyword_search(vectorstore, query, k, positions=None):
+    """
+    BM25 keyword search over a store opened with load_store (stopwords are
+    ignored; a query of nothing but stopwords finds nothing). Returns
+    [(Document, bm25 score)] best first (higher is better), or None if the
+    store has no keyword index (pickled or writable stores, older chunk files).
+    positions, if given, restricts the search to those FAISS positions.
+    """
+    docstore = vectorstore.docstore
+    if not isinstance(docstore, SQLiteDocstore) or not docstore.chunks.has_keyword_index():
+        return None
+    terms = [term for term in re.findall(r"\w+", query.lower()) if term not in KEYWORD_STOPWORDS]
+    if not terms:
+        return []
+    match = " OR ".join(f'"{term}"' for term in terms)
+    sql = ("SELECT c.id, c.content, c.metadata, bm25(chunks_fts) FROM chunks_fts"
+           " JOIN chunks c ON c.pos = chunks_fts.rowid WHERE chunks_fts MATCH ?")
+    params = [match]
+    if positions is not None:
+        sql += " AND c.pos IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps([int(pos) for pos in positions]))
+    rows = docstore.chunks.query(sql + " ORDER BY bm25(chunks_fts) LIMIT ?", (*params, k))
+    # FTS5's bm25() is negated so that ascending order is best first
+    return [
+        (Document(id=doc_id, page_content=content, metadata=json.loads(metadata)), -rank)
+        for doc_id, content, metadata, rank in rows
+    ]
+
+
+def facet_values(metadata, field):
+    """Normalized filter values of one metadata field (tags hold a list)."""
+    value = metadata.get(field)
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return {str(v).strip().lower() for v in values if v not in (None, "")}
+
+
+def filter_positions(vectorstore, filters):
+    """
+    FAISS positions of the chunks matching filters ({field: value or [values]};
+    any value of a field may match, all fields must match). Fields the store
+    has no values for at all are ignored, so a domain filter doesn't empty an
+    index of chunks that carry no domain. Returns a sorted list, or None if no
+    filter applies to this store.
+    """
+    selected = None
+    for field, wanted in filters.items():
+        values = facet_values({field: wanted}, field)
+        matches = _facet_lookup(vectorstore, field, values)
+        if matches is None:
+            continue
+        selected = matches if selected is None else selected & matches
+    return sorted(selected) if selected is not None else None
+
+
+def _facet_lookup(vectorstore, field, values):
+    docstore = vectorstore.docstore
+    if isinstance(docstore, SQLiteDocstore) and docstore.chunks.has_facet_index():
+        if not docstore.chunks.query("SELECT 1 FROM chunk_facets WHERE field = ? LIMIT 1", (field,)):
+            return None
+        rows = docstore.chunks.query(
+            "SELECT pos FROM chunk_facets WHERE field = ? AND value IN (SELECT value FROM json_each(?))",
+            (field, json.dumps(sorted(values))),
+        )
+        return {pos for (pos,) in rows}
+
+    # Older indexes have no stored lists: build them once from the docstore
+    facets = getattr(vectorstore, "_chunk_facets", None)
+    if facets is None:
+        facets = {}
+        for pos, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = docstore.search(doc_id)
+            for name in FILTER_FIELDS:
+                for value in facet_values(getattr(doc, "metadata", {}), name):
+                    facets.setdefault(name, {}).setdefault(value, set()).add(int(pos))
+        vectorstore._chunk_facets = facets
+    if field not in facets:
+        return None
+    return set().union(*(facets[field].get(value, set()) for value in values))
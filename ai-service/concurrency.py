@@ -0,0 +1,40 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+THREADPOOL_WORKERS = int(os.getenv("AI_THREADPOOL_WORKERS", "16"))
+STAGE_LIMITS = {
+    "db": int(os.getenv("CHAT_DB_CONCURRENCY", "16")),
+    "io": int(os.getenv("FILE_IO_CONCURRENCY", "8")),
+    "retrieval": int(os.getenv("CHAT_RETRIEVAL_CONCURRENCY", "8")),
+    "llm": int(os.getenv("CHAT_LLM_CONCURRENCY", "32")),
+}
+
+# Shared pool for blocking work (pymongo, FAISS, embedding) called from async endpoints
+executor = ThreadPoolExecutor(max_workers=THREADPOOL_WORKERS, thread_name_prefix="ai-worker")
+
+_semaphores = {}
+
+
+def stage_limit(stage):
+    """Returns the semaphore bounding how many requests may be in a stage at once."""
+    if stage not in _semaphores:
+        _semaphores[stage] = asyncio.Semaphore(STAGE_LIMITS[stage])
+    return _semaphores[stage]
+
+
+async def run_blocking(stage, fn, *args, **kwargs):
+    """Runs a blocking call on the shared thread pool without stalling the event loop."""
+    async with stage_limit(stage):
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context (request trace) into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from chunk_store import save_store, load_store, INDEX_FILE
+from embeddings import EMBEDDING_MODEL
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+STORAGE_DIR = os.getenv("AI_STORAGE_DIR", BASE_DIR)  # indexes and uploaded user data
+CONTENT_DIR = os.path.join(STORAGE_DIR, "data", "content")
+USERS_DIR = os.path.join(STORAGE_DIR, "data", "users")
+GC_MIN_AGE_SECONDS = 3600  # never collect a file store younger than this (an ingest may be about to reference it)
+EMBEDDING_CACHE_MAX_IDLE_DAYS = int(os.getenv("EMBEDDING_CACHE_MAX_IDLE_DAYS", "90"))
+
+USER_MANIFEST_FILE = "files.json"
+USER_INDEX_DIR = "search_index"
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed storage shared by every user's uploads:
+#   data/content/files/<sha[:2]>/<sha>/    one immutable vector store per unique
+#                                          file (index.faiss + chunks.sqlite), keyed
+#                                          by the SHA-256 of the file's bytes
+#   data/content/embeddings.sqlite         chunk embeddings keyed by the SHA-256 of
+#                                          the chunk text, reused across files
+#   data/users/<id>/files.json             a user's private index: their file paths
+#                                          mapped to file hashes
+#   data/users/<id>/search_index           the chunks of exactly those files, copied
+#                                          into one versioned index (see index_store)
+# A file uploaded by several users is parsed, embedded, stored and cached once.
+# Users only ever search their own files. Queries read the merged search_index
+# rather than one store per file: fanning out to every file costs a vector and a
+# keyword search per upload, growing with the library. The price is disk (each
+# chunk is stored once per file store plus once per user who has the file) and
+# an ingest that copies the user's vectors again; nothing is re-embedded.
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_store_dir(file_sha):
+    return os.path.join(CONTENT_DIR, "files", file_sha[:2], file_sha)
+
+
+def has_file_store(file_sha):
+    return os.path.exists(os.path.join(file_store_dir(file_sha), INDEX_FILE))
+
+
+def file_store_size(file_sha):
+    """On-disk size of a file store's vectors (its cache weight), 0 if missing."""
+    try:
+        return os.path.getsize(os.path.join(file_store_dir(file_sha), INDEX_FILE))
+    except OSError:
+        return 0
+
+
+def load_file_store(file_sha, embeddings, writable=False):
+    """Opens a file's vector store; read-only (vectors memory-mapped) unless writable."""
+    return load_store(file_store_dir(file_sha), embeddings, writable=writable)
+
+
+def publish_file_store(vectorstore, file_sha):
+    """
+    Writes a file's vector store under its content hash. Stores are immutable:
+    if another ingest published the same file first, that copy is kept.
+    """
+    final_dir = file_store_dir(file_sha)
+    parent = os.path.dirname(final_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = os.path.join(parent, f".{file_sha}.{uuid.uuid4().hex}.tmp")
+    try:
+        save_store(vectorstore, tmp_dir)
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        if not has_file_store(file_sha):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def chunk_id(file_sha, seq):
+    """Docstore id of a file's seq-th chunk; the same for every user that has the file."""
+    return f"{file_sha[:16]}-{seq}"
+
+
+def neutral_source(file_sha, path):
+    # Stored chunks don't carry the uploader's path; retrievers label hits with the reader's own
+    return file_sha + os.path.splitext(path)[1].lower()
+
+
+def read_user_manifest(user_id):
+    """A user's {"files": {relative path: {"sha256": ...}}}, or None if they have none."""
+    try:
+        with open(os.path.join(USERS_DIR, user_id, USER_MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_user_manifest(user_id, manifest):
+    path = os.path.join(USERS_DIR, user_id, USER_MANIFEST_FILE)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def remove_user_manifest(user_id):
+    try:
+        os.remove(os.path.join(USERS_DIR, user_id, USER_MANIFEST_FILE))
+    except OSError:
+        pass
+
+
+class EmbeddingCache:
+    """
+    Chunk embeddings in SQLite keyed by (model, chunk text hash). Safe to use
+    from several ingest processes at once; each call opens its own connection.
+    """
+
+    def __init__(self, path=None, model=EMBEDDING_MODEL):
+        self.path = path or os.path.join(CONTENT_DIR, "embeddings.sqlite")
+        self.model = model
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, sha256 TEXT NOT NULL,"
+                " vector BLOB NOT NULL, used REAL NOT NULL, PRIMARY KEY (model, sha256))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, hashes):
+        """{hash: vector} for the hashes that are cached."""
+        if not hashes:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT sha256, vector FROM embeddings WHERE model = ? AND sha256 IN (SELECT value FROM json_each(?))",
+                (self.model, json.dumps(sorted(set(hashes)))),
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    "UPDATE embeddings SET used = ? WHERE model = ? AND sha256 IN (SELECT value FROM json_each(?))",
+                    (time.time(), self.model, json.dumps([sha for sha, _ in rows])),
+                )
+        return {sha: np.frombuffer(vector, dtype=np.float32).tolist() for sha, vector in rows}
+
+    def put_many(self, vectors):
+        """Stores {hash: vector}; existing entries are kept."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(self.model, sha, np.asarray(vector, dtype=np.float32).tobytes(), now) for sha, vector in vectors.items()],
+            )
+
+    def prune(self, max_idle_days=EMBEDDING_CACHE_MAX_IDLE_DAYS):
+        """Drops embeddings unused for max_idle_days; returns how many."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM embeddings WHERE used < ?", (time.time() - max_idle_days * 86400,)).rowcount
+
+    def seed_from_store(self, vectorstore):
+        """
+        Caches the vectors of an existing (writable) store by chunk text, so
+        re-ingesting its files after moving to the content store skips embedding.
+        Returns how many vectors were cached.
+        """
+        vectors = {sha256_text(doc.page_content): vector for _, doc, vector in stored_vectors(vectorstore)}
+        self.put_many(vectors)
+        return len(vectors)
+
+
+def stored_vectors(vectorstore):
+    """Yields (docstore id, Document, vector) for every chunk of a writable store."""
+    import faiss
+
+    index = vectorstore.index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()  # IVF indexes need one to reconstruct vectors by position
+    for pos, doc_id in sorted(vectorstore.index_to_docstore_id.items()):
+        yield doc_id, vectorstore.docstore.search(doc_id), index.reconstruct(int(pos))
+
+
+class CachedDocumentEmbeddings(Embeddings):
+    """Wraps an embedding model; embed_documents only embeds chunks missing from the EmbeddingCache."""
+
+    def __init__(self, base, cache):
+        self.base = base
+        self.cache = cache
+        self.embedded = 0
+        self.reused = 0
+
+    def embed_documents(self, texts):
+        hashes = [sha256_text(text) for text in texts]
+        found = self.cache.get_many(hashes)
+        missing = [i for i, sha in enumerate(hashes) if sha not in found]
+        if missing:
+            fresh = self.base.embed_documents([texts[i] for i in missing])
+            self.cache.put_many({hashes[i]: vector for i, vector in zip(missing, fresh)})
+            found.update({hashes[i]: vector for i, vector in zip(missing, fresh)})
+        self.embedded += len(missing)
+        self.reused += len(texts) - len(missing)
+        return [found[sha] for sha in hashes]
+
+    def embed_query(self, text):
+        return self.base.embed_query(text)
+
+
+def collect_garbage(min_age=GC_MIN_AGE_SECONDS):
+    """
+    Deletes file stores no user's files.json references any more (older than
+    min_age, so stores an ingest is still linking survive) and prunes idle
+    cached embeddings. Returns (file stores removed, embeddings removed).
+    """
+    referenced = set()
+    if os.path.isdir(USERS_DIR):
+        for user_id in os.listdir(USERS_DIR):
+            manifest = read_user_manifest(user_id) or {"files": {}}
+            referenced.update(entry["sha256"] for entry in manifest["files"].values())
+
+    removed = 0
+    files_dir = os.path.join(CONTENT_DIR, "files")
+    now = time.time()
+    for prefix in os.listdir(files_dir) if os.path.isdir(files_dir) else []:
+        for name in os.listdir(os.path.join(files_dir, prefix)):
+            path = os.path.join(files_dir, prefix, name)
+            if name in referenced or now - os.path.getmtime(path) < min_age:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    pruned = EmbeddingCache().prune() if os.path.isdir(CONTENT_DIR) else 0
+    logger.info("🧹 Content store: removed %d unreferenced file store(s), %d idle embedding(s)", removed, pruned)
+    return removed, pruned
+
+
+if __name__ == "__main__":
+    from telemetry import configure_logging
+
+    configure_logging()
+    if len(sys.argv) < 2 or sys.argv[1] != "gc":
+        print("Usage: python content_store.py gc")
+        sys.exit(1)
+    collect_garbage()
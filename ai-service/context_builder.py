@@ -0,0 +1,141 @@
+import os
+import math
+from dotenv import load_dotenv
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Dense hits further than this (squared L2 on unit MiniLM vectors, 0-4) are dropped; 0 disables
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE", "1.5"))
+# Keyword-only hits scoring below this fraction of the best BM25 score are dropped; 0 disables
+CONTEXT_MIN_BM25_RATIO = float(os.getenv("CONTEXT_MIN_BM25_RATIO", "0.5"))
+CHARS_PER_TOKEN = 4  # rough estimate for English text; Gemini's tokenizer isn't available locally
+MIN_OVERLAP_CHARS = 20  # shorter shared text between chunks is treated as coincidence
+SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Context:
+    """Prompt context built from retrieved chunks, plus what it cost and saved."""
+
+    def __init__(self, text, docs, stats):
+        self.text = text
+        self.docs = docs  # the chunks that made it into the context
+        self.stats = stats
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['chunks_in']} → {s['chunks_out']} chunks, "
+                f"{s['tokens_in']} → {s['tokens_out']} tokens ({s['tokens_saved']} saved)")
+
+
+def _source_key(doc):
+    meta = doc.metadata
+    return (meta.get("index"), meta.get("source"), meta.get("page"), meta.get("resource_id"))
+
+
+def _overlap(a, b):
+    """Length of the longest suffix of a that is a prefix of b (0 if below MIN_OVERLAP_CHARS)."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = a.find(probe, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+
+def merge_adjacent(docs, max_chars=None):
+    """
+    Merges chunks of the same source whose text overlaps (the splitter's
+    chunk_overlap) or contains one another, without growing a piece past
+    max_chars. Returns [(text, rank, docs)] where rank is the best retrieval
+    rank among the merged chunks.
+    """
+    pieces = [[doc.page_content, rank, [doc], _source_key(doc)] for rank, doc in enumerate(docs)]
+    merged = True
+    while merged:
+        merged = False
+        for i, a in enumerate(pieces):
+            for j, b in enumerate(pieces):
+                if i == j or a[3] != b[3]:
+                    continue
+                if b[0] in a[0]:
+                    text = a[0]
+                else:
+                    overlap = _overlap(a[0], b[0])
+                    if not overlap:
+                        continue
+                    text = a[0] + b[0][overlap:]
+                    if max_chars and len(text) > max_chars:
+                        continue
+                a[0], a[1], a[2] = text, min(a[1], b[1]), a[2] + b[2]
+                pieces.pop(j)
+                merged = True
+                break
+            if merged:
+                break
+    return sorted(((text, rank, group) for text, rank, group, _ in pieces), key=lambda piece: piece[1])
+
+
+def is_relevant(doc, max_distance=CONTEXT_MAX_DISTANCE, min_bm25=None):
+    """
+    Dense hits must be within max_distance; keyword-only hits (no distance)
+    must score at least min_bm25. Hits with neither score are kept.
+    """
+    distance = doc.metadata.get("score")
+    if distance is not None:
+        return not max_distance or distance <= max_distance
+    bm25 = doc.metadata.get("bm25")
+    return min_bm25 is None or bm25 is None or bm25 >= min_bm25
+
+
+def build_context(docs, token_budget=CONTEXT_TOKEN_BUDGET, max_distance=CONTEXT_MAX_DISTANCE,
+                  min_bm25_ratio=CONTEXT_MIN_BM25_RATIO):
+    """
+    Builds the prompt context from retrieved chunks (best first):
+    drops dense hits past max_distance and keyword-only hits below
+    min_bm25_ratio of the best BM25 score (always keeping the best chunk),
+    merges overlapping neighbours from the same source, then packs pieces
+    in relevance order into token_budget. A best piece larger than the
+    whole budget is truncated rather than dropped.
+    """
+    tokens_in = estimate_tokens(SEPARATOR.join(doc.page_content for doc in docs))
+    bm25_scores = [doc.metadata["bm25"] for doc in docs if doc.metadata.get("bm25") is not None]
+    min_bm25 = min_bm25_ratio * max(bm25_scores) if min_bm25_ratio and bm25_scores else None
+    relevant = [doc for doc in docs if is_relevant(doc, max_distance, min_bm25)] or docs[:1]
+
+    parts = []
+    used_docs = []
+    used = 0
+    for text, _, group in merge_adjacent(relevant, max_chars=token_budget * CHARS_PER_TOKEN):
+        cost = estimate_tokens(text) + (estimate_tokens(SEPARATOR) if parts else 0)
+        if used + cost > token_budget:
+            if parts:
+                continue  # a smaller piece further down may still fit
+            text = text[: token_budget * CHARS_PER_TOKEN]
+            cost = estimate_tokens(text)
+        parts.append(text)
+        used_docs.extend(group)
+        used += cost
+
+    text = SEPARATOR.join(parts)
+    tokens_out = estimate_tokens(text)
+    stats = {
+        "chunks_in": len(docs),
+        "chunks_dropped": len(docs) - len(relevant),
+        "chunks_out": len(used_docs),
+        "pieces": len(parts),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": max(0, tokens_in - tokens_out),
+    }
+    return Context(text, used_docs, stats)
@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+from multiprocessing.connection import Client, Listener
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+EMBEDDING_SERVER = os.getenv("EMBEDDING_SERVER")  # Unix socket of a shared embedding process (see serve.py)
+EMBEDDING_SERVER_AUTHKEY = os.getenv("EMBEDDING_SERVER_AUTHKEY", "")  # required; serve.py generates one per run
+CONNECT_TIMEOUT_SECONDS = 300  # the server may still be loading the model
+
+logger = logging.getLogger(__name__)
+
+# One process loads the embedding model and answers embed_query /
+# embed_documents calls from every worker over a Unix socket, so N workers
+# don't hold N copies of the model. A separate process rather than loading
+# before fork: torch and ONNX Runtime start thread pools that don't survive fork.
+
+
+def require_authkey(authkey):
+    # Listener/Client skip the auth challenge for an empty key, leaving a
+    # pickle-speaking socket open to any local process
+    if not authkey:
+        raise ValueError("EMBEDDING_SERVER_AUTHKEY must be set (e.g. python -c \"import os; print(os.urandom(16).hex())\")")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def serve(address, authkey):
+    """Loads the model and serves embedding calls on address until killed (one thread per connection)."""
+    from embeddings import load_embeddings
+
+    authkey = require_authkey(authkey)
+    model = load_embeddings()
+    model.embed_query("warm up")
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    logger.info("🧠 Embedding server ready on %s", address)
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    method, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if method == "query":
+                        conn.send(("ok", model.embed_query(payload)))
+                    else:
+                        conn.send(("ok", model.embed_documents(payload)))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            logger.warning("⚠️ Rejected embedding client: %s", e)
+            continue
+        threading.Thread(target=handle, args=(conn,), name="embedding-client", daemon=True).start()
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings computed by the shared embedding server; connections are pooled and thread-safe."""
+
+    def __init__(self, address=EMBEDDING_SERVER, authkey=EMBEDDING_SERVER_AUTHKEY):
+        self.address = address
+        self.authkey = require_authkey(authkey)
+        self._idle = queue.SimpleQueue()
+
+    def _connect(self):
+        deadline = time.monotonic() + CONNECT_TIMEOUT_SECONDS
+        while True:
+            try:
+                return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Embedding server at {self.address} is not answering")
+                time.sleep(0.2)
+
+    def _call(self, method, payload):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            conn.send((method, payload))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # Server restarted: retry once on a fresh connection
+            conn.close()
+            conn = self._connect()
+            conn.send((method, payload))
+            status, result = conn.recv()
+        self._idle.put(conn)
+        if status != "ok":
+            raise RuntimeError(f"Embedding server error: {result}")
+        return result
+
+    def embed_query(self, text):
+        return self._call("query", text)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._call("documents", list(texts))
+
+
+if __name__ == "__main__":
+    from telemetry import configure_logging
+
+    configure_logging()
+    if len(sys.argv) < 2 or not EMBEDDING_SERVER_AUTHKEY:
+        print("Usage: EMBEDDING_SERVER_AUTHKEY=<secret> python embedding_server.py <socket path>")
+        sys.exit(1)
+    serve(sys.argv[1], EMBEDDING_SERVER_AUTHKEY)
@@ -0,0 +1,239 @@
+import os
+import sys
+import logging
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch | onnx | onnx-int8
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = torch / ONNX Runtime default
+ONNX_MODEL_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(BASE_DIR, "models", f"{EMBEDDING_MODEL}-onnx"))
+EMBEDDING_MAX_TOKENS = 256  # MiniLM's max_seq_length; longer chunks are truncated, as sentence-transformers does
+PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.98"))
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+TOKENIZER_FILE = "tokenizer.json"
+
+logger = logging.getLogger(__name__)
+
+_embeddings = None
+_lock = threading.Lock()
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime: tokenizers + onnxruntime only, no torch.
+    Reproduces the sentence-transformers pipeline (mean pooling over the
+    attention mask, then L2 normalization) so vectors match the torch backend.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, backend="onnx", batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, ONNX_FILES[backend])
+        tokenizer_path = os.path.join(model_dir, TOKENIZER_FILE)
+        if not os.path.exists(model_path) or not os.path.exists(tokenizer_path):
+            raise RuntimeError(f"{model_path} not found; export it first with: python embeddings.py export")
+
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=EMBEDDING_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        # Batch texts of similar length together so little time goes into padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
+
+
+def load_embeddings(backend=EMBEDDING_BACKEND):
+    """Loads a new embedding model instance for one backend (see get_embeddings for the shared one)."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND must be one of {', '.join(EMBEDDING_BACKENDS)}, got {backend!r}")
+    logger.info("🧠 Loading embedding model %s on %s (batch size %d)...", EMBEDDING_MODEL, backend, EMBEDDING_BATCH_SIZE)
+    if backend != "torch":
+        return OnnxEmbeddings(backend=backend)
+
+    # Imported here so ONNX deployments never load torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if EMBEDDING_THREADS > 0:
+        import torch
+        torch.set_num_threads(EMBEDDING_THREADS)
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE},
+    )
+
+
+def get_embeddings():
+    """
+    Returns the process-wide embedding model, loading the weights on first use.
+    Shared by RAGService and both ingestion paths so MiniLM is only loaded once.
+    With EMBEDDING_SERVER set (multi-worker mode, see serve.py) this is a
+    client of the one process that holds the model.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                if os.getenv("EMBEDDING_SERVER"):
+                    from embedding_server import RemoteEmbeddings
+                    logger.info("🧠 Using shared embedding server at %s", os.getenv("EMBEDDING_SERVER"))
+                    _embeddings = RemoteEmbeddings()
+                else:
+                    _embeddings = load_embeddings()
+    return _embeddings
+
+
+def export_onnx(output_dir=ONNX_MODEL_DIR, source=f"sentence-transformers/{EMBEDDING_MODEL}", quantize=True):
+    """
+    Exports the transformer to output_dir/model.onnx (+ tokenizer.json) and,
+    with quantize, a dynamically int8-quantized model_int8.onnx.
+    Needs torch and transformers; serving the exported files needs neither.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(source)
+    model = AutoModel.from_pretrained(source).eval()
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+
+    class TokenEmbeddings(torch.nn.Module):
+        # Fixed positional signature; transformers' forward() takes many optional keyword arguments
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.encoder(input_ids=input_ids, attention_mask=attention_mask,
+                                token_type_ids=token_type_ids).last_hidden_state
+
+    sample = tokenizer(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    model_path = os.path.join(output_dir, ONNX_FILES["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(model),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            model_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]},
+            opset_version=17,
+            dynamo=False,
+        )
+    logger.info("✅ Exported %s to %s", source, model_path)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, ONNX_FILES["onnx-int8"])
+        quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+        logger.info("✅ Quantized to int8: %s", int8_path)
+
+
+def parity_report(index_dir, backend, sample=200, min_cosine=PARITY_MIN_COSINE, seed=0):
+    """
+    Re-embeds a sample of an index's chunks with backend and compares them
+    with the stored vectors: cosine similarity, and whether each chunk still
+    finds itself as the top search hit. Existing indexes stay valid for the
+    backend if every sampled cosine is >= min_cosine.
+    """
+    import faiss
+    from index_store import load_index
+
+    embeddings = load_embeddings(backend)
+    store = load_index(index_dir, embeddings, writable=True)
+    index = store.index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()  # IVF indexes need one to reconstruct vectors by position
+
+    positions = sorted(store.index_to_docstore_id)
+    rng = np.random.default_rng(seed)
+    picked = sorted(rng.choice(positions, size=min(sample, len(positions)), replace=False).tolist())
+    texts = [store.docstore.search(store.index_to_docstore_id[pos]).page_content for pos in picked]
+    stored = np.array([index.reconstruct(int(pos)) for pos in picked], dtype=np.float32)
+
+    fresh = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    cosines = (stored * fresh).sum(axis=1) / (np.linalg.norm(stored, axis=1) * np.linalg.norm(fresh, axis=1))
+    _, hits = index.search(fresh, 1)
+    return {
+        "backend": backend,
+        "chunks": len(picked),
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "below_tolerance": int((cosines < min_cosine).sum()),
+        "self_hit_rate": float(np.mean(hits[:, 0] == np.array(picked))),
+        "ok": bool(cosines.min() >= min_cosine),
+    }
+
+
+if __name__ == "__main__":
+    from telemetry import configure_logging
+
+    configure_logging()
+    usage = ("Usage: python embeddings.py export [output_dir] [--source <model id or dir>] [--no-quantize]\n"
+             "       python embeddings.py parity <faiss_index_dir> [onnx|onnx-int8|torch] [sample]")
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args or args[0] not in ("export", "parity"):
+        print(usage)
+        sys.exit(1)
+
+    if args[0] == "export":
+        source = sys.argv[sys.argv.index("--source") + 1] if "--source" in sys.argv else f"sentence-transformers/{EMBEDDING_MODEL}"
+        args = [a for a in args if a != source]
+        export_onnx(args[1] if len(args) > 1 else ONNX_MODEL_DIR, source=source, quantize="--no-quantize" not in sys.argv)
+        sys.exit(0)
+
+    if len(args) < 2:
+        print(usage)
+        sys.exit(1)
+    backend = args[2] if len(args) > 2 else "onnx-int8"
+    report = parity_report(args[1], backend, sample=int(args[3]) if len(args) > 3 else 200)
+    print(f"📐 {report['backend']} vs stored vectors of {args[1]} ({report['chunks']} chunks)")
+    print(f"   cosine mean {report['mean_cosine']:.4f}, min {report['min_cosine']:.4f} "
+          f"({report['below_tolerance']} below {PARITY_MIN_COSINE}); self-hit rate {report['self_hit_rate']:.1%}")
+    print("✅ Existing index stays valid" if report["ok"] else "❌ Re-embed the index before switching backends")
+    sys.exit(0 if report["ok"] else 1)
@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+import math
+import logging
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")  # auto | flat | sq8 | pq | ivf_flat | ivf_sq8 | ivf_pq
+SQ8_MIN_CHUNKS = int(os.getenv("FAISS_SQ8_MIN_CHUNKS", "1000"))  # auto: flat below this
+IVF_MIN_CHUNKS = int(os.getenv("FAISS_IVF_MIN_CHUNKS", "50000"))  # auto: IVF at/above this
+PQ_SUBQUANTIZERS = 48  # 384-dim MiniLM vectors -> 8 dims per sub-quantizer
+MIN_POINTS_PER_CENTROID = 39  # FAISS warns (and k-means trains badly) below this many points per centroid
+PQ_MIN_CHUNKS = MIN_POINTS_PER_CENTROID * 256  # 8-bit PQ trains 256 centroids per sub-quantizer
+
+INDEX_TYPES = ("flat", "sq8", "pq", "ivf_flat", "ivf_sq8", "ivf_pq")
+
+logger = logging.getLogger(__name__)
+
+
+def choose_index_type(n_chunks, requested=None):
+    """Index type for a store with n_chunks vectors (auto picks by size)."""
+    requested = requested or FAISS_INDEX_TYPE
+    if requested == "auto":
+        if n_chunks < SQ8_MIN_CHUNKS:
+            return "flat"
+        if n_chunks < IVF_MIN_CHUNKS:
+            return "sq8"
+        return "ivf_sq8"
+    if requested not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {requested}")
+    if "pq" in requested and n_chunks < PQ_MIN_CHUNKS:
+        return "sq8"  # Too few vectors to train PQ codebooks
+    if requested.startswith("ivf") and n_chunks < IVF_MIN_CHUNKS // 10:
+        return "sq8" if requested != "ivf_flat" else "flat"
+    return requested
+
+
+def _factory_string(index_type, n_chunks):
+    nlist = max(16, min(int(4 * math.sqrt(n_chunks)), n_chunks // MIN_POINTS_PER_CENTROID))
+    return {
+        "flat": "Flat",
+        "sq8": "SQ8",
+        "pq": f"PQ{PQ_SUBQUANTIZERS}",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "ivf_sq8": f"IVF{nlist},SQ8",
+        "ivf_pq": f"IVF{nlist},PQ{PQ_SUBQUANTIZERS}",
+    }[index_type]
+
+
+def build_index(vectors, index_type):
+    """Creates and trains an (empty) FAISS index of the given type for these vectors."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], _factory_string(index_type, len(vectors)), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = max(1, ivf.nlist // 8)
+    return index
+
+
+def index_type_of(index):
+    """Name of an existing index's type (one of INDEX_TYPES)."""
+    name = type(faiss.downcast_index(index)).__name__
+    prefix = "ivf_" if name.startswith("IndexIVF") else ""
+    if "ScalarQuantizer" in name:
+        return prefix + "sq8"
+    if "PQ" in name:
+        return prefix + "pq"
+    return prefix + "flat"
+
+
+def from_documents(documents, embeddings, ids=None, index_type=None):
+    """
+    Drop-in for FAISS.from_documents that builds the configured index type
+    (by default chosen from the number of chunks) instead of always IndexFlatL2.
+    """
+    texts = [doc.page_content for doc in documents]
+    vectors = embeddings.embed_documents(texts)
+    return from_embeddings(documents, vectors, embeddings, ids=ids, index_type=index_type)
+
+
+def from_embeddings(documents, vectors, embeddings, ids=None, index_type=None):
+    """Builds a vector store from documents whose embeddings are already computed."""
+    kind = choose_index_type(len(vectors), index_type)
+    index = build_index(vectors, kind)
+    vectorstore = FAISS(embeddings, index, InMemoryDocstore(), {})
+    vectorstore.add_embeddings(
+        zip([doc.page_content for doc in documents], vectors),
+        metadatas=[doc.metadata for doc in documents],
+        ids=ids,
+    )
+    return vectorstore
+
+
+def maybe_upgrade_index(vectorstore, index_type=None):
+    """
+    Rebuilds a growing flat store as the type auto-selection now picks
+    (e.g. after incremental adds pushed it past SQ8_MIN_CHUNKS). Flat indexes
+    store exact vectors, so nothing needs re-embedding. Returns True if rebuilt.
+    """
+    index = vectorstore.index
+    if index_type_of(index) != "flat" or index.ntotal == 0:
+        return False
+    kind = choose_index_type(index.ntotal, index_type)
+    if kind == "flat":
+        return False
+    vectors = index.reconstruct_n(0, index.ntotal)
+    new_index = build_index(vectors, kind)
+    new_index.add(vectors)
+    vectorstore.index = new_index
+    logger.info("🗜️  Rebuilt index as %s (%s chunks)", kind, index.ntotal)
+    return True
+
+
+def recall_report(vectors, k=5, n_queries=200, index_types=INDEX_TYPES):
+    """
+    Compares each index type against the exact flat baseline on the same vectors.
+    Queries are sampled from the stored vectors. Returns one row per type with
+    recall@k, serialized size and mean search latency.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+
+    rows = []
+    for kind in index_types:
+        # Build every type as asked, even below the auto-selection thresholds,
+        # except PQ: its recall on too few training points says nothing about PQ
+        if "pq" in kind and len(vectors) < PQ_MIN_CHUNKS:
+            rows.append({"type": kind, "skipped": f"needs at least {PQ_MIN_CHUNKS} vectors to train"})
+            continue
+        try:
+            index = build_index(vectors, kind)
+            index.add(vectors)
+        except RuntimeError as e:
+            rows.append({"type": kind, "skipped": str(e).splitlines()[0]})
+            continue
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        rows.append({
+            "type": kind,
+            "recall_at_k": round(float(recall), 4),
+            "size_bytes": len(faiss.serialize_index(index)),
+            "search_ms": round(latency_ms, 4),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "report":
+        print("Usage: python index_factory.py report <faiss_index_dir> [k]")
+        sys.exit(1)
+
+    from embeddings import get_embeddings
+    from index_store import load_index
+
+    index_dir = sys.argv[2]
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    store = load_index(index_dir, get_embeddings())
+    if index_type_of(store.index) == "flat":
+        vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    else:
+        # Quantized indexes can't give exact vectors back; re-embed the chunks
+        texts = [store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values()]
+        vectors = get_embeddings().embed_documents(texts)
+
+    print(f"📊 Recall@{k} vs flat baseline for {index_dir} ({len(vectors)} chunks)")
+    print(f"{'type':<10} {'recall':>8} {'size (KB)':>10} {'search ms':>10}")
+    for row in recall_report(vectors, k=k):
+        if "skipped" in row:
+            print(f"{row['type']:<10} skipped: {row['skipped']}")
+        else:
+            print(f"{row['type']:<10} {row['recall_at_k']:>8.3f} {row['size_bytes'] / 1024:>10.1f} {row['search_ms']:>10.3f}")
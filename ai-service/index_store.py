@@ -0,0 +1,128 @@
+import os
+import json
+import uuid
+import time
+import shutil
+from datetime import datetime
+from dotenv import load_dotenv
+from chunk_store import save_store, load_store
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+INDEX_VERSIONS_KEEP = int(os.getenv("INDEX_VERSIONS_KEEP", "3"))
+# How long a replaced version is kept for readers that read the old pointer but haven't opened its files yet
+INDEX_VERSION_GRACE_SECONDS = float(os.getenv("INDEX_VERSION_GRACE_SECONDS", "300"))
+
+# Layout for a logical index such as faiss_index/:
+#   faiss_index.versions/<version>/   immutable, fully written index directories
+#   faiss_index.current               pointer file holding the live <version>
+# Without a pointer file the legacy faiss_index/ directory itself is live.
+
+
+def _versions_dir(base_dir):
+    return base_dir + ".versions"
+
+
+def _pointer_path(base_dir):
+    return base_dir + ".current"
+
+
+def current_version(base_dir):
+    """Name of the live version of an index, or None if it doesn't exist."""
+    try:
+        with open(_pointer_path(base_dir), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if version:
+            return version
+    except OSError:
+        pass
+    try:
+        # Legacy single-directory layout
+        return f"legacy-{os.stat(os.path.join(base_dir, 'index.faiss')).st_mtime_ns}"
+    except OSError:
+        return None
+
+
+def current_index_dir(base_dir):
+    """Directory readers should load the live version of an index from."""
+    version = current_version(base_dir)
+    if version and not version.startswith("legacy-"):
+        return os.path.join(_versions_dir(base_dir), version)
+    return base_dir
+
+
+def read_index_file(base_dir, name):
+    """Reads a JSON file stored with the live version of an index (None if absent)."""
+    try:
+        with open(os.path.join(current_index_dir(base_dir), name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_index(base_dir, embeddings, writable=False):
+    """Opens the live version of an index (see chunk_store.load_store)."""
+    return load_store(current_index_dir(base_dir), embeddings, writable=writable)
+
+
+def publish_index(vectorstore, base_dir, keep=INDEX_VERSIONS_KEEP, extra_files=None):
+    """
+    Writes vectorstore as a new version next to the live one, then switches
+    readers over by atomically replacing the pointer file. Readers never see
+    a half-written index. extra_files ({name: JSON-serializable}) are written
+    into the version directory alongside the index. Returns the new version name.
+    """
+    # Names sort chronologically; the suffix keeps concurrent publishers apart
+    version = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+    versions_dir = _versions_dir(base_dir)
+    os.makedirs(versions_dir, exist_ok=True)
+    version_dir = os.path.join(versions_dir, version)
+    save_store(vectorstore, version_dir)
+    for name, content in (extra_files or {}).items():
+        with open(os.path.join(version_dir, name), "w", encoding="utf-8") as f:
+            json.dump(content, f)
+
+    pointer = _pointer_path(base_dir)
+    tmp_pointer = f"{pointer}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_pointer, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+
+    prune_versions(base_dir, keep)
+    return version
+
+
+def prune_versions(base_dir, keep=INDEX_VERSIONS_KEEP, grace_seconds=INDEX_VERSION_GRACE_SECONDS):
+    """
+    Deletes old versions, keeping the live one, the `keep` most recent, and
+    any replaced less than grace_seconds ago (i.e. whose successor is that new).
+    """
+    versions_dir = _versions_dir(base_dir)
+    if not os.path.isdir(versions_dir):
+        return
+    live = current_version(base_dir)
+    versions = sorted(os.listdir(versions_dir), reverse=True)
+    cutoff = time.time() - grace_seconds
+    keep = max(keep, 1)
+    for successor, old in zip(versions[keep - 1:], versions[keep:]):
+        try:
+            replaced_at = os.path.getmtime(os.path.join(versions_dir, successor))
+        except OSError:
+            continue
+        if old != live and replaced_at <= cutoff:
+            shutil.rmtree(os.path.join(versions_dir, old), ignore_errors=True)
+
+
+def remove_index(base_dir):
+    """Deletes every version of an index, including the legacy directory."""
+    try:
+        os.remove(_pointer_path(base_dir))
+    except OSError:
+        pass
+    shutil.rmtree(_versions_dir(base_dir), ignore_errors=True)
+    shutil.rmtree(base_dir, ignore_errors=True)
@@ -1,5 +1,10 @@
 import os
 import sys
+import fcntl
+import logging
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
 
 # Ensure langchain-text-splitters is installed
 try:
@@ -12,11 +17,13 @@ except ImportError:
         sys.exit(1)
 
 from dotenv import load_dotenv
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from pymongo import MongoClient
+from embeddings import get_embeddings
+from telemetry import configure_logging
+import index_factory
+from ingest_pipeline import stream_chunks, index_chunks
+from index_store import publish_index, read_index_file, load_index
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -24,33 +31,41 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Load environment variables
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
-DOCS_DIR = os.path.join(BASE_DIR, "data/docs")
-GLOBAL_INDEX_DIR = os.path.join(BASE_DIR, "faiss_index")  # Markdown docs only
-RESOURCES_INDEX_DIR = os.path.join(BASE_DIR, "faiss_index_resources")  # MongoDB resources only
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+STORAGE_DIR = os.getenv("AI_STORAGE_DIR", BASE_DIR)  # indexes and uploaded user data
+DOCS_DIR = os.path.join(STORAGE_DIR, "data/docs")
+GLOBAL_INDEX_DIR = os.path.join(STORAGE_DIR, "faiss_index")  # Markdown docs only
+RESOURCES_INDEX_DIR = os.path.join(STORAGE_DIR, "faiss_index_resources")  # MongoDB resources only
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/club-members")
+RESOURCES_SYNC_STATE = "sync_state.json"  # watermark + chunk ids per resource, stored with each index version
+INGEST_LOCK_FILE = os.path.join(STORAGE_DIR, "faiss_index.lock")
+logger = logging.getLogger(__name__)
 
-def get_mongodb_resources():
-    """Fetch all resources from MongoDB and convert to LangChain Documents."""
-    try:
-        client = MongoClient(MONGO_URI)
-        db = client.get_database()
-        resources_collection = db.resources
-        
-        resources = list(resources_collection.find({}))
-        documents = []
-        
-        for resource in resources:
-            # Create a formatted document from each resource
-            title = resource.get("title", "Untitled")
-            description = resource.get("description", "")
-            resource_type = resource.get("type", "")
-            domain = resource.get("domain", "")
-            difficulty = resource.get("difficulty", "")
-            url = resource.get("url", "")
-            tags = ", ".join(resource.get("tags", []))
-            
-            content = f"""
+
+@contextmanager
+def shared_index_lock():
+    """Serializes rebuilds/syncs of the shared indexes across processes (serve.py workers, this CLI)."""
+    os.makedirs(os.path.dirname(INGEST_LOCK_FILE), exist_ok=True)
+    with open(INGEST_LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def resource_to_document(resource):
+    """Convert one MongoDB resource into a LangChain Document."""
+    # Create a formatted document from each resource
+    title = resource.get("title", "Untitled")
+    description = resource.get("description", "")
+    resource_type = resource.get("type", "")
+    domain = resource.get("domain", "")
+    difficulty = resource.get("difficulty", "")
+    url = resource.get("url", "")
+    tag_list = [str(tag) for tag in resource.get("tags", [])]
+    tags = ", ".join(tag_list)
+    updated_at = resource.get("updatedAt")
+
+    content = f"""
 Title: {title}
 Type: {resource_type}
 Domain: {domain}
@@ -61,93 +76,229 @@ Tags: {tags}
 Description:
 {description}
 """
-            
-            # Create LangChain Document
-            doc = Document(
-                page_content=content,
-                metadata={
-                    "source": "mongodb_resource",
-                    "resource_id": str(resource.get("_id")),
-                    "title": title,
-                    "domain": domain,
-                    "type": resource_type,
-                    "url": url
-                }
-            )
-            documents.append(doc)
+
+    # Create LangChain Document
+    return Document(
+        page_content=content,
+        metadata={
+            "source": "mongodb_resource",
+            "resource_id": str(resource.get("_id")),
+            "title": title,
+            "domain": domain,
+            "type": resource_type,
+            "difficulty": difficulty,
+            "tags": tag_list,
+            "url": url,
+            "updated_at": updated_at.isoformat() if updated_at else None,
+        }
+    )
+
+def get_mongodb_resources(query=None):
+    """Fetch resources from MongoDB (all, or those matching query) and convert to LangChain Documents."""
+    try:
+        client = MongoClient(MONGO_URI)
+        db = client.get_database()
+        resources_collection = db.resources
+        
+        resources = list(resources_collection.find(query or {}))
+        documents = [resource_to_document(resource) for resource in resources]
         
         client.close()
         return documents
     except Exception as e:
-        print(f"❌ Error fetching MongoDB resources: {e}")
+        logger.error("❌ Error fetching MongoDB resources: %s", e)
         return []
 
+def split_resources(documents):
+    """
+    Split resource documents into chunks with stable ids ("<resource_id>:<n>").
+    Returns (chunks, ids, sync state) where the state maps each resource to its chunk ids
+    and records the newest updatedAt seen as the incremental sync watermark.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+    chunks, ids = [], []
+    state = {"watermark": None, "chunks": {}, "updated": {}}
+    for doc in documents:
+        resource_id = doc.metadata["resource_id"]
+        resource_chunks = text_splitter.split_documents([doc])
+        resource_ids = [f"{resource_id}:{i}" for i in range(len(resource_chunks))]
+        chunks.extend(resource_chunks)
+        ids.extend(resource_ids)
+        state["chunks"][resource_id] = resource_ids
+        updated_at = doc.metadata.get("updated_at")
+        state["updated"][resource_id] = updated_at
+        if updated_at and (state["watermark"] is None or updated_at > state["watermark"]):
+            state["watermark"] = updated_at
+    return chunks, ids, state
+
+def sync_resources():
+    """
+    Incrementally update the RESOURCES index from MongoDB.
+    Only resources changed since the last watermark (updatedAt) are re-embedded,
+    and vectors of deleted resources are removed. Falls back to a full rebuild
+    if there is no index or sync state yet. Returns True if a new version was published.
+    """
+    state = read_index_file(RESOURCES_INDEX_DIR, RESOURCES_SYNC_STATE)
+    embeddings = get_embeddings()
+    vectorstore = None
+    if state and state.get("watermark") and "updated" in state:
+        try:
+            vectorstore = load_index(RESOURCES_INDEX_DIR, embeddings, writable=True)
+        except Exception as e:
+            logger.warning("⚠️ Could not load resources index for incremental sync: %s", e)
+
+    if vectorstore is None:
+        logger.info("🔄 No resources sync state found. Running a full resources rebuild...")
+        return build_resources_index(get_mongodb_resources())
+
+    try:
+        client = MongoClient(MONGO_URI)
+        resources_collection = client.get_database().resources
+        # $gte: re-processing resources at exactly the watermark is harmless
+        changed = [resource_to_document(r) for r in resources_collection.find(
+            {"updatedAt": {"$gte": datetime.fromisoformat(state["watermark"])}})]
+        # Skip resources we already indexed at this exact updatedAt
+        changed = [doc for doc in changed
+                   if state["updated"].get(doc.metadata["resource_id"]) != doc.metadata["updated_at"]]
+        live_ids = {str(r["_id"]) for r in resources_collection.find({}, {"_id": 1})}
+        client.close()
+    except Exception as e:
+        logger.error("❌ Error fetching MongoDB resources: %s", e)
+        return False
+
+    deleted = [rid for rid in state["chunks"] if rid not in live_ids]
+    logger.info("🔄 Resources sync: %s changed, %s deleted.", len(changed), len(deleted))
+    if not changed and not deleted:
+        return False
+
+    # Remove old vectors of changed and deleted resources
+    stale_ids = [vid for doc in changed for vid in state["chunks"].get(doc.metadata["resource_id"], [])]
+    stale_ids += [vid for rid in deleted for vid in state["chunks"][rid]]
+    known_ids = set(vectorstore.index_to_docstore_id.values())
+    stale_ids = [vid for vid in stale_ids if vid in known_ids]
+    if stale_ids:
+        vectorstore.delete(stale_ids)
+    for rid in deleted:
+        state["chunks"].pop(rid, None)
+        state["updated"].pop(rid, None)
+
+    # Embed the new versions of changed resources
+    chunks, ids, changed_state = split_resources(changed)
+    if chunks:
+        vectorstore.add_documents(chunks, ids=ids)
+        index_factory.maybe_upgrade_index(vectorstore)
+    state["chunks"].update(changed_state["chunks"])
+    state["updated"].update(changed_state["updated"])
+    if changed_state["watermark"] and changed_state["watermark"] > state["watermark"]:
+        state["watermark"] = changed_state["watermark"]
+
+    if not vectorstore.index_to_docstore_id:
+        logger.warning("⚠️ No resources left to index.")
+        return False
+
+    version = publish_index(vectorstore, RESOURCES_INDEX_DIR, extra_files={RESOURCES_SYNC_STATE: state})
+    logger.info("✅ Resources index synced! (version %s)", version)
+    return True
+
+def build_resources_index(mongo_documents):
+    """Full rebuild of the RESOURCES index. Returns True if a new version was published."""
+    if not mongo_documents:
+        logger.warning("⚠️ No resources found. Skipping resources index creation.")
+        return False
+
+    logger.info("👥 Creating RESOURCES index (MongoDB resources only - for members)...")
+    logger.info("✂️  Splitting text...")
+    resource_texts, ids, state = split_resources(mongo_documents)
+    logger.info("Split into %s chunks.", len(resource_texts))
+
+    logger.info("🧠 Creating embeddings & Indexing (using local model)...")
+    try:
+        embeddings = get_embeddings()
+        vectorstore = index_factory.from_documents(resource_texts, embeddings, ids=ids)
+        logger.info("💾 Publishing resources index to %s...", RESOURCES_INDEX_DIR)
+        version = publish_index(vectorstore, RESOURCES_INDEX_DIR, extra_files={RESOURCES_SYNC_STATE: state})
+        logger.info("✅ Resources index created! (version %s)", version)
+        return True
+    except Exception as e:
+        logger.error("❌ Failed to create resources index: %s", e)
+        return False
+
+def watch_resources(on_change):
+    """
+    Tail the resources collection's change stream and call on_change() after each change.
+    Change streams need MongoDB running as a replica set; returns False if unavailable.
+    Blocks, so run it in a background thread.
+    """
+    try:
+        client = MongoClient(MONGO_URI)
+        resources_collection = client.get_database().resources
+        with resources_collection.watch() as stream:
+            logger.info("👀 Watching resources collection for changes...")
+            for _ in stream:
+                on_change()
+    except Exception as e:
+        logger.warning("⚠️ Resources change stream unavailable (%s). Use POST /ingest?mode=incremental instead.", e)
+        return False
+    return True
+
 def ingest_docs():
     # Only verify API key for chat later, not needed for ingestion with local embeddings
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key or api_key == "CHANGE_ME_TO_YOUR_GEMINI_API_KEY":
-        print("⚠️  Warning: GEMINI_API_KEY not set properly. Chat features might fail later, but ingestion will proceed.")
+        logger.warning("⚠️ Warning: GEMINI_API_KEY not set properly. Chat features might fail later, but ingestion will proceed.")
 
-    print("📚 Loading documents...")
-    
-    # Load Markdown documents from data/docs (GLOBAL - for everyone)
-    md_documents = []
-    try:
-        loader = DirectoryLoader(DOCS_DIR, glob="**/*.md", loader_cls=TextLoader)
-        md_documents = loader.load()
-        print(f"   Loaded {len(md_documents)} markdown documents from data/docs.")
-    except Exception as e:
-        print(f"⚠️  Warning: Could not load markdown documents: {e}")
+    logger.info("📚 Loading documents...")
+
+    # Markdown documents from data/docs (GLOBAL - for everyone)
+    md_paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(DOCS_DIR)
+        for name in names if name.endswith(".md")
+    )
+    logger.info("Found %s markdown documents in data/docs.", len(md_paths))
 
     # Load resources from MongoDB (MEMBERS ONLY)
     mongo_documents = get_mongodb_resources()
-    print(f"   Loaded {len(mongo_documents)} resources from MongoDB.")
+    logger.info("Loaded %s resources from MongoDB.", len(mongo_documents))
 
     # Create GLOBAL index (markdown docs only - PUBLIC)
-    if md_documents:
-        print("\n🌐 Creating GLOBAL index (markdown docs only - for all users)...")
-        print("✂️  Splitting text...")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        md_texts = text_splitter.split_documents(md_documents)
-        print(f"   Split into {len(md_texts)} chunks.")
-
-        print("🧠 Creating embeddings & Indexing (using local model)...")
+    if md_paths:
+        logger.info("🌐 Creating GLOBAL index (markdown docs only - for all users)...")
+        logger.info("🧠 Splitting, embedding & indexing (using local model)...")
+
+        def on_error(path, e):
+            logger.warning("⚠️ Warning: Could not load %s: %s", path, e)
+
+        chunks = ((str(uuid.uuid4()), doc) for _, doc in stream_chunks(md_paths, on_error=on_error))
         try:
-            embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-            vectorstore = FAISS.from_documents(md_texts, embeddings)
-            print(f"💾 Saving global index to {GLOBAL_INDEX_DIR}...")
-            vectorstore.save_local(GLOBAL_INDEX_DIR)
-            print("✅ Global index created!")
+            embeddings = get_embeddings()
+            vectorstore = index_chunks(chunks, embeddings)
+            if vectorstore is None:
+                logger.warning("⚠️ No markdown content found. Skipping global index creation.")
+            else:
+                logger.info("Indexed %s chunks.", len(vectorstore.index_to_docstore_id))
+                index_factory.maybe_upgrade_index(vectorstore)
+                logger.info("💾 Publishing global index to %s...", GLOBAL_INDEX_DIR)
+                version = publish_index(vectorstore, GLOBAL_INDEX_DIR)
+                logger.info("✅ Global index created! (version %s)", version)
         except Exception as e:
-            print(f"❌ Failed to create global index: {e}")
+            logger.error("❌ Failed to create global index: %s", e)
             return
     else:
-        print("⚠️  No markdown documents found. Skipping global index creation.")
+        logger.warning("⚠️ No markdown documents found. Skipping global index creation.")
 
     # Create RESOURCES index (MongoDB resources only - MEMBERS ONLY)
-    if mongo_documents:
-        print("\n👥 Creating RESOURCES index (MongoDB resources only - for members)...")
-        print("✂️  Splitting text...")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-        resource_texts = text_splitter.split_documents(mongo_documents)
-        print(f"   Split into {len(resource_texts)} chunks.")
-
-        print("🧠 Creating embeddings & Indexing (using local model)...")
-        try:
-            embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-            vectorstore = FAISS.from_documents(resource_texts, embeddings)
-            print(f"💾 Saving resources index to {RESOURCES_INDEX_DIR}...")
-            vectorstore.save_local(RESOURCES_INDEX_DIR)
-            print("✅ Resources index created!")
-        except Exception as e:
-            print(f"❌ Failed to create resources index: {e}")
-            return
-    else:
-        print("⚠️  No resources found. Skipping resources index creation.")
+    if not build_resources_index(mongo_documents) and mongo_documents:
+        return  # Build failed
 
-    print("\n✅ Ingestion complete!")
+    logger.info("✅ Ingestion complete!")
 
 
 if __name__ == "__main__":
-    ingest_docs()
+    configure_logging()
+    with shared_index_lock():
+        if "--incremental" in sys.argv[1:]:
+            sync_resources()
+        else:
+            ingest_docs()
 
@@ -0,0 +1,162 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+from telemetry import configure_logging, INGEST_JOBS_TOTAL
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_WORKER_MODE = os.getenv("INGEST_WORKER_MODE", "process")  # "process" or "thread"
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+logger = logging.getLogger(__name__)
+
+
+def run_ingest_job(user_id, job_id, progress_store):
+    """Worker entry point (runs in a worker process or thread)."""
+    from user_ingest import ingest_user_docs
+
+    configure_logging()  # fresh spawn workers have no handlers yet
+
+    def progress(counters):
+        progress_store[job_id] = counters
+
+    return ingest_user_docs(user_id, progress=progress)
+
+
+class IngestJob:
+    def __init__(self, user_id):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.indexed = None
+        self.error = None
+
+    def to_dict(self, progress=None):
+        return {
+            "jobId": self.id,
+            "userId": self.user_id,
+            "status": self.status,
+            "progress": progress or {},
+            "indexed": self.indexed,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class IngestJobQueue:
+    """
+    Runs user ingestion jobs on a bounded worker pool.
+
+    At most one job per user runs at a time. Uploads that arrive while a job
+    is running are coalesced into a single follow-up job, which picks up every
+    file saved in the meantime.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS, mode=INGEST_WORKER_MODE, on_complete=None):
+        self.on_complete = on_complete
+        self.mode = mode
+        self.workers = workers
+        # Worker pool is created on the first job, not at import time
+        self._executor = None
+        self._manager = None
+        self._progress = {}
+        self._jobs = {}
+        self._running = {}  # user_id -> job
+        self._pending = {}  # user_id -> job waiting for the running one
+        self._lock = threading.RLock()  # done-callbacks may run inline from _start
+
+    def submit(self, user_id):
+        """Queues ingestion for a user and returns the job that will cover it."""
+        with self._lock:
+            if user_id in self._pending:
+                return self._pending[user_id]
+            job = IngestJob(user_id)
+            self._jobs[job.id] = job
+            self._prune_history()
+            if user_id in self._running:
+                self._pending[user_id] = job
+            else:
+                self._start(job)
+            return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        job = self.get(job_id)
+        if not job:
+            return None
+        return job.to_dict(dict(self._progress.get(job_id, {})))
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._manager:
+            self._manager.shutdown()
+
+    def _ensure_pool(self):
+        # Caller holds self._lock
+        if self._executor:
+            return
+        if self.mode == "process":
+            # spawn: never fork a process that already holds torch/FAISS threads
+            ctx = multiprocessing.get_context("spawn")
+            self._manager = ctx.Manager()
+            self._progress = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+
+    def _start(self, job):
+        # Caller holds self._lock
+        self._ensure_pool()
+        self._running[job.user_id] = job
+        job.status = "running"
+        job.started_at = time.time()
+        future = self._executor.submit(run_ingest_job, job.user_id, job.id, self._progress)
+        future.add_done_callback(lambda f: self._finish(job, f))
+
+    def _finish(self, job, future):
+        try:
+            job.indexed = bool(future.result())
+            job.status = "done"
+        except Exception as e:
+            logger.error("❌ Ingestion job %s for user %s failed: %s", job.id, job.user_id, e)
+            job.error = str(e)
+            job.status = "failed"
+        job.finished_at = time.time()
+        INGEST_JOBS_TOTAL.inc(status=job.status)
+
+        if self.on_complete:
+            try:
+                self.on_complete(job.user_id)
+            except Exception as e:
+                logger.warning("⚠️ Ingestion completion hook failed: %s", e)
+
+        with self._lock:
+            self._running.pop(job.user_id, None)
+            follow_up = self._pending.pop(job.user_id, None)
+            if follow_up:
+                self._start(follow_up)
+
+    def _prune_history(self):
+        # Caller holds self._lock; drop the oldest finished jobs
+        finished = [j for j in self._jobs.values() if j.status in ("done", "failed")]
+        for old in finished[: max(0, len(self._jobs) - INGEST_JOB_HISTORY)]:
+            self._jobs.pop(old.id, None)
+            self._progress.pop(old.id, None)
@@ -0,0 +1,143 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import index_factory
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 = parse in-process
+EMBED_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "256"))  # chunks embedded and added per batch
+PDF_PAGES_PER_TASK = int(os.getenv("INGEST_PDF_PAGES_PER_TASK", "16"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+TEXT_EXTENSIONS = (".md", ".txt")
+PDF_EXTENSIONS = (".pdf",)  # requires pypdf
+
+
+def plan_file(path):
+    """
+    Splits one file into parse tasks (path, first_page, end_page). Large PDFs
+    become several page ranges so they are parsed in parallel; other files are one task.
+    """
+    if not path.lower().endswith(PDF_EXTENSIONS):
+        return [(path, None, None)]
+    from pypdf import PdfReader
+
+    n_pages = len(PdfReader(path).pages)
+    return [(path, start, min(start + PDF_PAGES_PER_TASK, n_pages))
+            for start in range(0, n_pages, PDF_PAGES_PER_TASK)]
+
+
+def iter_pages(path, first_page=None, end_page=None):
+    """Yields a Document per PDF page in [first_page, end_page), or one for a text file."""
+    if not path.lower().endswith(PDF_EXTENSIONS):
+        with open(path, "r", encoding="utf-8") as f:
+            yield Document(page_content=f.read(), metadata={"source": path})
+        return
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    for page in range(first_page, end_page):
+        yield Document(page_content=reader.pages[page].extract_text(), metadata={"source": path, "page": page})
+
+
+def parse_task(task):
+    """Worker entry point: loads and splits one task. Returns [(text, metadata)]."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = []
+    for page in iter_pages(*task):
+        chunks.extend((chunk.page_content, chunk.metadata) for chunk in splitter.split_documents([page]))
+    return chunks
+
+
+def stream_chunks(paths, workers=PARSE_WORKERS, on_error=None, on_parsed=None):
+    """
+    Yields (path, Document) for every chunk of the given files, in file order.
+
+    Tasks are parsed in a process pool at most 2 * workers ahead of the
+    consumer, so parsing overlaps with embedding and only a few tasks' chunks
+    are held in memory. on_error(path, exc) is called for a file that fails to
+    load (its chunks parsed so far may already have been yielded);
+    on_parsed(path) once a file's last task has been consumed.
+    """
+    tasks = []
+    for path in paths:
+        try:
+            plan = plan_file(path)
+        except Exception as e:
+            if on_error:
+                on_error(path, e)
+            continue
+        tasks.extend((task, i == len(plan) - 1) for i, task in enumerate(plan))
+
+    def collect(task, last, result):
+        path = task[0]
+        try:
+            for text, metadata in result():
+                yield path, Document(page_content=text, metadata=metadata)
+        except Exception as e:
+            if on_error:
+                on_error(path, e)
+        if last and on_parsed:
+            on_parsed(path)
+
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        # A single task isn't worth starting worker processes for
+        for task, last in tasks:
+            yield from collect(task, last, lambda: parse_task(task))
+        return
+
+    # spawn: never fork a process that already holds torch/FAISS threads
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        in_flight = deque()
+        for task, last in tasks:
+            in_flight.append((task, last, pool.submit(parse_task, task)))
+            if len(in_flight) >= 2 * workers:
+                task_, last_, future = in_flight.popleft()
+                yield from collect(task_, last_, future.result)
+        while in_flight:
+            task_, last_, future = in_flight.popleft()
+            yield from collect(task_, last_, future.result)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def index_chunks(chunks, embeddings, vectorstore=None, batch_size=EMBED_BATCH_CHUNKS, on_batch=None):
+    """
+    Embeds (id, Document) pairs in fixed-size batches and adds each batch to
+    vectorstore as soon as it is embedded; a flat store is started from the
+    first batch if none is given (see index_factory.maybe_upgrade_index).
+    on_batch(n) is called after each batch. Returns the store, or None if there were no chunks.
+    """
+    for batch in batched(chunks, batch_size):
+        ids = [chunk_id for chunk_id, _ in batch]
+        docs = [doc for _, doc in batch]
+        texts = [doc.page_content for doc in docs]
+        vectors = embeddings.embed_documents(texts)
+        if vectorstore is None:
+            vectorstore = index_factory.from_embeddings(docs, vectors, embeddings, ids=ids, index_type="flat")
+        else:
+            vectorstore.add_embeddings(zip(texts, vectors), metadatas=[doc.metadata for doc in docs], ids=ids)
+        if on_batch:
+            on_batch(len(batch))
+    return vectorstore
@@ -0,0 +1,43 @@
+import hashlib
+import os
+from dotenv import load_dotenv
+from langchain_google_genai import ChatGoogleGenerativeAI
+from cache import LRUCache
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+LLM_POOL_MAX_CLIENTS = int(os.getenv("LLM_POOL_MAX_CLIENTS", "256"))
+LLM_POOL_IDLE_SECONDS = float(os.getenv("LLM_POOL_IDLE_SECONDS", "900"))
+
+
+def key_fingerprint(api_key):
+    """Pool key for an API key; raw keys are never stored as dict keys or logged."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class LLMClientPool:
+    """
+    Reuses one ChatGoogleGenerativeAI client (and its HTTP connections) per API key.
+    Clients idle for longer than idle_seconds are dropped, and at most
+    max_clients are kept (least recently used first out).
+    """
+
+    def __init__(self, model, temperature=0.3, max_clients=LLM_POOL_MAX_CLIENTS, idle_seconds=LLM_POOL_IDLE_SECONDS):
+        self.model = model
+        self.temperature = temperature
+        self.clients = LRUCache(max_entries=max_clients, ttl=idle_seconds, sliding=True)
+
+    def get(self, api_key):
+        fingerprint = key_fingerprint(api_key)
+        client = self.clients.get(fingerprint)
+        if client is None:
+            # Two concurrent first requests may both build a client; the last one stored wins
+            client = ChatGoogleGenerativeAI(model=self.model, google_api_key=api_key, temperature=self.temperature)
+            self.clients.put(fingerprint, client)
+        return client
+
+    def stats(self):
+        return self.clients.stats()
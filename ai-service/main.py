@@ -1,23 +1,58 @@
 import os
-from fastapi import FastAPI, HTTPException, Body, File, UploadFile, BackgroundTasks
+import json
+import logging
+import shutil
+import threading
+import time
+from contextlib import asynccontextmanager
+from startup import StartupState
+
+startup = StartupState()  # first, so the app import itself is timed
+
+from fastapi import FastAPI, HTTPException, Body, File, UploadFile, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 from pymongo import MongoClient
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from rag_service import RAGService
-from ingest import ingest_docs
+from concurrency import run_blocking
+from admission import Overloaded, client_address
+from user_context import UserContextLoader
+from ingest_jobs import IngestJobQueue
+from telemetry import configure_logging, request_trace, register_cache, render_metrics
+# rag_service, ingest, retrieval and chunk_store pull in langchain, FAISS and
+# the embedding model; they are imported by the warm-up thread, not here
 import hashlib
-from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
 import base64
-from bson import ObjectId
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+configure_logging()
+logger = logging.getLogger(__name__)
+
+STORAGE_DIR = os.getenv("AI_STORAGE_DIR", os.path.dirname(os.path.abspath(__file__)))  # indexes and uploaded user data
+
+RESOURCES_CHANGE_STREAM = os.getenv("RESOURCES_CHANGE_STREAM", "false").lower() == "true"
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "0"))  # >0: pick up indexes published by other processes
+WARMUP_RETRY_AFTER_SECONDS = 5
+
+
+@asynccontextmanager
+async def lifespan(app):
+    startup.record("app_import", time.perf_counter() - startup.created)
+    # Serve /healthz and /readyz at once; chat waits for the warm-up thread
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if RESOURCES_CHANGE_STREAM:
+        start_resources_watcher()
+    if INDEX_POLL_SECONDS > 0:
+        threading.Thread(target=poll_index_versions, name="index-poll", daemon=True).start()
+    yield
+    ingest_jobs.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -36,116 +71,116 @@ users_collection = db.user
 
 # Encryption
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
-if not ENCRYPTION_KEY:
-    print("❌ ERROR: ENCRYPTION_KEY not set in .env file")
-    print("   Set ENCRYPTION_KEY to a 64-character hex string")
-    exit(1)
-
-# Initialize RAG Service (Global system instance)
-try:
-    rag_bot = RAGService()
-    print("✅ RAG Service initialized.")
-except Exception as e:
-    print(f"❌ Failed to initialize RAG Service: {e}")
-    rag_bot = None
+
+# RAG Service (Global system instance); set by warm_up() once fully loaded
+rag_bot = None
+
+def warm_up():
+    """
+    Loads the embedding model and shared indexes in the background and runs
+    one retrieval through them. rag_bot is only published once all of that
+    succeeded, so no request ever sees a half-initialized service.
+    """
+    global rag_bot
+    try:
+        if not ENCRYPTION_KEY:
+            raise RuntimeError("ENCRYPTION_KEY not set in .env file. Set it to a 64-character hex string.")
+        with startup.step("imports"):
+            from rag_service import RAGService
+            from embeddings import get_embeddings
+        with startup.step("embedding_model"):
+            get_embeddings().embed_query("warm up")
+        with startup.step("indexes"):
+            bot = RAGService()
+        with startup.step("warm_query"):
+            # Pages in the FAISS vectors and chunk store the first real query would touch
+            bot.retrieve("warm up")
+        rag_bot = bot
+        logger.info("✅ RAG Service initialized.")
+        startup.finish()
+    except Exception as e:
+        logger.error("❌ Failed to initialize RAG Service: %s", e)
+        startup.finish(error=e)
+
+def require_warm():
+    """Chat requests that arrive while the service is still warming up get a fast 503."""
+    if not startup.done:
+        raise HTTPException(status_code=503, detail="AI service is starting up",
+                            headers={"Retry-After": str(WARMUP_RETRY_AFTER_SECONDS)})
+
+def on_user_ingest_complete(user_id):
+    # Worker processes can't bump this process's cache generation themselves
+    if rag_bot:
+        rag_bot.invalidate_user_index(user_id)
+
+# Background ingestion of user uploads
+ingest_jobs = IngestJobQueue(on_complete=on_user_ingest_complete)
 
 # Models
 class ChatRequest(BaseModel):
     message: str
     userId: str | None = None
+    retrievalMode: str | None = None  # dense | sparse | hybrid | auto
+    filters: dict[str, str | list[str]] | None = None  # e.g. {"domain": "ML", "difficulty": "beginner"}
 
 class ApiKeyRequest(BaseModel):
     userId: str
     apiKey: str
 
-# ===== ENCRYPTION / DECRYPTION =====
-def decrypt_api_key(encrypted_data, encryption_key):
-    """
-    Decrypt API key using AES-256-GCM
-    Format: iv.authTag.encrypted (all hex encoded)
-    """
-    try:
-        parts = encrypted_data.split(".")
-        if len(parts) != 3:
-            return None
-        
-        iv_hex, auth_tag_hex, encrypted_hex = parts
-        iv = bytes.fromhex(iv_hex)
-        auth_tag = bytes.fromhex(auth_tag_hex)
-        encrypted = bytes.fromhex(encrypted_hex)
-        
-        cipher = AES.new(
-            bytes.fromhex(encryption_key),
-            AES.MODE_GCM,
-            nonce=iv
-        )
-        cipher.update(auth_tag)  # For GCM verification
-        
-        decrypted = cipher.decrypt_and_verify(encrypted, auth_tag)
-        return decrypted.decode("utf-8")
-    except Exception as e:
-        print(f"❌ Error decrypting API key: {e}")
-        return None
+class InvalidateUserRequest(BaseModel):
+    userId: str
 
-def get_user_api_key(user_id):
+def requester_of(request: ChatRequest, http_request: Request):
     """
-    Fetch and decrypt user's API key from MongoDB
+    Fairness key for the shared LLM queue: the user, or the caller's address
+    for anonymous chats (see admission.client_address).
     """
-    try:
-        # Convert string ID to ObjectId
-        try:
-            user_obj_id = ObjectId(user_id)
-        except:
-            user_obj_id = user_id  # Fallback to string if conversion fails
-        
-        user = users_collection.find_one({"_id": user_obj_id})
-        if not user or not user.get("geminiApiKey"):
-            return None
-        
-        encryption_key = os.getenv("ENCRYPTION_KEY")
-        if not encryption_key:
-            print("⚠️ ENCRYPTION_KEY not set")
-            return None
-        
-        decrypted_key = decrypt_api_key(user["geminiApiKey"], encryption_key)
-        return decrypted_key
-    except Exception as e:
-        print(f"❌ Error fetching user API key: {e}")
-        return None
+    if request.userId:
+        return request.userId
+    address = client_address(http_request)
+    return f"ip:{address}" if address else None
 
-def get_user_approved_status(user_id):
-    """
-    Fetch user's approval status from MongoDB
-    Returns False if user_id is None (logged out)
-    """
-    if not user_id:
-        return False
-    
-    try:
-        # Convert string ID to ObjectId
-        try:
-            user_obj_id = ObjectId(user_id)
-        except:
-            user_obj_id = user_id  # Fallback to string if conversion fails
-        
-        user = users_collection.find_one({"_id": user_obj_id})
-        if not user:
-            print(f"   ⚠️ User not found with ID: {user_id}")
-            return False
-        
-        approved = user.get("approved", False)
-        print(f"   ✅ User found - Approved: {approved}")
-        return approved
-    except Exception as e:
-        print(f"   ❌ Error fetching user approval status: {e}")
-        return False
+# ===== USER CONTEXT (approval + decrypted API key, cached) =====
+user_contexts = UserContextLoader(users_collection, ENCRYPTION_KEY)
+register_cache("user_contexts", user_contexts.cache.stats)
 
 @app.get("/")
 def home():
     return {"status": "AI Service Running"}
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: the embedding model and at least one shared index are loaded."""
+    state = startup.to_dict()
+    indexes = rag_bot.indexes if rag_bot else None
+    ready = bool(indexes and (indexes.global_vectorstore or indexes.resources_vectorstore))
+    if startup.ok and not ready:
+        state["status"] = "no_index"
+    state["indexVersion"] = indexes.version if indexes else None
+    return JSONResponse(state, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: request/stage latency histograms, cache hit ratios, token counts."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
+    require_warm()
+    check_chat_request(request)
+    with request_trace("chat") as trace:
+        try:
+            return await answer_chat(request, requester_of(request, http_request))
+        except Overloaded as e:
+            trace.outcome = "busy"
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def answer_chat(request: ChatRequest, requester=None):
     user_msg = request.message
     user_id = request.userId
     
@@ -153,16 +188,14 @@ async def chat(request: ChatRequest):
     if not rag_bot:
         return {"response": "System AI is currently unavailable.", "mode": "error"}
 
-    # Get user's API key if they have one
-    user_api_key = None
-    user_approved = False
-    
-    if user_id:
-        user_api_key = get_user_api_key(user_id)
-        user_approved = get_user_approved_status(user_id)
+    # Get user's approval status and API key (one cached lookup)
+    user_ctx = await run_blocking("db", user_contexts.load, user_id)
+    user_api_key = user_ctx.api_key
+    user_approved = user_ctx.approved
 
     # 1. Try RAG (User or Global) with user's API key if available
-    rag_response = rag_bot.ask(user_msg, user_id=user_id, user_api_key=user_api_key, user_approved=user_approved)
+    rag_response = await rag_bot.aask(user_msg, user_id=user_id, user_api_key=user_api_key, user_approved=user_approved,
+                                      retrieval_mode=request.retrievalMode, filters=request.filters, requester=requester)
     
     # If rag_response is a string (error string from old logic handling), wrap it
     if isinstance(rag_response, str):
@@ -172,9 +205,7 @@ async def chat(request: ChatRequest):
     # If mode is 'user_rag', we returned answer from private docs. Great.
     
     if rag_response["source"] == "user_rag":
-        response_data = {"response": rag_response["answer"], "mode": "personalized_rag"}
-        print(f"📤 Sending to Frontend: {response_data}")
-        return response_data
+        return {"response": rag_response["answer"], "mode": "personalized_rag"}
 
     # If mode is 'empty_user_rag', strictly return the prompt to upload data.
     if rag_response["source"] == "empty_user_rag":
@@ -183,24 +214,67 @@ async def chat(request: ChatRequest):
     # If mode is 'global_rag', we returned answer from public docs.
     # BUT, if the user is a Member with an API Key, they can use personalized chat with their own key
     if user_id and rag_response["source"] == "global_rag":
-        user_api_key = get_user_api_key(user_id)
         if user_api_key:
+            # Answer was generated with the user's own key (pooled client in RAGService)
+            logger.debug("✅ Using user's personal API key for %s", user_id)
+            return {"response": rag_response["answer"], "mode": "rag_with_user_key"}
+
+    return {"response": rag_response["answer"], "mode": "rag"}
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Server-Sent Events version of /chat.
+    Emits a `meta` event (retrieval mode + sources) first, then `token` events
+    as Gemini generates them, then `done`. When the shared Gemini key is
+    saturated it emits an `error` event with code "busy" instead.
+    """
+    user_msg = request.message
+    user_id = request.userId
+    requester = requester_of(request, http_request)
+    require_warm()
+    check_chat_request(request)
+
+    async def events():
+        with request_trace("chat_stream") as trace:
+            if not rag_bot:
+                yield sse_event({"type": "error", "message": "System AI is currently unavailable."})
+                return
+
+            user_ctx = await run_blocking("db", user_contexts.load, user_id)
+
             try:
-                # Use user's API key for personalized chat
-                user_llm = ChatGoogleGenerativeAI(
-                    model="gemini-2.5-flash", 
-                    google_api_key=user_api_key
-                )
-                
-                # Still use RAG answer as primary (consistent), but user has their own quota
-                print(f"✅ Using user's personal API key for {user_id}")
-                return {"response": rag_response["answer"], "mode": "rag_with_user_key"}
-                
+                async for event in rag_bot.astream(user_msg, user_id=user_id, user_api_key=user_ctx.api_key,
+                                                 user_approved=user_ctx.approved, retrieval_mode=request.retrievalMode,
+                                                 filters=request.filters, requester=requester):
+                    if event.get("code") == "busy":
+                        trace.outcome = "busy"
+                    yield sse_event(event)
             except Exception as e:
-                print(f"⚠️ Error with user's API key: {e}")
-                # Fallthrough to global RAG
+                trace.outcome = "error"
+                logger.error("❌ Error while streaming chat response: %s", e)
+                yield sse_event({"type": "error", "message": "Sorry, I encountered an error. Please try again later."})
 
-    return {"response": rag_response["answer"], "mode": "rag"}
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def check_chat_request(request):
+    from retrieval import RETRIEVAL_MODES
+    from chunk_store import FILTER_FIELDS
+
+    if request.retrievalMode is not None and request.retrievalMode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"retrievalMode must be one of: {', '.join(RETRIEVAL_MODES)}")
+    unknown = set(request.filters or {}) - set(FILTER_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown filter field(s) {', '.join(sorted(unknown))}; "
+                                                     f"allowed: {', '.join(FILTER_FIELDS)}")
+
+def sse_event(event):
+    """Formats one event dict as an SSE frame."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
 
 @app.post("/user/apikey")
 async def save_api_key(request: ApiKeyRequest):
@@ -216,10 +290,20 @@ async def save_api_key(request: ApiKeyRequest):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
-            
+
+        user_contexts.invalidate(request.userId)
         return {"status": "success", "message": "API Key saved securely."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+@app.post("/user/cache/invalidate")
+async def invalidate_user_cache(request: InvalidateUserRequest):
+    """
+    Called by the backend when a user's API key or approval status changes,
+    so the next chat request re-reads it from MongoDB.
+    """
+    user_contexts.invalidate(request.userId)
+    return {"status": "success"}
+
 @app.post("/user/upload")
 async def upload_file(
     userId: str = Body(...),
@@ -227,51 +311,114 @@ async def upload_file(
 ):
     try:
         # Directory structure: data/users/{userId}/docs
-        user_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "users", userId)
+        user_dir = os.path.join(STORAGE_DIR, "data", "users", userId)
         docs_dir = os.path.join(user_dir, "docs")
         os.makedirs(docs_dir, exist_ok=True)
         
         file_path = os.path.join(docs_dir, file.filename)
         
         # Save file
-        with open(file_path, "wb") as buffer:
-            import shutil
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Trigger Ingestion (Directly call function instead of subprocess for simplicity if possible, or subprocess)
-        # Using subprocess to keep it async/separate process or we can import the function
-        # Let's import the function to keep it simple, but run it in a thread/background task?
-        # For MVP, we run it synchronously or use BackgroundTasks
-        from user_ingest import ingest_user_docs
-        
-        # In a real app, use BackgroundTasks. Here we do it inline for immediate feedback or better yet BackgroundTasks
-        ingest_user_docs(userId)
-        
-        return {"status": "success", "message": f"File '{file.filename}' uploaded and indexed."}
+        def save_upload():
+            with open(file_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
+        await run_blocking("io", save_upload)
+
+        # Queue ingestion on the worker pool; repeated uploads for a user share one job
+        job = ingest_jobs.submit(userId)
+
+        return {
+            "status": "queued",
+            "jobId": job.id,
+            "message": f"File '{file.filename}' uploaded. Indexing in the background.",
+        }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/user/ingest/status/{job_id}")
+async def ingest_status(job_id: str):
+    """Progress of a background user ingestion job (files parsed, chunks embedded)."""
+    status = ingest_jobs.status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+# Serializes shared index rebuilds/syncs (/ingest and the change stream watcher) in
+# this process; ingest.shared_index_lock() does the same across processes
+ingest_lock = threading.Lock()
+
+def reload_rag_indexes():
+    # Swap in the new index versions; in-flight queries finish on the old ones
+    global rag_bot
+    startup.wait()  # a warm-up still in progress would otherwise be replaced or race us
+    try:
+        if rag_bot:
+            version = rag_bot.reload_indexes()
+        else:
+            from rag_service import RAGService
+            rag_bot = RAGService()
+            version = rag_bot.indexes.version
+        logger.info("✅ RAG service now serving index version %s", version)
+    except Exception as e:
+        logger.error("❌ Error reloading RAG service: %s", e)
+
+def poll_index_versions():
+    """Reloads when another process (e.g. the worker that ran /ingest) publishes a new shared index version."""
+    startup.wait()
+    while True:
+        time.sleep(INDEX_POLL_SECONDS)
+        try:
+            stale = rag_bot.indexes_stale() if rag_bot else False
+        except Exception as e:
+            logger.warning("⚠️ Could not check index versions: %s", e)
+            continue
+        if stale:
+            reload_rag_indexes()
+
+def run_ingestion(mode="full"):
+    from ingest import ingest_docs, sync_resources, shared_index_lock
+
+    with ingest_lock, shared_index_lock():
+        if mode == "incremental":
+            logger.info("🔄 Starting incremental resources sync...")
+            changed = sync_resources()
+        else:
+            logger.info("🔄 Starting ingestion in background...")
+            ingest_docs()
+            changed = True
+        if changed:
+            logger.info("✅ Ingestion completed. Reloading indexes...")
+            reload_rag_indexes()
+
 @app.post("/ingest")
-async def trigger_ingest(background_tasks: BackgroundTasks):
+async def trigger_ingest(background_tasks: BackgroundTasks, mode: str = "full"):
     """
-    Endpoint to trigger re-ingestion of all documents (markdown + MongoDB resources).
+    Endpoint to trigger re-ingestion of documents.
+    mode=full: rebuild everything (markdown + MongoDB resources).
+    mode=incremental: only re-embed resources added/changed/deleted since the last sync.
     Useful when new resources are added to the database.
     Runs in the background to avoid blocking the response.
     """
+    if mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'incremental'")
     try:
-        def ingest_in_background():
-            print("🔄 Starting ingestion in background...")
-            ingest_docs()
-            print("✅ Ingestion completed. Reloading RAG service...")
-            # Reload the RAG service to use the new index
-            global rag_bot
-            try:
-                rag_bot = RAGService()
-                print("✅ RAG service reloaded with new index")
-            except Exception as e:
-                print(f"❌ Error reloading RAG service: {e}")
-        
-        background_tasks.add_task(ingest_in_background)
-        return {"status": "ingestion_started", "message": "Documents are being indexed. This may take a moment."}
+        background_tasks.add_task(run_ingestion, mode)
+        return {"status": "ingestion_started", "mode": mode, "message": "Documents are being indexed. This may take a moment."}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def start_resources_watcher():
+    """Keeps the resources index in sync from the MongoDB change stream (replica sets only)."""
+    from ingest import watch_resources
+
+    changes = threading.Event()
+
+    def sync_loop():
+        while True:
+            changes.wait()
+            time.sleep(2)  # Let bursts of edits settle into one sync
+            changes.clear()
+            run_ingestion("incremental")
+
+    threading.Thread(target=sync_loop, name="resources-sync", daemon=True).start()
+    threading.Thread(target=watch_resources, args=(changes.set,), name="resources-watch", daemon=True).start()
@@ -0,0 +1,91 @@
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from cache import LRUCache
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "1800"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # 0 disables near-duplicate matching
+
+
+def normalize_query(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variants share a key."""
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip(" ?!.")
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Wraps an embedding model, caching embed_query results by normalized text."""
+
+    def __init__(self, base, max_entries=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL):
+        self.base = base
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.base.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+
+class AnswerCache:
+    """
+    Caches generated answers by (index version, access tier, normalized query).
+    On an exact miss, a cached answer for a near-duplicate question (cosine
+    similarity of query embeddings >= similarity) in the same version and
+    tier is returned instead. Cleared whenever the shared indexes are reloaded.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, similarity=ANSWER_CACHE_SIMILARITY):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.similarity = similarity
+        self.near_hits = 0
+
+    def get(self, version, tier, query, vector=None):
+        key = (version, tier, normalize_query(query))
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry[1]
+        if vector is None or self.similarity <= 0:
+            return None
+
+        candidates = [(k, v) for k, v in self.cache.items()
+                      if k[0] == version and k[1] == tier and v[0] is not None]
+        if not candidates:
+            return None
+        matrix = np.array([v[0] for _, v in candidates], dtype=np.float32)
+        scores = matrix @ _unit(vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        self.near_hits += 1
+        return candidates[best][1][1]
+
+    def put(self, version, tier, query, vector, answer):
+        key = (version, tier, normalize_query(query))
+        self.cache.put(key, (_unit(vector) if vector is not None else None, answer))
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return {**self.cache.stats(), "near_hits": self.near_hits}
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
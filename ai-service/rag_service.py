@@ -1,51 +1,95 @@
 import os
+import json
+import ntpath
+import time
+import logging
+from contextlib import nullcontext
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
+from cache import LRUCache, user_index_generations
+from embeddings import get_embeddings
+from concurrency import run_blocking, stage_limit
+from llm_pool import LLMClientPool, key_fingerprint
+from index_store import current_index_dir, current_version, load_index
+from query_cache import CachedQueryEmbeddings, AnswerCache, normalize_query
+from admission import AdmissionQueue, SingleFlight, Overloaded, COALESCE_REQUESTS
+from context_builder import build_context
+from telemetry import span, record, register_cache, CONTEXT_TOKENS
+from retrieval import MultiIndexRetriever, UserFilesRetriever, RETRIEVAL_K, RETRIEVAL_TOP_N, RETRIEVAL_MODE, skips_embedding
+from content_store import USER_MANIFEST_FILE, USER_INDEX_DIR, read_user_manifest, load_file_store, file_store_size
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-GLOBAL_INDEX_DIR = os.path.join(BASE_DIR, "faiss_index")  # Markdown docs only
-RESOURCES_INDEX_DIR = os.path.join(BASE_DIR, "faiss_index_resources")  # MongoDB resources only
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+STORAGE_DIR = os.getenv("AI_STORAGE_DIR", BASE_DIR)  # indexes and uploaded user data
+GLOBAL_INDEX_DIR = os.path.join(STORAGE_DIR, "faiss_index")  # Markdown docs only
+RESOURCES_INDEX_DIR = os.path.join(STORAGE_DIR, "faiss_index_resources")  # MongoDB resources only
 CHAT_MODEL = "gemini-2.5-flash"
+USER_INDEX_CACHE_MB = int(os.getenv("USER_INDEX_CACHE_MB", "512"))
+USER_FILE_SETS_CACHE_SIZE = int(os.getenv("USER_FILE_SETS_CACHE_SIZE", "10000"))
+USER_FILES_MAX_FANOUT = int(os.getenv("USER_FILES_MAX_FANOUT", "16"))  # file stores searched per query without a search_index
+
+logger = logging.getLogger(__name__)
+
+class IndexSnapshot:
+    """
+    The shared vector stores in use at one moment. reload_indexes() swaps in a
+    whole new snapshot, so a query that already grabbed one finishes on it.
+    """
+
+    def __init__(self, global_vectorstore=None, global_version=None, resources_vectorstore=None, resources_version=None):
+        self.global_vectorstore = global_vectorstore
+        self.global_version = global_version
+        self.resources_vectorstore = resources_vectorstore
+        self.resources_version = resources_version
+
+    @property
+    def version(self):
+        return f"{self.global_version}:{self.resources_version}"
 
 class RAGService:
     def __init__(self, api_key=None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         
         # We can still init embeddings if API key is missing (for local embeddings)
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        self.embeddings = get_embeddings()
+        # Repeated questions skip re-embedding and, for shared indexes, the LLM call
+        self.query_embeddings = CachedQueryEmbeddings(self.embeddings)
+        self.answer_cache = AnswerCache()
+        # Identical questions in flight share one retrieval + generation
+        self.inflight = SingleFlight()
+        # Fair, bounded queue in front of the shared (admin) Gemini key
+        self.admission = AdmissionQueue()
+
+        # Loaded user search indexes (keyed by user id), weighted by on-disk index size.
+        # Users without one yet are searched file by file: those stores are keyed by
+        # ("file", content hash), so a file several users uploaded is held once
+        self.user_index_cache = LRUCache(max_weight=USER_INDEX_CACHE_MB * 1024 * 1024)
+        # user id -> (signature, {path: content hash}) from the user's files.json
+        self.user_file_sets = LRUCache(max_entries=USER_FILE_SETS_CACHE_SIZE)
         
-        # Load GLOBAL index (markdown docs - for everyone)
-        try:
-            self.global_vectorstore = FAISS.load_local(GLOBAL_INDEX_DIR, self.embeddings, allow_dangerous_deserialization=True)
-            self.global_retriever = self.global_vectorstore.as_retriever(search_kwargs={"k": 3})
-            print("✅ Global vector store (markdown docs) loaded successfully")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not load global vector store: {e}")
-            self.global_retriever = None
+        # Load GLOBAL (markdown docs - for everyone) and RESOURCES (MongoDB resources - for members only) indexes
+        self.indexes = IndexSnapshot()
+        self.reload_indexes()
 
-        # Load RESOURCES index (MongoDB resources - for members only)
-        try:
-            self.resources_vectorstore = FAISS.load_local(RESOURCES_INDEX_DIR, self.embeddings, allow_dangerous_deserialization=True)
-            self.resources_retriever = self.resources_vectorstore.as_retriever(search_kwargs={"k": 3})
-            print("✅ Resources vector store (MongoDB resources) loaded successfully")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not load resources vector store: {e}")
-            self.resources_retriever = None
+        # Per-user-key clients, reused across requests
+        self.llm_pool = LLMClientPool(CHAT_MODEL, temperature=0.3)
+
+        register_cache("query_embeddings", self.query_embeddings.cache.stats)
+        register_cache("answers", self.answer_cache.stats)
+        register_cache("user_indexes", self.user_index_cache.stats)
+        register_cache("user_file_sets", self.user_file_sets.stats)
+        register_cache("llm_clients", self.llm_pool.stats)
 
         if self.api_key:
             self.llm = ChatGoogleGenerativeAI(model=CHAT_MODEL, google_api_key=self.api_key, temperature=0.3)
         else:
             self.llm = None
-            print("⚠️ Warning: GEMINI_API_KEY missing. Chat will not work.")
+            logger.warning("⚠️ GEMINI_API_KEY missing. Chat will not work.")
 
         # Prompt Template
         template = """Answer the question based ONLY on the following context about AdroIT technical club. 
@@ -59,23 +103,281 @@ Question: {question}
 Answer:"""
         self.prompt = PromptTemplate(template=template, input_variables=["context", "question"])
 
+    def _load_shared_index(self, base_dir, label, loaded_store, loaded_version):
+        """Loads the live version of a shared index, reusing the loaded store if it hasn't changed."""
+        version = current_version(base_dir)
+        if version is None:
+            logger.warning("⚠️ Could not load %s vector store: no index at %s", label, base_dir)
+            return None, None
+        if version == loaded_version and loaded_store is not None:
+            return loaded_store, version
+        try:
+            store = load_index(base_dir, self.embeddings)
+            logger.info("✅ %s vector store loaded (version %s)", label.capitalize(), version)
+            return store, version
+        except Exception as e:
+            logger.warning("⚠️ Could not load %s vector store: %s", label, e)
+            # Keep serving the previous version rather than dropping the index
+            return loaded_store, loaded_version
+
+    def reload_indexes(self):
+        """
+        Loads the live versions of the global and resources indexes and swaps
+        them in atomically. Only the vector stores change; the embedding model
+        and LLM clients are kept.
+        """
+        current = self.indexes
+        global_store, global_version = self._load_shared_index(
+            GLOBAL_INDEX_DIR, "global (markdown docs)", current.global_vectorstore, current.global_version)
+        resources_store, resources_version = self._load_shared_index(
+            RESOURCES_INDEX_DIR, "resources (MongoDB resources)", current.resources_vectorstore, current.resources_version)
+        self.indexes = IndexSnapshot(global_store, global_version, resources_store, resources_version)
+        if self.indexes.version != current.version:
+            self.answer_cache.clear()
+        return self.indexes.version
+
+    def indexes_stale(self):
+        """Whether a newer shared index version was published (e.g. by another worker process)."""
+        indexes = self.indexes
+        live = (current_version(GLOBAL_INDEX_DIR), current_version(RESOURCES_INDEX_DIR))
+        return live != (indexes.global_version, indexes.resources_version)
+
+    @property
+    def global_retriever(self):
+        store = self.indexes.global_vectorstore
+        return MultiIndexRetriever({"global": store}, self.query_embeddings) if store else None
+
+    @property
+    def resources_retriever(self):
+        store = self.indexes.resources_vectorstore
+        return MultiIndexRetriever({"resources": store}, self.query_embeddings) if store else None
+
+    def build_context(self, docs):
+        """Packs retrieved chunks into the prompt's token budget (see context_builder)."""
+        with span("prompt_build"):
+            context = build_context(docs)
+        CONTEXT_TOKENS.inc(context.stats["tokens_in"], kind="retrieved")
+        CONTEXT_TOKENS.inc(context.stats["tokens_out"], kind="sent")
+        logger.debug("✂️ Context: %s", context.summary())
+        return context
+
     def format_docs(self, docs):
-        return "\n\n".join(doc.page_content for doc in docs)
+        return self.build_context(docs).text
+
+    def describe_sources(self, docs):
+        """Short, de-duplicated list of where the retrieved chunks came from."""
+        sources = []
+        for doc in docs:
+            meta = doc.metadata
+            if meta.get("source") == "mongodb_resource":
+                source = {"title": meta.get("title"), "url": meta.get("url")}
+            else:
+                # ntpath handles both separators (indexes may have been built on Windows)
+                source = {"title": ntpath.basename(meta.get("source", "")), "page": meta.get("page")}
+            if source not in sources:
+                sources.append(source)
+        return sources
+
+    def _user_index_signature(self, user_id, user_index_dir):
+        """Returns (generation, live version) and on-disk vector size of a user's index, or None if missing."""
+        version = current_version(user_index_dir)
+        if version is None:
+            return None, 0
+        try:
+            size = os.path.getsize(os.path.join(current_index_dir(user_index_dir), "index.faiss"))
+        except OSError:
+            return None, 0
+        return (user_index_generations.get(user_id), version), size
+
+    def get_user_retriever(self, user_id, retrieval_mode=None, filters=None):
+        """
+        Retriever over a user's private uploads, or None if they have none.
+        Normally one search over the user's merged search_index, however many
+        files they uploaded. Users ingested before search indexes existed are
+        searched file by file (the content-store files in their own files.json,
+        at most USER_FILES_MAX_FANOUT of them) until their next ingest.
+        """
+        user_dir = os.path.join(STORAGE_DIR, "data", "users", user_id)
+        retriever = self._user_index_retriever(user_id, os.path.join(user_dir, USER_INDEX_DIR), retrieval_mode, filters)
+        if retriever is not None:
+            return retriever
+
+        files = self._user_files(user_id)
+        if files is None:
+            # Pre-content-store index
+            return self._user_index_retriever(user_id, os.path.join(user_dir, "faiss_index"), retrieval_mode, filters)
+        if len(files) > USER_FILES_MAX_FANOUT:
+            logger.warning("⚠️ User %s has %d files but no search index; searching the first %d until they re-ingest",
+                           user_id, len(files), USER_FILES_MAX_FANOUT)
+
+        stores = {}
+        for path, file_sha in list(files.items())[:USER_FILES_MAX_FANOUT]:
+            store = self._file_store(file_sha)
+            if store is not None:
+                stores[path] = store
+        if not stores:
+            return None
+        return UserFilesRetriever(stores, self.query_embeddings, top_n=RETRIEVAL_K, mode=retrieval_mode, filters=filters)
+
+    def has_user_documents(self, user_id):
+        """Whether a user has private uploads, judged from the files on disk without loading any index."""
+        user_dir = os.path.join(STORAGE_DIR, "data", "users", user_id)
+        if current_version(os.path.join(user_dir, USER_INDEX_DIR)):
+            return True
+        files = self._user_files(user_id)
+        if files is None:
+            return current_version(os.path.join(user_dir, "faiss_index")) is not None
+        return bool(files)
 
-    def get_user_retriever(self, user_id):
-        """Loads a user-specific FAISS index if it exists."""
-        user_index_dir = os.path.join(BASE_DIR, "data", "users", user_id, "faiss_index")
-        if os.path.exists(user_index_dir):
+    def _user_files(self, user_id):
+        """{path: content hash} of a user's uploads (one path per distinct file), or None without a files.json."""
+        user_dir = os.path.join(STORAGE_DIR, "data", "users", user_id)
+        try:
+            signature = (user_index_generations.get(user_id), os.stat(os.path.join(user_dir, USER_MANIFEST_FILE)).st_mtime_ns)
+        except OSError:
+            self.user_file_sets.pop(user_id)
+            return None
+
+        cached = self.user_file_sets.get(user_id, is_valid=lambda entry: entry[0] == signature)
+        if cached:
+            return cached[1]
+        manifest = read_user_manifest(user_id)
+        if manifest is None:
+            return None
+        files = {}
+        for rel, entry in sorted(manifest["files"].items()):
+            if entry["sha256"] not in files.values():
+                files[os.path.join(user_dir, "docs", rel)] = entry["sha256"]
+        self.user_file_sets.put(user_id, (signature, files))
+        return files
+
+    def _file_store(self, file_sha):
+        """The vector store of one uploaded file (shared by every user who uploaded it)."""
+        key = ("file", file_sha)
+        store = self.user_index_cache.get(key)
+        if store is not None:
+            return store
+        try:
+            with span("index_load"):
+                store = load_file_store(file_sha, self.embeddings)
+        except Exception as e:
+            logger.warning("⚠️ Error loading file store %s: %s", file_sha, e)
+            return None
+        self.user_index_cache.put(key, store, weight=file_store_size(file_sha))
+        return store
+
+    def _user_index_retriever(self, user_id, user_index_dir, retrieval_mode=None, filters=None):
+        """Retriever over one of a user's own versioned indexes, if it exists (cached in memory)."""
+        signature, size = self._user_index_signature(user_id, user_index_dir)
+        if signature is None:
+            self.user_index_cache.pop(user_id)
+            return None
+
+        cached = self.user_index_cache.get(user_id, is_valid=lambda entry: entry[0] == signature)
+        if cached:
+            return MultiIndexRetriever({"user": cached[1]}, self.query_embeddings, top_n=RETRIEVAL_K, mode=retrieval_mode, filters=filters)
+
+        try:
+            # Load user vector store
+            with span("index_load"):
+                vectorstore = load_index(user_index_dir, self.embeddings)
+        except Exception as e:
+            logger.warning("⚠️ Error loading user index for %s: %s", user_id, e)
+            self.user_index_cache.pop(user_id)
+            return None
+        self.user_index_cache.put(user_id, (signature, vectorstore), weight=size)
+        return MultiIndexRetriever({"user": vectorstore}, self.query_embeddings, top_n=RETRIEVAL_K, mode=retrieval_mode, filters=filters)
+
+    def invalidate_user_index(self, user_id):
+        """Drops a user's cached file list / index so the next query reloads it from disk."""
+        user_index_generations.bump(user_id)
+        self.user_file_sets.pop(user_id)
+        self.user_index_cache.pop(user_id)
+
+    def select_llm(self, user_api_key=None):
+        """Returns the user's personal LLM if they have a key, else the admin one."""
+        if user_api_key:
             try:
-                # Load user vector store
-                vectorstore = FAISS.load_local(user_index_dir, self.embeddings, allow_dangerous_deserialization=True)
-                return vectorstore.as_retriever(search_kwargs={"k": 3})
+                llm = self.llm_pool.get(user_api_key)
+                logger.debug("🔑 Using user's personal API key")
+                return llm
             except Exception as e:
-                print(f"⚠️ Error loading user index for {user_id}: {e}")
-                return None
-        return None
+                logger.warning("⚠️ Error initializing user's API key: %s", e)
+        return self.llm  # Fallback to admin key
+
+    def get_retriever(self, user_id=None, user_approved=False, retrieval_mode=None, filters=None):
+        """
+        Picks the retriever for a request (retrieval_mode, filters: see MultiIndexRetriever).
+        Returns (retriever, mode); retriever is None if no knowledge base is available.
+        """
+        # 1. Member Mode (Strict Private RAG) - Only if they have uploaded documents
+        if user_id:
+            user_retriever = self.get_user_retriever(user_id, retrieval_mode, filters)
+            if user_retriever:
+                logger.debug("🔍 Using private index for user %s", user_id)
+                return user_retriever, "user_rag"
+            # If no private documents, fall through to combined RAG
+
+        # 2. Combined RAG - Global + Resources (if approved)
+        indexes = self.indexes  # one consistent snapshot for the whole query
+        stores = {}
+
+        # Global index always available
+        if indexes.global_vectorstore:
+            stores["global"] = indexes.global_vectorstore
+            logger.debug("🔍 Adding global index (markdown docs)")
 
-    def ask(self, query, user_id=None, user_api_key=None, user_approved=False):
+        # Resources index only for approved members
+        if user_approved and indexes.resources_vectorstore:
+            stores["resources"] = indexes.resources_vectorstore
+            logger.debug("🔍 Adding resources index (members only)")
+        elif not user_approved and indexes.resources_vectorstore:
+            logger.debug("⛔ Resources index blocked (user not approved)")
+
+        if not stores:
+            return None, "global_rag"
+
+        # One query embedding, concurrent search, merged by score and de-duplicated
+        top_n = RETRIEVAL_K if len(stores) == 1 else RETRIEVAL_TOP_N
+        return MultiIndexRetriever(stores, self.query_embeddings, top_n=top_n, mode=retrieval_mode, filters=filters), "global_rag"
+
+    def retrieve(self, query, user_id=None, user_approved=False, retrieval_mode=None, filters=None):
+        """
+        Runs retrieval only (blocking: index load + embedding + FAISS search).
+        Returns (docs, mode), or (None, "error") if no knowledge base is available.
+        """
+        retriever, mode = self.get_retriever(user_id, user_approved, retrieval_mode, filters)
+        if not retriever:
+            return None, "error"
+        docs = retriever.invoke(query)
+        logger.debug("📄 Retrieved %d documents", len(docs))
+        return docs, mode
+
+    def lookup_cached_answer(self, query, user_id=None, user_approved=False, retrieval_mode=None, filters=None):
+        """
+        Answer-cache lookup for questions served from the shared indexes.
+        Returns (cache_key, cached answer or None); cache_key is None for
+        members with private documents, whose answers are never cached.
+        """
+        # retrieve() builds the user's retriever; only whether they have one matters here
+        if user_id and self.has_user_documents(user_id):
+            return None, None
+        retrieval_mode = retrieval_mode or RETRIEVAL_MODE
+        tier = f"{'approved' if user_approved else 'public'}:{retrieval_mode}:{json.dumps(filters or {}, sort_keys=True)}"
+        # Keyword-only queries aren't embedded; they can still hit on the exact question
+        vector = None
+        if not skips_embedding(query, retrieval_mode):
+            with span("embedding"):
+                vector = self.query_embeddings.embed_query(query)
+        cache_key = (self.indexes.version, tier, query, vector)
+        with span("answer_cache"):
+            return cache_key, self.answer_cache.get(*cache_key)
+
+    def _log_query(self, query, user_id, user_api_key, user_approved):
+        logger.debug("🔍 RAG query: user=%s approved=%s own_key=%s query=%.100s",
+                     user_id, user_approved, bool(user_api_key), query)
+
+    def ask(self, query, user_id=None, user_api_key=None, user_approved=False, retrieval_mode=None, filters=None):
         """
         Ask a question using RAG
         Args:
@@ -83,102 +385,163 @@ Answer:"""
             user_id: Optional user ID for private RAG
             user_api_key: Optional user's personal Gemini API key
             user_approved: Whether user is approved member (to access resources)
+            retrieval_mode: dense | sparse | hybrid | auto (default RETRIEVAL_MODE)
+            filters: Optional metadata filters, e.g. {"domain": "ML", "difficulty": "beginner"}
         """
-        print(f"\n🔍 RAG Query Started")
-        print(f"   User ID: {user_id}")
-        print(f"   User Approved: {user_approved}")
-        print(f"   User API Key: {'Yes' if user_api_key else 'No'}")
-        print(f"   Query: {query[:100]}...")
-        
+        self._log_query(query, user_id, user_api_key, user_approved)
+
         # Determine which LLM to use
-        llm = None
-        if user_api_key:
-            try:
-                llm = ChatGoogleGenerativeAI(model=CHAT_MODEL, google_api_key=user_api_key, temperature=0.3)
-                print(f"   🔑 Using user's personal API key")
-            except Exception as e:
-                print(f"   ⚠️ Error initializing user's API key: {e}")
-                llm = self.llm  # Fallback to admin key
-        else:
-            llm = self.llm
-            
+        llm = self.select_llm(user_api_key)
         if not llm:
             return {"answer": "System is not fully initialized (missing API Key).", "source": "error"}
-            
-        retriever = None
-        mode = "global_rag"
-        
-        # 1. Member Mode (Strict Private RAG) - Only if they have uploaded documents
-        if user_id:
-            user_retriever = self.get_user_retriever(user_id)
-            if user_retriever:
-                retriever = user_retriever
-                mode = "user_rag"
-                print(f"   🔍 Using Private Index for User {user_id}")
-            # If no private documents, fall through to combined RAG
-        
-        # 2. Combined RAG - Global + Resources (if approved)
-        if not retriever:
-            retrievers = []
-            
-            # Global index always available
-            if self.global_retriever:
-                retrievers.append(self.global_retriever)
-                print("   🔍 Adding Global Index (markdown docs)")
-            
-            # Resources index only for approved members
-            if user_approved and self.resources_retriever:
-                retrievers.append(self.resources_retriever)
-                print("   🔍 Adding Resources Index (members only)")
-            elif not user_approved and self.resources_retriever:
-                print("   ⛔ Resources Index BLOCKED (user not approved)")
-            
-            # Combine retrievers
-            if retrievers:
-                if len(retrievers) == 1:
-                    retriever = retrievers[0]
-                else:
-                    # Create a combined retriever that queries all and merges results
-                    def combined_search(q):
-                        all_docs = []
-                        for ret in retrievers:
-                            all_docs.extend(ret.invoke(q))
-                        # Remove duplicates while preserving order
-                        seen = set()
-                        unique_docs = []
-                        for doc in all_docs:
-                            doc_id = doc.page_content[:50]  # Use first 50 chars as simple ID
-                            if doc_id not in seen:
-                                seen.add(doc_id)
-                                unique_docs.append(doc)
-                        return unique_docs[:6]  # Return top 6 unique docs
-                    
-                    class CombinedRetriever:
-                        def invoke(self, q):
-                            return combined_search(q)
-                    
-                    retriever = CombinedRetriever()
-            else:
-                return {"answer": "Knowledge base is currently unavailable.", "source": "error"}
-        
+
+        cache_key, cached = self.lookup_cached_answer(query, user_id, user_approved, retrieval_mode, filters)
+        if cached:
+            logger.debug("⚡ Answer cache hit")
+            return {"answer": cached["answer"], "source": "global_rag"}
+
         # Retrieval
-        docs = retriever.invoke(query)
-        if not docs and mode == "user_rag":
-            pass
-            
-        context = self.format_docs(docs)
-        print(f"   📄 Retrieved {len(docs)} documents ({len(context)} chars)")
-        
+        docs, mode = self.retrieve(query, user_id, user_approved, retrieval_mode, filters)
+        if docs is None:
+            return {"answer": "Knowledge base is currently unavailable.", "source": "error"}
+
         # Generation with the appropriate LLM
+        context = self.build_context(docs)
         chain = self.prompt | llm | StrOutputParser()
-        response = chain.invoke({"context": context, "question": query})
-        print(f"   ✅ Query completed - Mode: {mode}")
-        
+        with span("llm"):
+            response = chain.invoke({"context": context.text, "question": query})
+        logger.debug("✅ Query completed - mode: %s", mode)
+        self._store_answer(cache_key, mode, response, context.docs)
+
         # Return response + mode info
         return {"answer": response, "source": mode}
 
+    async def aask(self, query, user_id=None, user_api_key=None, user_approved=False, retrieval_mode=None, filters=None,
+                   requester=None):
+        """
+        Async version of ask() for the FastAPI event loop.
+        Retrieval runs on the shared thread pool; generation uses the chain's async interface.
+        requester (user id or client address) is the fairness key for the shared LLM key;
+        raises Overloaded if that key is saturated.
+        """
+        self._log_query(query, user_id, user_api_key, user_approved)
+
+        llm = self.select_llm(user_api_key)
+        if not llm:
+            return {"answer": "System is not fully initialized (missing API Key).", "source": "error"}
+
+        cache_key, cached = await run_blocking("retrieval", self.lookup_cached_answer, query, user_id, user_approved, retrieval_mode, filters)
+        if cached:
+            logger.debug("⚡ Answer cache hit")
+            return {"answer": cached["answer"], "source": "global_rag"}
+
+        def answer():
+            return self._aanswer(query, llm, cache_key, user_id, user_approved, retrieval_mode, filters, requester)
+
+        flight_key = self._flight_key(cache_key, llm, user_api_key)
+        if flight_key is None:
+            return await answer()
+        return await self.inflight.run(flight_key, answer)
+
+    async def _aanswer(self, query, llm, cache_key, user_id, user_approved, retrieval_mode, filters, requester):
+        async with self._admit(llm, requester):
+            docs, mode = await run_blocking("retrieval", self.retrieve, query, user_id, user_approved, retrieval_mode, filters)
+            if docs is None:
+                return {"answer": "Knowledge base is currently unavailable.", "source": "error"}
+
+            context = self.build_context(docs)
+            chain = self.prompt | llm | StrOutputParser()
+            async with stage_limit("llm"):
+                with span("llm"):
+                    response = await chain.ainvoke({"context": context.text, "question": query})
+        logger.debug("✅ Query completed - mode: %s", mode)
+        self._store_answer(cache_key, mode, response, context.docs)
+
+        return {"answer": response, "source": mode}
+
+    async def astream(self, query, user_id=None, user_api_key=None, user_approved=False, retrieval_mode=None, filters=None,
+                      requester=None):
+        """
+        Streaming version of aask().
+        Yields a "meta" event (mode, sources and context token stats) once retrieval is done, then "token"
+        events as the LLM produces them, then "done". Failures yield an "error" event; a saturated shared
+        LLM key yields an "error" event with code "busy" and retryAfter (seconds).
+        """
+        self._log_query(query, user_id, user_api_key, user_approved)
+
+        llm = self.select_llm(user_api_key)
+        if not llm:
+            yield {"type": "error", "message": "System is not fully initialized (missing API Key)."}
+            return
+
+        cache_key, cached = await run_blocking("retrieval", self.lookup_cached_answer, query, user_id, user_approved, retrieval_mode, filters)
+        if cached:
+            logger.debug("⚡ Answer cache hit")
+            yield {"type": "meta", "mode": "global_rag", "sources": cached["sources"]}
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done"}
+            return
+
+        def answer():
+            return self._astream_answer(query, llm, cache_key, user_id, user_approved, retrieval_mode, filters, requester)
+
+        flight_key = self._flight_key(cache_key, llm, user_api_key)
+        events = answer() if flight_key is None else self.inflight.stream(flight_key, answer)
+        async for event in events:
+            yield event
+
+    async def _astream_answer(self, query, llm, cache_key, user_id, user_approved, retrieval_mode, filters, requester):
+        tokens = []
+        try:
+            async with self._admit(llm, requester):
+                docs, mode = await run_blocking("retrieval", self.retrieve, query, user_id, user_approved, retrieval_mode, filters)
+                if docs is None:
+                    yield {"type": "error", "message": "Knowledge base is currently unavailable."}
+                    return
+                context = self.build_context(docs)
+                yield {"type": "meta", "mode": mode, "sources": self.describe_sources(context.docs), "context": context.stats}
+
+                chain = self.prompt | llm | StrOutputParser()
+                async with stage_limit("llm"):
+                    started = time.perf_counter()
+                    with span("llm"):
+                        async for token in chain.astream({"context": context.text, "question": query}):
+                            if token:
+                                if not tokens:
+                                    record("llm_first_token", time.perf_counter() - started)
+                                tokens.append(token)
+                                yield {"type": "token", "text": token}
+        except Overloaded as e:
+            yield {"type": "error", "code": "busy", "message": str(e), "retryAfter": e.retry_after}
+            return
+        logger.debug("✅ Streamed query completed - mode: %s", mode)
+        self._store_answer(cache_key, mode, "".join(tokens), context.docs)
+        yield {"type": "done"}
+
+    def _flight_key(self, cache_key, llm, user_api_key=None):
+        """
+        Requests on the shared indexes coalesce on (index version, access tier, normalized
+        question, key). Shared-key requests coalesce across users; a personal key only
+        with requests on that same key, so no one's quota pays for another user's answer.
+        """
+        if cache_key is None or not COALESCE_REQUESTS:
+            return None
+        version, tier, query, _ = cache_key
+        key = "shared" if llm is self.llm else key_fingerprint(user_api_key)
+        return version, tier, normalize_query(query), key
+
+    def _admit(self, llm, requester):
+        # Only the shared key is queued; personal keys spend their own quota
+        return self.admission.slot(requester) if llm is self.llm else nullcontext()
+
+    def _store_answer(self, cache_key, mode, answer, docs):
+        if cache_key and mode == "global_rag" and answer:
+            self.answer_cache.put(*cache_key, {"answer": answer, "sources": self.describe_sources(docs)})
+
 # For testing
 if __name__ == "__main__":
+    from telemetry import configure_logging
+    configure_logging()
     bot = RAGService()
     if bot.llm and bot.global_retriever:
         print(bot.ask("What is AdroIT?"))
@@ -0,0 +1,239 @@
+import os
+import re
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from chunk_store import keyword_search, filter_positions
+from telemetry import span
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))  # chunks fetched per index
+RETRIEVAL_TOP_N = int(os.getenv("RETRIEVAL_TOP_N", "6"))  # chunks kept after merging
+RETRIEVAL_MERGE = os.getenv("RETRIEVAL_MERGE", "score")  # "score" or "rrf"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # default when a request doesn't pick one
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid", "auto")
+AUTO_SPARSE_MAX_TERMS = int(os.getenv("AUTO_SPARSE_MAX_TERMS", "3"))  # auto: keyword-only up to this many terms
+RRF_K = 60
+
+# Separate from concurrency.executor: retrieval already runs on that pool,
+# and fanning out into the same bounded pool could deadlock under load.
+search_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_THREADS", "8")), thread_name_prefix="faiss-search"
+)
+
+
+def chunk_key(doc):
+    """Identity of a chunk for de-duplication: its docstore id, else a content hash."""
+    if getattr(doc, "id", None):
+        return doc.id
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def with_score(doc, index_name, score=None, bm25=None):
+    # Copy: documents returned by FAISS are the docstore's own objects
+    metadata = {**doc.metadata, "index": index_name}
+    if score is not None:
+        metadata["score"] = float(score)
+    if bm25 is not None:
+        metadata["bm25"] = float(bm25)
+    return Document(id=getattr(doc, "id", None), page_content=doc.page_content, metadata=metadata)
+
+
+def is_keyword_query(query):
+    """Short queries (titles, tags, names) that auto mode answers from BM25 alone."""
+    return 0 < len(re.findall(r"\w+", query)) <= AUTO_SPARSE_MAX_TERMS
+
+
+def skips_embedding(query, mode):
+    """Whether a query in this mode may be answered without embedding it."""
+    return mode == "sparse" or (mode == "auto" and is_keyword_query(query))
+
+
+def filtered_vector_search(store, vector, k, positions):
+    """
+    Vector search restricted to the given FAISS positions. The positions are
+    passed to FAISS as an IDSelector, so only matching vectors are scored.
+    Returns [(Document, distance)] like similarity_search_with_score_by_vector.
+    """
+    if not positions:
+        return []
+    query = np.array([vector], dtype=np.float32)
+    if getattr(store, "_normalize_L2", False):
+        faiss.normalize_L2(query)
+    index = store.index
+    selector = faiss.IDSelectorBatch(np.asarray(positions, dtype=np.int64))
+    ivf = faiss.try_extract_index_ivf(index)
+    params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe) if ivf else faiss.SearchParameters(sel=selector)
+    try:
+        distances, found = index.search(query, min(k, len(positions)), params=params)
+    except RuntimeError:
+        # Index types without selector support: over-fetch and drop non-matching hits
+        allowed = set(positions)
+        distances, found = index.search(query, min(index.ntotal, k * 20))
+        hits = [(d, i) for d, i in zip(distances[0], found[0]) if i in allowed][:k]
+        distances, found = [[d for d, _ in hits]], [[i for _, i in hits]]
+
+    results = []
+    for distance, position in zip(distances[0], found[0]):
+        if position == -1:
+            continue
+        doc = store.docstore.search(store.index_to_docstore_id[int(position)])
+        results.append((doc, float(distance)))
+    return results
+
+
+class MultiIndexRetriever:
+    """
+    Searches one or more FAISS vector stores built with the same embedding model.
+
+    mode picks the retrieval method:
+      dense   the query is embedded once and all indexes are searched concurrently
+      sparse  BM25 keyword search over each store's chunk file; no embedding
+      hybrid  dense and sparse hit lists fused by reciprocal rank
+      auto    sparse for short keyword queries (falling back to hybrid if it
+              finds nothing), hybrid otherwise
+    Stores without a keyword index (old pickled indexes) are searched dense-only.
+    filters ({field: value or [values]}, see chunk_store.filter_positions)
+    restrict every search to matching chunks before scoring.
+    Hits are merged and de-duplicated; returned Documents carry the dense
+    distance in metadata["score"] (lower is closer) and/or the BM25 score in
+    metadata["bm25"] (higher is better).
+    """
+
+    def __init__(self, vectorstores, embeddings, k=RETRIEVAL_K, top_n=RETRIEVAL_TOP_N, merge=RETRIEVAL_MERGE, mode=None, filters=None):
+        self.vectorstores = vectorstores  # {index name: FAISS}
+        self.embeddings = embeddings
+        self.k = k
+        self.top_n = top_n
+        self.merge = merge
+        self.mode = mode or RETRIEVAL_MODE
+        self.filters = filters or None
+        self._positions = {}  # store name -> allowed positions (filters don't depend on the query)
+
+    def invoke(self, query):
+        mode = self.mode
+        if mode == "dense":
+            return self.search_by_vector(self._embed(query))
+
+        if skips_embedding(query, mode):
+            sparse = self._sparse_results(query)
+            if sparse is not None and (mode == "sparse" or any(hits for _, _, hits in sparse)):
+                return self._merge(sparse)
+            if mode == "sparse":
+                # Some store has no keyword index: search everything dense instead
+                return self.search_by_vector(self._embed(query))
+
+        dense = self._dense_results(self._embed(query))
+        sparse = self._sparse_results(query, partial=True)
+        return self._merge(dense + sparse)
+
+    def search_by_vector(self, vector):
+        return self._merge(self._dense_results(vector))
+
+    def _embed(self, query):
+        with span("embedding"):
+            return self.embeddings.embed_query(query)
+
+    def _map_stores(self, search):
+        # search(name, store) runs for every store, concurrently if there are several
+        stores = list(self.vectorstores.items())
+        if len(stores) == 1:
+            name, store = stores[0]
+            return [(name, search(name, store))]
+        futures = [
+            (name, search_executor.submit(contextvars.copy_context().run, search, name, store))
+            for name, store in stores
+        ]
+        return [(name, future.result()) for name, future in futures]
+
+    def _filter_positions(self, name, store):
+        """Allowed FAISS positions in a store, or None if unfiltered."""
+        if not self.filters:
+            return None
+        if name not in self._positions:
+            self._positions[name] = filter_positions(store, self.filters)
+        return self._positions[name]
+
+    def _dense_results(self, vector):
+        def search(name, store):
+            positions = self._filter_positions(name, store)
+            if positions is not None:
+                return filtered_vector_search(store, vector, self.k, positions)
+            return store.similarity_search_with_score_by_vector(vector, k=self.k)
+
+        with span("vector_search"):
+            return [(name, "dense", hits) for name, hits in self._map_stores(search)]
+
+    def _sparse_results(self, query, partial=False):
+        """
+        [(name, "sparse", hits)] per store. Returns None if any store lacks a
+        keyword index, unless partial=True (then such stores are left out).
+        """
+        with span("keyword_search"):
+            results = self._map_stores(
+                lambda name, store: keyword_search(store, query, self.k, self._filter_positions(name, store)))
+        if not partial and any(hits is None for _, hits in results):
+            return None
+        return [(name, "sparse", hits) for name, hits in results if hits is not None]
+
+    def _merge(self, results):
+        if self.merge == "rrf" or any(kind == "sparse" for _, kind, _ in results):
+            # BM25 scores aren't comparable with distances (or across stores): fuse by rank
+            ranked = self._reciprocal_rank_fusion(results)
+        else:
+            ranked = sorted(
+                ((doc, name, {"score": score}) for name, _, hits in results for doc, score in hits),
+                key=lambda hit: hit[2]["score"],
+            )
+
+        unique_docs = []
+        seen = set()
+        for doc, name, scores in ranked:
+            key = chunk_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            unique_docs.append(with_score(doc, name, **scores))
+            if len(unique_docs) >= self.top_n:
+                break
+        return unique_docs
+
+    def _reciprocal_rank_fusion(self, results):
+        # Returns (doc, index, scores) ordered by fused rank; scores keep the best
+        # distance and BM25 score seen for the chunk
+        fused = {}
+        for name, kind, hits in results:
+            field = "score" if kind == "dense" else "bm25"
+            for rank, (doc, score) in enumerate(hits):
+                key = chunk_key(doc)
+                entry = fused.setdefault(key, [0.0, doc, name, {}])
+                entry[0] += 1.0 / (RRF_K + rank + 1)
+                best = entry[3].get(field)
+                if best is None or (score < best if field == "score" else score > best):
+                    entry[3][field] = score
+        ordered = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)
+        return [(doc, name, scores) for _, doc, name, scores in ordered]
+
+
+class UserFilesRetriever(MultiIndexRetriever):
+    """
+    Searches one user's uploads: one store per file from the shared content
+    store, keyed by the user's own path to it. Only the stores passed in are
+    searched, and hits are labeled with this user's path (the stored chunks
+    are shared with everyone who uploaded the same file, under any name).
+    """
+
+    def _merge(self, results):
+        docs = super()._merge(results)
+        for doc in docs:
+            doc.metadata["source"] = doc.metadata["index"]
+            doc.metadata["index"] = "user"
+        return docs
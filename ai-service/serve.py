@@ -0,0 +1,386 @@
+import os
+import sys
+import json
+import math
+import bisect
+import shutil
+import asyncio
+import hashlib
+import logging
+import argparse
+import itertools
+import tempfile
+import threading
+import subprocess
+from contextlib import asynccontextmanager
+import httpx
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from query_cache import normalize_query
+import admission
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+AI_WORKERS = int(os.getenv("AI_WORKERS", str(min(4, os.cpu_count() or 1))))
+ROUTER_VIRTUAL_NODES = 64  # points per worker on the hash ring; more = more even spread
+WORKER_INDEX_POLL_SECONDS = os.getenv("INDEX_POLL_SECONDS", "5")
+SUPERVISE_SECONDS = 1.0
+
+# Headers that describe one HTTP hop, not the request
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "host", "content-length"}
+
+logger = logging.getLogger(__name__)
+
+# Multi-worker deployment:
+#
+#   python serve.py --workers 4 --port 8000
+#
+# starts one embedding server process (the only copy of the model, see
+# embedding_server.py), N uvicorn workers running main:app on Unix sockets,
+# and a router on --port that forwards each request to a worker:
+#   - requests carrying a userId go to the worker that owns the user on a
+#     consistent hash ring, so a user's private files stay loaded in one
+#     worker's cache (and only 1/N of users move if a worker goes away)
+#   - anonymous chats are placed by the normalized question, so repeats hit
+#     one worker's answer cache and in-flight coalescing
+#   - /ingest goes to worker 0, which also runs the change-stream watcher
+#     (another worker while it's down: ingest.shared_index_lock() keeps the
+#     syncs apart); every worker picks up the new shared index version by
+#     polling its pointer file (INDEX_POLL_SECONDS)
+# The global and resources indexes are opened memory-mapped and read-only in
+# every worker, so their pages are shared through the OS page cache.
+# Needs Unix domain sockets (Linux, macOS); `uvicorn main:app` still runs a
+# single process anywhere.
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring over worker ids."""
+
+    def __init__(self, nodes, virtual_nodes=ROUTER_VIRTUAL_NODES):
+        self._ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(virtual_nodes))
+        self._points = [point for point, _ in self._ring]
+
+    def lookup(self, key, alive=None):
+        """The node owning key; if it isn't in alive, the next live node clockwise (None if none)."""
+        start = bisect.bisect(self._points, _hash(key))
+        for i in range(len(self._ring)):
+            node = self._ring[(start + i) % len(self._ring)][1]
+            if alive is None or node in alive:
+                return node
+        return None
+
+
+class Worker:
+    """One uvicorn process serving main:app on a Unix socket."""
+
+    def __init__(self, index, socket_path, env):
+        self.index = index
+        self.socket_path = socket_path
+        self.env = env
+        self.process = None
+        self.ready = False  # warmed up; set by the router's readiness checks
+        self.restarts = 0
+        self.client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=socket_path),
+                                        base_url="http://worker", timeout=None)
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.ready = False
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--uds", self.socket_path, "--no-access-log"],
+            cwd=BASE_DIR, env=self.env,
+        )
+        logger.info("👷 Worker %d started (pid %d)", self.index, self.process.pid)
+
+
+class Cluster:
+    """The embedding server and N workers; restarts any process that exits."""
+
+    def __init__(self, n_workers):
+        self.run_dir = tempfile.mkdtemp(prefix="ai-service-")
+        self.embedding_socket = os.path.join(self.run_dir, "embeddings.sock")
+        authkey = os.urandom(16).hex()
+
+        server_env = {**os.environ, "EMBEDDING_SERVER_AUTHKEY": authkey}
+        server_env.pop("EMBEDDING_SERVER", None)
+        self.embedding_command = [sys.executable, os.path.join(BASE_DIR, "embedding_server.py"), self.embedding_socket]
+        self.embedding_env = server_env
+        self.embedding_server = None
+
+        worker_env = {
+            **os.environ,
+            "EMBEDDING_SERVER": self.embedding_socket,
+            "EMBEDDING_SERVER_AUTHKEY": authkey,
+            "INDEX_POLL_SECONDS": WORKER_INDEX_POLL_SECONDS,
+            # The shared Gemini key's limits are for the whole deployment, not per worker
+            "SHARED_LLM_CONCURRENCY": str(math.ceil(admission.SHARED_LLM_CONCURRENCY / n_workers)),
+            "SHARED_LLM_QUEUE_SIZE": str(math.ceil(admission.SHARED_LLM_QUEUE_SIZE / n_workers)),
+        }
+        self.workers = []
+        for index in range(n_workers):
+            env = dict(worker_env)
+            if index > 0:
+                env["RESOURCES_CHANGE_STREAM"] = "false"  # one change-stream watcher is enough
+            self.workers.append(Worker(index, os.path.join(self.run_dir, f"worker-{index}.sock"), env))
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._start_embedding_server()
+        for worker in self.workers:
+            worker.start()
+        threading.Thread(target=self._supervise, name="supervisor", daemon=True).start()
+
+    def _start_embedding_server(self):
+        if os.path.exists(self.embedding_socket):
+            os.remove(self.embedding_socket)
+        self.embedding_server = subprocess.Popen(self.embedding_command, cwd=BASE_DIR, env=self.embedding_env)
+        logger.info("🧠 Embedding server started (pid %d)", self.embedding_server.pid)
+
+    def _supervise(self):
+        while not self._stopping.wait(SUPERVISE_SECONDS):
+            if self.embedding_server.poll() is not None:
+                logger.error("❌ Embedding server exited (code %s), restarting", self.embedding_server.returncode)
+                self._start_embedding_server()
+            for worker in self.workers:
+                if not worker.alive:
+                    logger.error("❌ Worker %d exited (code %s), restarting", worker.index, worker.process.returncode)
+                    worker.restarts += 1
+                    worker.start()
+
+    def stop(self):
+        self._stopping.set()
+        processes = [p for p in [w.process for w in self.workers] + [self.embedding_server] if p]
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+
+async def routing_key(request, body):
+    """
+    "user:<userId>" for requests about a user (JSON or form field, or query
+    parameter), "q:<normalized question>" for anonymous chats, else None.
+    """
+    content_type = request.headers.get("content-type", "")
+    fields = {}
+    if content_type.startswith("application/json"):
+        try:
+            fields = json.loads(body or b"{}")
+        except ValueError:
+            pass
+    elif content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        fields = await request.form()  # parsed from the already-read body
+    if not hasattr(fields, "get"):
+        fields = {}  # e.g. a JSON list
+    user_id = fields.get("userId") or request.query_params.get("userId")
+    if isinstance(user_id, str) and user_id:
+        return f"user:{user_id}"
+    message = fields.get("message")
+    if isinstance(message, str):
+        return f"q:{normalize_query(message)}"
+    return None
+
+
+def merge_metrics(texts):
+    """Merges the workers' Prometheus texts into one, adding a worker label to every sample."""
+    families = {}  # name -> [help/type lines, samples]
+    for index, text in texts:
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                family = line.split()[2]
+                entry = families.setdefault(family, [[], []])
+                if line not in entry[0]:
+                    entry[0].append(line)
+            elif line:
+                name, _, rest = line.partition(" ")
+                if "{" in name:
+                    name = name.replace("{", f'{{worker="{index}",', 1)
+                else:
+                    name = f'{name}{{worker="{index}"}}'
+                families.setdefault(family or name, [[], []])[1].append(f"{name} {rest}")
+    return "\n".join(line for header, samples in families.values() for line in header + samples) + "\n"
+
+
+def create_router(cluster):
+    workers = cluster.workers
+    ring = HashRing([worker.index for worker in workers])
+    round_robin = itertools.count()
+
+    async def check_readiness():
+        # A (re)started worker takes no routed traffic until it has warmed up
+        while True:
+            for worker in workers:
+                if worker.alive and not worker.ready:
+                    try:
+                        response = await worker.client.get("/readyz", timeout=2)
+                        worker.ready = response.status_code == 200
+                    except httpx.HTTPError:
+                        pass
+            await asyncio.sleep(SUPERVISE_SECONDS)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        task = asyncio.create_task(check_readiness())
+        yield
+        task.cancel()
+        for worker in workers:
+            await worker.client.aclose()
+        # Here rather than after uvicorn.run: uvicorn re-raises SIGTERM on exit
+        await asyncio.to_thread(cluster.stop)
+
+    app = FastAPI(lifespan=lifespan)
+
+    def live_workers():
+        return [worker for worker in workers if worker.alive]
+
+    def pick(key):
+        """The worker for key: its owner on the ring, skipping workers that are down or still warming up."""
+        alive = [worker for worker in live_workers() if worker.ready] or live_workers()
+        if not alive:
+            return None
+        if key is None:
+            return alive[next(round_robin) % len(alive)]
+        return workers[ring.lookup(key, {worker.index for worker in alive})]
+
+    async def forward(worker, request, body):
+        # Workers only see the router's Unix socket, so they take the caller's
+        # address from X-Forwarded-For; never pass on what the client sent
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_HEADERS | {"x-forwarded-for"}]
+        address = admission.client_address(request)
+        if address:
+            headers.append(("x-forwarded-for", address))
+        url = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        upstream = worker.client.build_request(request.method, url, headers=headers, content=body)
+        try:
+            response = await worker.client.send(upstream, stream=True)
+        except httpx.TransportError as e:
+            logger.warning("⚠️ Worker %d unreachable: %s", worker.index, e)
+            worker.ready = False
+            return JSONResponse({"detail": "AI worker unavailable"}, status_code=503, headers={"Retry-After": "1"})
+        response_headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+        response_headers["X-AI-Worker"] = str(worker.index)
+        return StreamingResponse(response.aiter_raw(), status_code=response.status_code, headers=response_headers,
+                                 background=BackgroundTask(response.aclose))
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok", "workers": len(live_workers())}
+
+    @app.get("/readyz")
+    async def readyz():
+        """Ready once every worker is ready."""
+        async def worker_state(worker):
+            state = {"worker": worker.index, "pid": worker.process.pid if worker.process else None,
+                     "restarts": worker.restarts}
+            try:
+                response = await worker.client.get("/readyz", timeout=2)
+                return {**state, **response.json(), "ready": response.status_code == 200}
+            except (httpx.HTTPError, ValueError):
+                return {**state, "status": "down", "ready": False}
+
+        states = await asyncio.gather(*(worker_state(worker) for worker in workers))
+        ready = all(state["ready"] for state in states)
+        return JSONResponse({"status": "ready" if ready else "starting", "workers": states},
+                            status_code=200 if ready else 503)
+
+    @app.get("/metrics")
+    async def metrics():
+        async def fetch(worker):
+            try:
+                return worker.index, (await worker.client.get("/metrics", timeout=5)).text
+            except httpx.HTTPError:
+                return worker.index, ""
+
+        texts = await asyncio.gather(*(fetch(worker) for worker in live_workers()))
+        return PlainTextResponse(merge_metrics(texts), media_type="text/plain; version=0.0.4")
+
+    @app.post("/user/cache/invalidate")
+    async def invalidate_user_cache(request: Request):
+        """Broadcast: any worker may have cached the user's context (e.g. after a restart moved them)."""
+        body = await request.body()
+        headers = {"content-type": request.headers.get("content-type", "application/json")}
+
+        async def invalidate(worker):
+            try:
+                response = await worker.client.post("/user/cache/invalidate", content=body, headers=headers, timeout=5)
+            except httpx.HTTPError as e:
+                return {"worker": worker.index, "ok": False, "error": str(e) or type(e).__name__}
+            return {"worker": worker.index, "ok": response.is_success, "statusCode": response.status_code}
+
+        targets = live_workers()
+        if not targets:
+            return JSONResponse({"detail": "No AI workers running"}, status_code=503, headers={"Retry-After": "1"})
+        results = await asyncio.gather(*(invalidate(worker) for worker in targets))
+        ok = all(result["ok"] for result in results)
+        return JSONResponse({"status": "success" if ok else "partial", "workers": results}, status_code=200 if ok else 502)
+
+    @app.get("/user/ingest/status/{job_id}")
+    async def ingest_status(job_id: str, request: Request):
+        # Jobs live in the worker that accepted the upload
+        for worker in live_workers():
+            try:
+                response = await worker.client.get(f"/user/ingest/status/{job_id}", timeout=5)
+            except httpx.HTTPError:
+                continue
+            if response.status_code != 404:
+                return JSONResponse(response.json(), status_code=response.status_code,
+                                    headers={"X-AI-Worker": str(worker.index)})
+        return JSONResponse({"detail": "Job not found"}, status_code=404)
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+    async def route(path: str, request: Request):
+        body = await request.body()
+        if path == "ingest" and workers[0].alive:
+            worker = workers[0]  # runs the change-stream watcher, so both syncs share its ingest_lock
+        else:
+            worker = pick("ingest" if path == "ingest" else await routing_key(request, body))
+        if worker is None:
+            return JSONResponse({"detail": "No AI workers running"}, status_code=503, headers={"Retry-After": "1"})
+        return await forward(worker, request, body)
+
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+    from telemetry import configure_logging
+
+    parser = argparse.ArgumentParser(description="Run the AI service as N worker processes behind a userId-affinity router.")
+    parser.add_argument("--workers", type=int, default=AI_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per proxied request otherwise
+    cluster = Cluster(args.workers)
+    cluster.start()
+    logger.info("🚦 Routing port %d to %d workers", args.port, args.workers)
+    try:
+        uvicorn.run(create_router(cluster), host=args.host, port=args.port)
+    finally:
+        cluster.stop()  # no-op if the router's shutdown already stopped it
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupState:
+    """
+    Tracks the service's background warm-up: how long each step took, and
+    whether it finished (done) and succeeded (ok). Created when main.py is
+    imported, so the first step covers importing the app itself.
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.steps = {}  # step -> seconds, in order
+        self.ok = False
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def record(self, name, seconds):
+        self.steps[name] = round(seconds, 3)
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def finish(self, error=None):
+        self.ok = error is None
+        self.error = str(error) if error else None
+        self.record("total", time.perf_counter() - self.created)
+        self._done.set()
+        breakdown = " ".join(f"{name}={seconds:.2f}s" for name, seconds in self.steps.items())
+        if self.ok:
+            logger.info("🚀 Warm-up complete [%s]", breakdown)
+        else:
+            logger.error("❌ Warm-up failed: %s [%s]", self.error, breakdown)
+
+    def to_dict(self):
+        status = ("ready" if self.ok else "failed") if self.done else "starting"
+        return {"status": status, "error": self.error, "steps": dict(self.steps)}
@@ -0,0 +1,222 @@
+import os
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Sets up the root logger once per process (service, CLI scripts and worker processes)."""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    root.setLevel(level)
+
+
+# ---------------------------------------------------------------------------
+# Metrics (Prometheus text exposition format)
+# ---------------------------------------------------------------------------
+
+def _label_text(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(dict(key))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            bucket = bisect.bisect_left(self.buckets, value)
+            if bucket < len(self.buckets):
+                series[bucket] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = dict(key)
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_text({**labels, 'le': '+Inf'})} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(labels)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("ai_request_duration_seconds", "End-to-end chat request latency")
+STAGE_SECONDS = Histogram("ai_stage_duration_seconds", "Latency of one stage of a request")
+REQUESTS_TOTAL = Counter("ai_requests_total", "Chat requests by endpoint and outcome")
+CONTEXT_TOKENS = Counter("ai_context_tokens_total", "Estimated prompt context tokens, retrieved vs sent")
+INGEST_JOBS_TOTAL = Counter("ai_ingest_jobs_total", "User ingestion jobs by final status")
+_metrics = [REQUEST_SECONDS, STAGE_SECONDS, REQUESTS_TOTAL, CONTEXT_TOKENS, INGEST_JOBS_TOTAL]
+
+_caches = {}  # name -> stats() callable returning LRUCache-style counters
+
+
+def register_metric(metric):
+    """Adds a Counter or Histogram defined in another module to /metrics; returns it."""
+    _metrics.append(metric)
+    return metric
+
+
+def register_cache(name, stats):
+    """Exposes a cache's hit/miss/size counters (stats() -> dict) on /metrics."""
+    _caches[name] = stats
+
+
+def render_metrics():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    cache_series = {"hits": [], "misses": [], "entries": [], "evictions": [], "hit_ratio": []}
+    for name, stats in sorted(_caches.items()):
+        try:
+            values = stats()
+        except Exception as e:
+            logger.warning("Could not read stats of cache %s: %s", name, e)
+            continue
+        lookups = values.get("hits", 0) + values.get("misses", 0)
+        values = {**values, "hit_ratio": values.get("hits", 0) / lookups if lookups else 0.0}
+        for field, series in cache_series.items():
+            series.append(f'{{cache="{name}"}} {values.get(field, 0)}')
+    for field, series in cache_series.items():
+        kind = "counter" if field in ("hits", "misses", "evictions") else "gauge"
+        metric = f"ai_cache_{field}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(metric + entry for entry in series)
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Request traces
+# ---------------------------------------------------------------------------
+
+_current_trace = contextvars.ContextVar("ai_request_trace", default=None)
+_trace_listeners = []
+
+
+class RequestTrace:
+    """Spans recorded while handling one request (across the event loop and worker threads)."""
+
+    def __init__(self, endpoint):
+        self.id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.outcome = "ok"
+        self.spans = []  # (stage, seconds); list.append is thread-safe
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def stage_totals(self):
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def breakdown(self):
+        return " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.stage_totals().items())
+
+
+def add_trace_listener(callback):
+    """Calls callback(trace) for every finished request trace (e.g. the benchmark's per-stage percentiles)."""
+    _trace_listeners.append(callback)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record(stage, seconds):
+    """Records a stage duration measured by the caller."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Times a stage of the current request (also recorded outside requests, e.g. ingestion)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def request_trace(endpoint):
+    """Starts a trace for one request; logs its span breakdown and records its latency."""
+    trace = RequestTrace(endpoint)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        if trace.outcome == "ok":  # keep a more specific outcome set by the handler (e.g. "busy")
+            trace.outcome = "error"
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            pass  # finished in a different context (e.g. a streaming response task)
+        trace.elapsed = elapsed = time.perf_counter() - trace.started
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        REQUESTS_TOTAL.inc(endpoint=endpoint, outcome=trace.outcome)
+        logger.info("%s %s %s in %.1fms [%s]", endpoint, trace.id, trace.outcome, elapsed * 1000, trace.breakdown())
+        for listener in _trace_listeners:
+            listener(trace)
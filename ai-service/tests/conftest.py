@@ -0,0 +1,60 @@
+"""
+Shared fixtures. The suite runs offline against fakes: FakeEmbeddings for
+MiniLM and mongomock for MongoDB. Run from ai-service/:
+    pip install -r tests/requirements.txt
+    python -m pytest -q tests
+"""
+import os
+import re
+import sys
+import hashlib
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words unit vectors: texts sharing words are close, so searches behave sensibly."""
+
+    def __init__(self, size=64):
+        self.size = size
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.size] += 1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def fake_embeddings():
+    return FakeEmbeddings()
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An in-memory MongoDB; every MongoClient(...) in the service returns it."""
+    mongomock = pytest.importorskip("mongomock")
+    import pymongo
+
+    client = mongomock.MongoClient("mongodb://localhost:27017/club-members")
+    factory = lambda *args, **kwargs: client
+    monkeypatch.setattr(pymongo, "MongoClient", factory)
+    for name in ("ingest", "user_context", "main"):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, "MongoClient"):
+            monkeypatch.setattr(module, "MongoClient", factory)
+    return client
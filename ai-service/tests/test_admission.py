@@ -0,0 +1,161 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from admission import AdmissionQueue, Overloaded, SingleFlight, client_address
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_queue_serves_requesters_round_robin():
+    async def scenario():
+        queue = AdmissionQueue(capacity=1, max_queue=10, max_per_user=5, timeout=5)
+        order = []
+        release = asyncio.Event()
+
+        async def hold():
+            async with queue.slot("holder"):
+                await release.wait()
+
+        async def request(requester):
+            async with queue.slot(requester):
+                order.append(requester)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        # A floods the queue before B and C arrive
+        waiting = [asyncio.create_task(request(r)) for r in ("A", "A", "A", "B", "C")]
+        await asyncio.sleep(0)
+        assert queue.stats()["queued"] == 5
+        release.set()
+        await asyncio.gather(holder, *waiting)
+        return order, queue.stats()
+
+    order, stats = run(scenario())
+    assert order == ["A", "B", "C", "A", "A"]
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_queue_rejects_past_per_user_and_total_limits():
+    async def scenario():
+        queue = AdmissionQueue(capacity=1, max_queue=3, max_per_user=2, timeout=5)
+        release = asyncio.Event()
+
+        async def hold(requester):
+            async with queue.slot(requester):
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold("holder"))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(hold("A")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as user_limit:
+            await queue._acquire("A")
+        tasks.append(asyncio.create_task(hold(None)))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as queue_full:
+            await queue._acquire("B")
+        release.set()
+        await asyncio.gather(*tasks)
+        return user_limit.value, queue_full.value
+
+    user_limit, queue_full = run(scenario())
+    assert user_limit.reason == "user_limit"
+    assert queue_full.reason == "queue_full" and queue_full.retry_after > 0
+
+
+def test_queue_times_out_and_frees_its_place():
+    async def scenario():
+        queue = AdmissionQueue(capacity=1, max_queue=10, max_per_user=5, timeout=0.05)
+        async with queue.slot("holder"):
+            with pytest.raises(Overloaded) as timeout:
+                async with queue.slot("A"):
+                    pass
+            assert queue.stats()["queued"] == 0
+        return timeout.value, queue.stats()
+
+    timeout, stats = run(scenario())
+    assert timeout.reason == "timeout"
+    assert stats["active"] == 0
+
+
+def test_single_flight_runs_identical_work_once():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def answer():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flights.run("key", answer) for _ in range(5)))
+        return results, calls, len(flights)
+
+    results, calls, inflight = run(scenario())
+    assert results == ["answer"] * 5
+    assert calls == 1 and inflight == 0
+
+
+def test_single_flight_propagates_errors_to_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("llm down")
+
+        results = await asyncio.gather(*(flights.run("key", fail) for _ in range(3)), return_exceptions=True)
+        # The failed flight is gone: the next caller starts fresh work
+        retried = await flights.run("key", lambda: asyncio.sleep(0, result="ok"))
+        return results, retried
+
+    results, retried = run(scenario())
+    assert all(isinstance(r, ValueError) and str(r) == "llm down" for r in results)
+    assert retried == "ok"
+
+
+def test_single_flight_stream_replays_events_and_errors():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def events():
+            nonlocal calls
+            calls += 1
+            for token in ("a", "b", "c"):
+                await asyncio.sleep(0.005)
+                yield token
+            raise RuntimeError("cut off")
+
+        async def consume():
+            received = []
+            try:
+                async for event in flights.stream("key", events):
+                    received.append(event)
+            except RuntimeError as e:
+                received.append(str(e))
+            return received
+
+        first = asyncio.create_task(consume())
+        await asyncio.sleep(0.012)  # joins late, after some events were published
+        second = await consume()
+        return await first, second, calls
+
+    first, second, calls = run(scenario())
+    assert first == second == ["a", "b", "c", "cut off"]
+    assert calls == 1
+
+
+def test_client_address_trusts_forwarded_for_only_from_proxies():
+    def request(peer, forwarded):
+        return SimpleNamespace(client=SimpleNamespace(host=peer) if peer else None,
+                               headers={"x-forwarded-for": forwarded})
+
+    proxies = {"10.0.0.2"}
+    assert client_address(request("203.0.113.9", "1.2.3.4"), proxies) == "203.0.113.9"
+    assert client_address(request("10.0.0.2", "1.2.3.4, 198.51.100.7"), proxies) == "198.51.100.7"
+    assert client_address(request(None, "198.51.100.7"), proxies) == "198.51.100.7"  # router over a Unix socket
+    assert client_address(request("10.0.0.2", ""), proxies) == "10.0.0.2"
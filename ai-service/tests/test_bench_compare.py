@@ -0,0 +1,53 @@
+import json
+import pytest
+from bench.compare import compare, compare_files, direction, main
+
+BASELINE = {
+    "meta": {"size": "small", "seed": 1, "git_revision": "abc"},
+    "chat": {"p95_ms": 100.0, "throughput_rps": 50.0, "errors": 0, "requests": 200},
+    "ingest": {"seconds": 10.0},
+}
+
+
+def report(**changes):
+    current = json.loads(json.dumps(BASELINE))
+    for path, value in changes.items():
+        section, metric = path.split("__")
+        current[section][metric] = value
+    return current
+
+
+def verdicts(current, tolerance=0.10):
+    return {metric: verdict for metric, _, _, _, verdict in compare(BASELINE, current, tolerance)}
+
+
+def test_direction_by_metric_suffix():
+    assert direction("chat.p95_ms") == -1
+    assert direction("chat.throughput_rps") == 1
+    assert direction("chat.requests") == 0  # counts aren't compared
+
+
+def test_slower_latency_and_lower_throughput_are_regressions():
+    assert verdicts(report(chat__p95_ms=120.0, chat__throughput_rps=40.0)) == {
+        "chat.p95_ms": "regression", "chat.throughput_rps": "regression", "chat.errors": "ok", "ingest.seconds": "ok"}
+
+
+def test_changes_within_tolerance_are_ok_and_gains_are_improvements():
+    rows = verdicts(report(chat__p95_ms=105.0, ingest__seconds=5.0))
+    assert rows["chat.p95_ms"] == "ok" and rows["ingest.seconds"] == "improvement"
+
+
+def test_any_new_error_is_a_regression_despite_a_zero_baseline():
+    assert verdicts(report(chat__errors=1), tolerance=10)["chat.errors"] == "regression"
+
+
+@pytest.mark.parametrize("p95, exit_code", [(100.0, 0), (150.0, 1)])
+def test_cli_exit_code(tmp_path, capsys, p95, exit_code):
+    baseline, current = tmp_path / "baseline.json", tmp_path / "current.json"
+    baseline.write_text(json.dumps(BASELINE))
+    current.write_text(json.dumps(report(chat__p95_ms=p95)))
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(baseline), str(current)])
+    assert exit_info.value.code == exit_code
+    assert compare_files(str(baseline), str(current)) == exit_code
+    capsys.readouterr()
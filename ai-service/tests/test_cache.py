@@ -0,0 +1,71 @@
+import cache
+from cache import LRUCache, GenerationCounter
+
+
+def test_evicts_least_recently_used_past_max_entries():
+    lru = LRUCache(max_entries=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1  # b is now the oldest
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_evicts_by_weight_but_keeps_newest_entry():
+    lru = LRUCache(max_weight=10)
+    lru.put("a", "x", weight=4)
+    lru.put("b", "y", weight=4)
+    lru.put("c", "z", weight=4)
+    assert lru.get("a") is None
+    assert lru.stats()["weight"] == 8
+
+    lru.put("huge", "w", weight=50)
+    assert len(lru) == 1 and lru.get("huge") == "w"
+
+
+def test_replacing_a_key_updates_its_weight():
+    lru = LRUCache(max_weight=10)
+    lru.put("a", 1, weight=6)
+    lru.put("a", 2, weight=3)
+    assert lru.stats()["weight"] == 3
+    assert lru.pop("a") == 2 and lru.stats()["weight"] == 0
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = LRUCache(ttl=10)
+    lru.put("a", 1)
+    now[0] += 5
+    assert lru.get("a") == 1
+    now[0] += 6  # 11s after put: fixed TTL counts from the write
+    assert lru.get("a") is None
+    assert lru.stats()["misses"] == 1
+
+
+def test_sliding_ttl_counts_from_last_access(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = LRUCache(ttl=10, sliding=True)
+    lru.put("a", 1)
+    for _ in range(3):
+        now[0] += 8
+        assert lru.get("a") == 1
+    now[0] += 11
+    assert lru.get("a") is None
+
+
+def test_invalid_entries_are_dropped():
+    lru = LRUCache()
+    lru.put("a", {"generation": 1})
+    assert lru.get("a", is_valid=lambda v: v["generation"] == 2) is None
+    assert len(lru) == 0
+
+
+def test_generation_counter():
+    generations = GenerationCounter()
+    assert generations.get("u1") == 0
+    assert generations.bump("u1") == 1
+    assert generations.get("u1") == 1 and generations.get("u2") == 0
@@ -0,0 +1,36 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from admission import Overloaded
+from telemetry import REQUESTS_TOTAL
+
+
+class BusyBot:
+    async def aask(self, *args, **kwargs):
+        raise Overloaded("queue_full", retry_after=7)
+
+
+@pytest.fixture
+def service(monkeypatch, mongo):
+    import main
+
+    warm = threading.Event()
+    warm.set()
+    monkeypatch.setattr(main.startup, "_done", warm)
+    monkeypatch.setattr(main, "rag_bot", BusyBot())
+    monkeypatch.setattr(main.user_contexts, "load", lambda user_id: SimpleNamespace(api_key=None, approved=False))
+    return TestClient(main.app)  # not entered: the warm-up thread doesn't start
+
+
+def requests_total(outcome):
+    return REQUESTS_TOTAL._values.get((("endpoint", "chat"), ("outcome", outcome)), 0)
+
+
+def test_shed_chat_is_a_429_counted_as_busy(service):
+    busy, errors = requests_total("busy"), requests_total("error")
+    response = service.post("/chat", json={"message": "what is adroit?"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "7"
+    assert requests_total("busy") == busy + 1
+    assert requests_total("error") == errors
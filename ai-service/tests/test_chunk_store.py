@@ -0,0 +1,73 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+from chunk_store import save_store, load_store, keyword_search, filter_positions
+
+TEXTS = [
+    "Intro to neural networks and backpropagation",
+    "Docker containers for deploying web apps",
+    "Advanced neural network pruning techniques",
+    "Git branching workflows for web projects",
+]
+METADATAS = [
+    {"domain": "AI/ML", "difficulty": "Beginner", "tags": ["deep learning", "python"]},
+    {"domain": "DevOps", "difficulty": "Intermediate", "tags": ["docker"]},
+    {"domain": "AI/ML", "difficulty": "Advanced", "tags": ["Deep Learning"]},
+    {"domain": "Web", "difficulty": "Beginner"},
+]
+
+
+@pytest.fixture
+def store_dir(tmp_path, fake_embeddings):
+    vectorstore = FAISS.from_texts(TEXTS, fake_embeddings, metadatas=METADATAS, ids=[f"c{i}" for i in range(len(TEXTS))])
+    save_store(vectorstore, str(tmp_path))
+    return str(tmp_path)
+
+
+def test_round_trip_keeps_ids_text_and_metadata(store_dir, fake_embeddings):
+    store = load_store(store_dir, fake_embeddings)
+    assert len(store.index_to_docstore_id) == 4
+    hit, = store.similarity_search("docker containers", k=1)
+    assert hit.id == "c1" and hit.page_content == TEXTS[1]
+    assert hit.metadata["domain"] == "DevOps"
+
+    writable = load_store(store_dir, fake_embeddings, writable=True)
+    writable.delete(["c0"])
+    assert "c0" not in writable.index_to_docstore_id.values()
+
+
+def test_keyword_search_ranks_by_bm25(store_dir, fake_embeddings):
+    store = load_store(store_dir, fake_embeddings)
+    hits = keyword_search(store, "neural pruning", k=5)
+    assert [doc.id for doc, _ in hits] == ["c2", "c0"]
+    assert hits[0][1] > hits[1][1] > 0
+    assert keyword_search(store, "?!", k=5) == []
+
+
+def test_keyword_search_ignores_stopwords(store_dir, fake_embeddings):
+    store = load_store(store_dir, fake_embeddings)
+    # "for" appears in two chunks but carries no meaning
+    assert [doc.id for doc, _ in keyword_search(store, "what is docker for", k=5)] == ["c1"]
+    assert keyword_search(store, "what is it for", k=5) == []
+
+
+def test_keyword_search_within_positions(store_dir, fake_embeddings):
+    store = load_store(store_dir, fake_embeddings)
+    hits = keyword_search(store, "neural", k=5, positions=[0])
+    assert [doc.id for doc, _ in hits] == ["c0"]
+
+
+def test_keyword_search_needs_a_chunk_file(store_dir, fake_embeddings):
+    assert keyword_search(load_store(store_dir, fake_embeddings, writable=True), "neural", k=5) is None
+
+
+@pytest.mark.parametrize("writable", [False, True])
+def test_filter_positions(store_dir, fake_embeddings, writable):
+    # Writable stores have no stored facet lists and build them from the docstore
+    store = load_store(store_dir, fake_embeddings, writable=writable)
+    assert filter_positions(store, {"domain": "ai/ml"}) == [0, 2]
+    assert filter_positions(store, {"domain": "AI/ML", "difficulty": "advanced"}) == [2]
+    assert filter_positions(store, {"tags": "deep learning"}) == [0, 2]
+    assert filter_positions(store, {"difficulty": ["Beginner", "Intermediate"]}) == [0, 1, 3]
+    assert filter_positions(store, {"domain": "Cloud"}) == []
+    # A field no chunk carries doesn't apply to this store
+    assert filter_positions(store, {"type": "Video"}) is None
@@ -0,0 +1,67 @@
+import os
+import time
+import pytest
+from langchain_community.vectorstores import FAISS
+import content_store
+from content_store import (EmbeddingCache, CachedDocumentEmbeddings, collect_garbage, has_file_store,
+                           publish_file_store, file_store_dir, write_user_manifest, sha256_text)
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(content_store, "CONTENT_DIR", str(tmp_path / "content"))
+    monkeypatch.setattr(content_store, "USERS_DIR", str(tmp_path / "users"))
+    return tmp_path
+
+
+def publish(text, fake_embeddings, age=0):
+    sha = sha256_text(text)
+    publish_file_store(FAISS.from_texts([text], fake_embeddings), sha)
+    if age:
+        past = time.time() - age
+        os.utime(file_store_dir(sha), (past, past))
+    return sha
+
+
+def link(user_id, **files):
+    os.makedirs(os.path.join(content_store.USERS_DIR, user_id), exist_ok=True)
+    write_user_manifest(user_id, {"files": {path: {"sha256": sha} for path, sha in files.items()}})
+
+
+def test_gc_removes_only_old_unreferenced_stores(fake_embeddings):
+    kept = publish("referenced notes", fake_embeddings, age=7200)
+    orphan = publish("orphaned notes", fake_embeddings, age=7200)
+    fresh = publish("just published", fake_embeddings)
+    link("alice", **{"notes.pdf": kept})
+    link("bob")
+
+    removed, _ = collect_garbage(min_age=3600)
+    assert removed == 1
+    assert has_file_store(kept) and has_file_store(fresh)
+    assert not has_file_store(orphan)
+
+
+def test_publishing_an_existing_store_keeps_the_first_copy(fake_embeddings):
+    sha = publish("same file", fake_embeddings)
+    marker = os.path.join(file_store_dir(sha), "marker")
+    open(marker, "w").close()
+    publish_file_store(FAISS.from_texts(["same file"], fake_embeddings), sha)
+    assert os.path.exists(marker)
+    assert [name for name in os.listdir(os.path.dirname(file_store_dir(sha))) if name.endswith(".tmp")] == []
+
+
+def test_cached_embeddings_only_embed_new_chunks(fake_embeddings):
+    cached = CachedDocumentEmbeddings(fake_embeddings, EmbeddingCache())
+    first = cached.embed_documents(["alpha", "beta"])
+    second = cached.embed_documents(["beta", "gamma", "alpha"])
+    assert (cached.embedded, cached.reused) == (3, 2)
+    assert second[0] == pytest.approx(first[1]) and second[2] == pytest.approx(first[0])
+
+
+def test_embedding_cache_prunes_idle_entries():
+    cache = EmbeddingCache()
+    cache.put_many({"a": [1.0, 0.0], "b": [0.0, 1.0]})
+    with cache._connect() as conn:
+        conn.execute("UPDATE embeddings SET used = ? WHERE sha256 = 'a'", (time.time() - 10 * 86400,))
+    assert cache.prune(max_idle_days=5) == 1
+    assert set(cache.get_many(["a", "b"])) == {"b"}
@@ -0,0 +1,96 @@
+import pytest
+from langchain_core.documents import Document
+from context_builder import build_context, merge_adjacent, is_relevant, estimate_tokens
+from telemetry import CONTEXT_TOKENS
+
+
+def doc(text, source="guide.md", score=None, **metadata):
+    return Document(page_content=text, metadata={"index": "global", "source": source, "score": score, **metadata})
+
+
+SHARED = "the workshop meets every friday evening in lab 3"
+
+
+def test_merges_overlapping_chunks_of_the_same_source():
+    first = doc("AdroIT schedule: " + SHARED)
+    second = doc(SHARED + " and runs for two hours.")
+    other = doc(SHARED + " elsewhere", source="other.md")
+    pieces = merge_adjacent([first, other, second])
+    texts = [text for text, _, _ in pieces]
+    assert texts[0] == "AdroIT schedule: " + SHARED + " and runs for two hours."
+    assert pieces[0][2] == [first, second]
+    assert len(pieces) == 2
+
+
+def test_contained_chunks_are_merged_into_the_larger_one():
+    outer = doc("intro. " + SHARED + ". outro")
+    inner = doc(SHARED)
+    (text, rank, group), = merge_adjacent([inner, outer])
+    assert text == outer.page_content and rank == 0 and len(group) == 2
+
+
+def test_short_coincidental_overlap_is_not_merged():
+    assert len(merge_adjacent([doc("ends with lab"), doc("lab starts here")])) == 2
+
+
+def test_drops_distant_dense_hits_but_keeps_the_best():
+    docs = [doc("close", score=0.2), doc("far away", source="b.md", score=1.9)]
+    context = build_context(docs, token_budget=100, max_distance=1.5)
+    assert context.text == "close"
+    assert context.stats["chunks_dropped"] == 1
+
+    only_far = build_context([doc("far away", score=1.9)], token_budget=100, max_distance=1.5)
+    assert only_far.text == "far away"
+
+
+def test_packs_pieces_in_rank_order_within_the_budget():
+    big = doc("x" * 400, source="a.md")  # 100 tokens
+    small = doc("y" * 40, source="b.md")  # 10 tokens
+    bigger = doc("z" * 800, source="c.md")
+    context = build_context([big, bigger, small], token_budget=120, max_distance=0)
+    assert context.text == big.page_content + "\n\n" + small.page_content
+    assert context.docs == [big, small]
+    assert estimate_tokens(context.text) <= 120
+    assert context.stats["tokens_saved"] > 0
+
+
+def test_best_piece_larger_than_the_budget_is_truncated():
+    context = build_context([doc("w" * 1000)], token_budget=50, max_distance=0)
+    assert len(context.text) == 50 * 4
+
+
+def test_relevance_cut_offs():
+    assert is_relevant(doc("unscored hit"), max_distance=1.0, min_bm25=5.0)
+    assert not is_relevant(doc("dense hit", score=1.2), max_distance=1.0)
+    assert is_relevant(doc("keyword hit", bm25=6.0), max_distance=1.0, min_bm25=5.0)
+    assert not is_relevant(doc("keyword hit", bm25=2.0), max_distance=1.0, min_bm25=5.0)
+    # A close dense hit is kept whatever its BM25 score
+    assert is_relevant(doc("both", score=0.3, bm25=0.1), max_distance=1.0, min_bm25=5.0)
+
+
+def test_drops_weak_keyword_only_hits_in_hybrid_results():
+    docs = [
+        doc("dense and keyword hit", score=0.4, bm25=8.0),
+        doc("strong keyword-only hit", source="b.md", bm25=6.0),
+        doc("matched a common word", source="c.md", bm25=1.5),
+    ]
+    context = build_context(docs, token_budget=100, max_distance=1.5, min_bm25_ratio=0.5)
+    assert [d.page_content for d in context.docs] == ["dense and keyword hit", "strong keyword-only hit"]
+    assert context.stats["chunks_dropped"] == 1
+
+    unfiltered = build_context(docs, token_budget=100, max_distance=1.5, min_bm25_ratio=0)
+    assert len(unfiltered.docs) == 3
+
+
+def test_service_counts_tokens_and_cites_only_what_was_sent(monkeypatch):
+    rag_service = pytest.importorskip("rag_service")
+    monkeypatch.setattr(rag_service, "build_context", lambda docs: build_context(docs, token_budget=20, max_distance=1.5))
+    bot = rag_service.RAGService.__new__(rag_service.RAGService)
+    tokens = lambda kind: CONTEXT_TOKENS._values.get((("kind", kind),), 0)
+    retrieved, sent = tokens("retrieved"), tokens("sent")
+
+    docs = [doc("a" * 40, source="docs/kept.md", score=0.1), doc("b" * 400, source="docs/too-big.md", score=0.2)]
+    context = bot.build_context(docs)
+    assert tokens("retrieved") - retrieved == context.stats["tokens_in"] > context.stats["tokens_out"] == tokens("sent") - sent
+    assert context.text == "a" * 40
+    assert bot.describe_sources(context.docs) == [{"title": "kept.md", "page": None}]
@@ -0,0 +1,27 @@
+import threading
+from multiprocessing import AuthenticationError
+import pytest
+import embeddings
+import embedding_server
+from embedding_server import RemoteEmbeddings, serve
+
+
+def test_refuses_an_empty_authkey():
+    with pytest.raises(ValueError):
+        RemoteEmbeddings("/tmp/unused.sock", "")
+    with pytest.raises(ValueError):
+        serve("/tmp/unused.sock", "")
+
+
+def test_round_trip_requires_the_key(tmp_path, monkeypatch, fake_embeddings):
+    monkeypatch.setattr(embeddings, "load_embeddings", lambda: fake_embeddings)
+    monkeypatch.setattr(embedding_server, "CONNECT_TIMEOUT_SECONDS", 5)
+    address = str(tmp_path / "embeddings.sock")
+    threading.Thread(target=serve, args=(address, "secret"), daemon=True).start()
+
+    client = RemoteEmbeddings(address, "secret")
+    assert client.embed_query("docker images") == pytest.approx(fake_embeddings.embed_query("docker images"))
+    assert len(client.embed_documents(["a", "b"])) == 2
+
+    with pytest.raises(AuthenticationError):
+        RemoteEmbeddings(address, "wrong").embed_query("docker images")
@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from admission import AdmissionQueue, Overloaded
+
+rag_service = pytest.importorskip("rag_service")
+
+
+@pytest.fixture
+def bot():
+    bot = rag_service.RAGService.__new__(rag_service.RAGService)  # no model or indexes needed
+    bot.llm = object()
+    return bot
+
+
+CACHE_KEY = ("v1", "public", "What is AdroIT?", None)
+
+
+def test_shared_key_requests_coalesce_across_users(bot):
+    assert bot._flight_key(CACHE_KEY, bot.llm) == bot._flight_key(("v1", "public", "what is adroit", None), bot.llm)
+
+
+def test_personal_keys_only_coalesce_with_the_same_key(bot):
+    personal = object()
+    alice = bot._flight_key(CACHE_KEY, personal, "alice-key")
+    assert alice == bot._flight_key(CACHE_KEY, personal, "alice-key")
+    assert alice != bot._flight_key(CACHE_KEY, personal, "bob-key")
+    assert alice != bot._flight_key(CACHE_KEY, bot.llm)
+    assert "alice-key" not in alice
+
+
+def test_no_coalescing_without_a_shared_cache_key(bot):
+    assert bot._flight_key(None, bot.llm) is None
+
+
+def test_only_shared_key_calls_wait_for_admission(bot):
+    bot.admission = AdmissionQueue(capacity=0, max_queue=0)  # saturated
+
+    async def admit(llm):
+        async with bot._admit(llm, "alice"):
+            return "answered"
+
+    assert asyncio.run(admit(object())) == "answered"  # personal key: its own quota
+    with pytest.raises(Overloaded):
+        asyncio.run(admit(bot.llm))
@@ -0,0 +1,31 @@
+import numpy as np
+import index_factory
+from index_factory import choose_index_type, recall_report, build_index, index_type_of, PQ_MIN_CHUNKS
+
+
+def test_small_stores_fall_back_from_pq_to_sq8():
+    assert PQ_MIN_CHUNKS >= 39 * 256
+    assert choose_index_type(3000, "pq") == "sq8"
+    assert choose_index_type(3000, "ivf_pq") == "sq8"
+    assert choose_index_type(PQ_MIN_CHUNKS, "pq") == "pq"
+
+
+def test_auto_selection_by_size():
+    assert choose_index_type(10, "auto") == "flat"
+    assert choose_index_type(index_factory.SQ8_MIN_CHUNKS, "auto") == "sq8"
+    assert choose_index_type(index_factory.IVF_MIN_CHUNKS, "auto") == "ivf_sq8"
+
+
+def test_ivf_lists_have_enough_training_points():
+    vectors = np.random.default_rng(0).standard_normal((2000, 16)).astype(np.float32)
+    index = build_index(vectors, "ivf_flat")
+    assert index_type_of(index) == "ivf_flat"
+    assert index.nlist * 39 <= len(vectors)
+
+
+def test_recall_report_skips_undertrained_pq():
+    vectors = np.random.default_rng(0).standard_normal((500, 16)).astype(np.float32)
+    rows = {row["type"]: row for row in recall_report(vectors, n_queries=20, index_types=("flat", "sq8", "pq"))}
+    assert rows["flat"]["recall_at_k"] == 1.0
+    assert rows["sq8"]["recall_at_k"] > 0.8
+    assert "skipped" in rows["pq"]
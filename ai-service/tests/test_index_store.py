@@ -0,0 +1,26 @@
+import os
+from langchain_community.vectorstores import FAISS
+from index_store import publish_index, prune_versions, load_index, current_version
+
+
+def make_store(fake_embeddings, texts):
+    return FAISS.from_texts(texts, fake_embeddings, ids=[f"c{i}" for i in range(len(texts))])
+
+
+def test_open_snapshot_survives_pruning(tmp_path, fake_embeddings):
+    base = str(tmp_path / "faiss_index")
+    first = publish_index(make_store(fake_embeddings, ["docker containers", "neural networks"]), base)
+    snapshot = load_index(base, fake_embeddings)
+    publish_index(make_store(fake_embeddings, ["git branching"]), base)
+
+    prune_versions(base, keep=1, grace_seconds=0)
+    assert not os.path.exists(os.path.join(base + ".versions", first))
+    hit, = snapshot.similarity_search("docker containers", k=1)
+    assert hit.page_content == "docker containers"
+
+
+def test_recently_replaced_versions_are_kept(tmp_path, fake_embeddings):
+    base = str(tmp_path / "faiss_index")
+    versions = [publish_index(make_store(fake_embeddings, [f"text {i}"]), base, keep=1) for i in range(3)]
+    assert current_version(base) == versions[-1]
+    assert sorted(os.listdir(base + ".versions")) == versions
@@ -0,0 +1,38 @@
+from query_cache import CachedQueryEmbeddings, AnswerCache, normalize_query
+
+
+class CountingEmbeddings:
+    def __init__(self, base):
+        self.base = base
+        self.queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self.base.embed_query(text)
+
+
+def test_normalize_query():
+    assert normalize_query("  What is  Docker?? ") == "what is docker"
+
+
+def test_query_embeddings_are_cached_by_normalized_text(fake_embeddings):
+    base = CountingEmbeddings(fake_embeddings)
+    cached = CachedQueryEmbeddings(base)
+    assert cached.embed_query("What is Docker?") == cached.embed_query("what is docker")
+    assert base.queries == 1
+
+
+def test_answers_hit_on_exact_and_near_duplicate_questions_only(fake_embeddings):
+    cache = AnswerCache(similarity=0.9)
+    question = "how do docker containers work"
+    cache.put("v1", "public", question, fake_embeddings.embed_query(question), "Like this")
+
+    assert cache.get("v1", "public", "How do Docker containers work?") == "Like this"
+    near = "how do docker containers work exactly"
+    assert cache.get("v1", "public", near, fake_embeddings.embed_query(near)) == "Like this"
+    assert cache.stats()["near_hits"] == 1
+
+    unrelated = "git branching workflows"
+    assert cache.get("v1", "public", unrelated, fake_embeddings.embed_query(unrelated)) is None
+    assert cache.get("v2", "public", question, fake_embeddings.embed_query(question)) is None  # new index version
+    assert cache.get("v1", "approved", question, fake_embeddings.embed_query(question)) is None  # other access tier
@@ -0,0 +1,73 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+from chunk_store import save_store, load_store
+from retrieval import MultiIndexRetriever
+
+TEXTS = [
+    "Intro to neural networks and backpropagation",
+    "Docker containers for deploying web apps",
+    "Kubernetes orchestrates docker containers at scale",
+    "Git branching workflows for web projects",
+]
+METADATAS = [
+    {"domain": "AI/ML", "difficulty": "Beginner"},
+    {"domain": "DevOps", "difficulty": "Beginner"},
+    {"domain": "DevOps", "difficulty": "Advanced"},
+    {"domain": "Web", "difficulty": "Beginner"},
+]
+
+
+class QueryCounter:
+    def __init__(self, base):
+        self.base = base
+        self.queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self.base.embed_query(text)
+
+
+@pytest.fixture
+def store(tmp_path, fake_embeddings):
+    vectorstore = FAISS.from_texts(TEXTS, fake_embeddings, metadatas=METADATAS, ids=[f"c{i}" for i in range(len(TEXTS))])
+    save_store(vectorstore, str(tmp_path))
+    return load_store(str(tmp_path), fake_embeddings)
+
+
+def search(store, fake_embeddings, query, **options):
+    embeddings = QueryCounter(fake_embeddings)
+    docs = MultiIndexRetriever({"resources": store}, embeddings, k=3, top_n=3, **options).invoke(query)
+    return docs, embeddings.queries
+
+
+def test_sparse_mode_never_embeds_the_query(store, fake_embeddings):
+    docs, queries = search(store, fake_embeddings, "kubernetes", mode="sparse")
+    assert queries == 0
+    assert [doc.id for doc in docs] == ["c2"] and "bm25" in docs[0].metadata
+
+
+def test_auto_mode_answers_keyword_queries_from_bm25(store, fake_embeddings):
+    docs, queries = search(store, fake_embeddings, "docker", mode="auto")
+    assert queries == 0 and {doc.id for doc in docs} == {"c1", "c2"}
+
+    # Nothing matches the keywords: fall back to hybrid search
+    docs, queries = search(store, fake_embeddings, "serverless", mode="auto")
+    assert queries == 1 and docs
+
+
+def test_hybrid_mode_fuses_dense_and_keyword_hits(store, fake_embeddings):
+    docs, queries = search(store, fake_embeddings, "how do I deploy docker containers", mode="hybrid")
+    assert queries == 1
+    assert docs[0].id in ("c1", "c2")
+    assert any("bm25" in doc.metadata for doc in docs) and any("score" in doc.metadata for doc in docs)
+
+
+@pytest.mark.parametrize("mode", ["dense", "sparse", "hybrid"])
+def test_filters_restrict_every_mode(store, fake_embeddings, mode):
+    docs, _ = search(store, fake_embeddings, "docker containers", mode=mode, filters={"difficulty": "advanced"})
+    assert [doc.id for doc in docs] == ["c2"]
+
+
+def test_filters_matching_nothing_find_nothing(store, fake_embeddings):
+    docs, _ = search(store, fake_embeddings, "docker containers", mode="hybrid", filters={"domain": "Security"})
+    assert docs == []
@@ -0,0 +1,92 @@
+import json
+from types import SimpleNamespace
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+import serve
+
+
+class JSONStream(httpx.AsyncByteStream):
+    # Streamed like a real worker response; forward() relays it with aiter_raw
+    def __init__(self, payload):
+        self.data = json.dumps(payload).encode()
+
+    async def __aiter__(self):
+        yield self.data
+
+
+class Running:
+    def poll(self):
+        return None
+
+
+def make_cluster(handlers):
+    """A Cluster stand-in whose workers answer through handlers[i](request) instead of processes."""
+    workers = []
+    for index, handler in enumerate(handlers):
+        worker = serve.Worker(index, f"/tmp/unused-{index}.sock", env={})
+        worker.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://worker")
+        worker.process = Running()
+        worker.ready = True
+        workers.append(worker)
+    return SimpleNamespace(workers=workers, stop=lambda: None)
+
+
+def recorder(calls, index):
+    def handler(request):
+        calls.append((index, request.url.path, json.loads(request.content or b"{}"), dict(request.headers)))
+        return httpx.Response(200, headers={"content-type": "application/json"}, stream=JSONStream({"status": "success"}))
+    return handler
+
+
+def test_invalidation_is_broadcast_and_aggregated():
+    calls = []
+    router = TestClient(serve.create_router(make_cluster([recorder(calls, i) for i in range(3)])))
+    response = router.post("/user/cache/invalidate", json={"userId": "u1"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    assert sorted(index for index, *_ in calls) == [0, 1, 2]
+    assert all(body == {"userId": "u1"} for _, _, body, _ in calls)
+
+
+def test_invalidation_reports_failed_workers():
+    def down(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    router = TestClient(serve.create_router(make_cluster([recorder([], 0), down])))
+    response = router.post("/user/cache/invalidate", json={"userId": "u1"})
+    assert response.status_code == 502
+    workers = {w["worker"]: w for w in response.json()["workers"]}
+    assert workers[0]["ok"] and not workers[1]["ok"]
+
+
+def test_users_stick_to_one_worker():
+    calls = []
+    router = TestClient(serve.create_router(make_cluster([recorder(calls, i) for i in range(4)])))
+    for _ in range(3):
+        for user in ("alice", "bob", "carol"):
+            router.post("/chat", json={"message": "hi", "userId": user})
+    owners = {}
+    for index, _, body, _ in calls:
+        owners.setdefault(body["userId"], set()).add(index)
+    assert all(len(indices) == 1 for indices in owners.values())
+
+
+def test_router_overwrites_forwarded_for():
+    calls = []
+    router = TestClient(serve.create_router(make_cluster([recorder(calls, 0)])))
+    router.post("/chat", json={"message": "hi"}, headers={"X-Forwarded-For": "10.0.0.1"})
+    (_, _, _, headers), = calls
+    assert headers["x-forwarded-for"] == "testclient"
+
+
+def test_ingest_goes_to_the_watcher_worker():
+    calls = []
+    cluster = make_cluster([recorder(calls, i) for i in range(8)])
+    router = TestClient(serve.create_router(cluster))
+    router.post("/ingest?mode=incremental")
+    assert [index for index, *_ in calls] == [0]
+
+    cluster.workers[0].process = None  # worker 0 down: some other worker takes it
+    router.post("/ingest?mode=incremental")
+    assert calls[-1][0] != 0
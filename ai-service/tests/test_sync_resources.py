@@ -0,0 +1,84 @@
+import fcntl
+from datetime import datetime, timedelta
+import pytest
+import ingest
+from index_store import load_index, read_index_file
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def resources(tmp_path, monkeypatch, mongo, fake_embeddings):
+    monkeypatch.setattr(ingest, "RESOURCES_INDEX_DIR", str(tmp_path / "faiss_index_resources"))
+    monkeypatch.setattr(ingest, "get_embeddings", lambda: fake_embeddings)
+    collection = mongo.get_database().resources
+    collection.insert_many([
+        {"_id": "r1", "title": "Neural networks", "description": "Backpropagation basics", "domain": "AI/ML", "updatedAt": T0},
+        {"_id": "r2", "title": "Docker", "description": "Containers for web apps", "domain": "DevOps", "updatedAt": T0},
+        {"_id": "r3", "title": "Git", "description": "Branching workflows", "domain": "Web", "updatedAt": T0 + timedelta(hours=1)},
+    ])
+    return collection
+
+
+def indexed_texts(fake_embeddings):
+    store = load_index(ingest.RESOURCES_INDEX_DIR, fake_embeddings, writable=True)
+    return {doc_id: store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values()}
+
+
+def test_first_sync_builds_the_index_and_watermark(resources, fake_embeddings):
+    assert ingest.sync_resources()
+    state = read_index_file(ingest.RESOURCES_INDEX_DIR, ingest.RESOURCES_SYNC_STATE)
+    assert state["watermark"] == (T0 + timedelta(hours=1)).isoformat()
+    assert set(state["chunks"]) == {"r1", "r2", "r3"}
+    assert set(indexed_texts(fake_embeddings)) == {"r1:0", "r2:0", "r3:0"}
+
+
+def test_nothing_changed_publishes_nothing(resources, fake_embeddings):
+    ingest.sync_resources()
+    calls = fake_embeddings.calls
+    assert not ingest.sync_resources()  # r3 sits at the watermark but is already indexed
+    assert fake_embeddings.calls == calls
+
+
+def test_incremental_sync_updates_adds_and_deletes(resources, fake_embeddings):
+    ingest.sync_resources()
+    later = T0 + timedelta(hours=2)
+    resources.update_one({"_id": "r1"}, {"$set": {"description": "Transformers and attention", "updatedAt": later}})
+    resources.insert_one({"_id": "r4", "title": "Kubernetes", "description": "Orchestration", "updatedAt": later})
+    resources.delete_one({"_id": "r2"})
+
+    assert ingest.sync_resources()
+    texts = indexed_texts(fake_embeddings)
+    assert set(texts) == {"r1:0", "r3:0", "r4:0"}
+    assert "Transformers and attention" in texts["r1:0"]
+    state = read_index_file(ingest.RESOURCES_INDEX_DIR, ingest.RESOURCES_SYNC_STATE)
+    assert state["watermark"] == later.isoformat()
+    assert "r2" not in state["chunks"] and "r2" not in state["updated"]
+
+
+def test_only_changed_resources_are_embedded(resources, fake_embeddings, monkeypatch):
+    ingest.sync_resources()
+    embedded = []
+    embed_documents = fake_embeddings.embed_documents
+    monkeypatch.setattr(fake_embeddings, "embed_documents", lambda texts: embedded.extend(texts) or embed_documents(texts))
+    resources.update_one({"_id": "r2"}, {"$set": {"description": "Compose files", "updatedAt": T0 + timedelta(hours=2)}})
+
+    assert ingest.sync_resources()
+    assert len(embedded) == 1 and "Compose files" in embedded[0]
+
+
+def test_deleting_everything_keeps_the_last_index(resources, fake_embeddings):
+    ingest.sync_resources()
+    resources.delete_many({})
+    assert not ingest.sync_resources()
+    assert set(indexed_texts(fake_embeddings)) == {"r1:0", "r2:0", "r3:0"}
+
+
+def test_shared_index_lock_excludes_other_holders(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_LOCK_FILE", str(tmp_path / "faiss_index.lock"))
+    with ingest.shared_index_lock():
+        with open(ingest.INGEST_LOCK_FILE) as other:  # its own open file, as in another worker process
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    with open(ingest.INGEST_LOCK_FILE) as other:
+        fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
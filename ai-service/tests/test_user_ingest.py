@@ -0,0 +1,133 @@
+import os
+import pytest
+import content_store
+import user_ingest
+from cache import LRUCache
+from index_store import current_version, load_index
+
+rag_service = pytest.importorskip("rag_service")
+
+NOTES = "Backpropagation computes gradients layer by layer. " * 20
+DOCKER = "Docker images bundle an app with its dependencies. " * 20
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch, fake_embeddings):
+    monkeypatch.setattr(user_ingest, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(rag_service, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(content_store, "CONTENT_DIR", str(tmp_path / "data" / "content"))
+    monkeypatch.setattr(content_store, "USERS_DIR", str(tmp_path / "data" / "users"))
+    monkeypatch.setattr(user_ingest, "get_embeddings", lambda: fake_embeddings)
+    return tmp_path
+
+
+def upload(storage, user_id, name, text):
+    docs_dir = storage / "data" / "users" / user_id / "docs"
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    (docs_dir / name).write_text(text)
+    return str(docs_dir / name)
+
+
+def sources(storage, user_id, fake_embeddings):
+    store = load_index(str(storage / "data" / "users" / user_id / content_store.USER_INDEX_DIR), fake_embeddings, writable=True)
+    return {store.docstore.search(doc_id).metadata["source"] for doc_id in store.index_to_docstore_id.values()}
+
+
+@pytest.fixture
+def bot(fake_embeddings):
+    bot = rag_service.RAGService.__new__(rag_service.RAGService)  # no model or shared indexes needed
+    bot.embeddings = bot.query_embeddings = fake_embeddings
+    bot.user_index_cache = LRUCache()
+    bot.user_file_sets = LRUCache()
+    return bot
+
+
+def test_ingest_builds_one_search_index_per_user(storage, fake_embeddings):
+    notes = upload(storage, "alice", "notes.md", NOTES)
+    docker = upload(storage, "alice", "docker.txt", DOCKER)
+    assert user_ingest.ingest_user_docs("alice")
+    assert sources(storage, "alice", fake_embeddings) == {notes, docker}
+
+    # Bob's copy of the same file is linked, not embedded, and labeled with his own path
+    calls = fake_embeddings.calls
+    bobs = upload(storage, "bob", "my-notes.md", NOTES)
+    assert user_ingest.ingest_user_docs("bob")
+    assert fake_embeddings.calls == calls
+    assert sources(storage, "bob", fake_embeddings) == {bobs}
+
+
+def test_removing_every_file_removes_the_search_index(storage, fake_embeddings):
+    notes = upload(storage, "alice", "notes.md", NOTES)
+    user_ingest.ingest_user_docs("alice")
+    os.remove(notes)
+    assert not user_ingest.ingest_user_docs("alice")
+    assert current_version(str(storage / "data" / "users" / "alice" / content_store.USER_INDEX_DIR)) is None
+
+
+def test_queries_use_the_merged_index(storage, bot, fake_embeddings):
+    upload(storage, "alice", "notes.md", NOTES)
+    docker = upload(storage, "alice", "docker.txt", DOCKER)
+    user_ingest.ingest_user_docs("alice")
+
+    retriever = bot.get_user_retriever("alice", retrieval_mode="dense")
+    assert list(retriever.vectorstores) == ["user"]
+    best = retriever.invoke("docker images dependencies")[0]
+    assert best.metadata["source"] == docker and best.metadata["index"] == "user"
+    assert bot.get_user_retriever("bob") is None
+
+
+def test_users_without_a_search_index_fan_out_to_a_capped_number_of_files(storage, bot, monkeypatch):
+    upload(storage, "alice", "notes.md", NOTES)
+    upload(storage, "alice", "docker.txt", DOCKER)
+    user_ingest.ingest_user_docs("alice")
+    user_ingest.remove_index(str(storage / "data" / "users" / "alice" / content_store.USER_INDEX_DIR))
+
+    assert len(bot.get_user_retriever("alice").vectorstores) == 2
+    monkeypatch.setattr(rag_service, "USER_FILES_MAX_FANOUT", 1)
+    assert len(bot.get_user_retriever("alice").vectorstores) == 1
+
+    # The next ingest builds the missing search index even though no file changed
+    assert user_ingest.ingest_user_docs("alice")
+    assert list(bot.get_user_retriever("alice").vectorstores) == ["user"]
+
+
+def test_answer_cache_lookup_does_not_load_user_indexes(storage, bot, monkeypatch):
+    upload(storage, "alice", "notes.md", NOTES)
+    user_ingest.ingest_user_docs("alice")
+    monkeypatch.setattr(bot, "get_user_retriever", lambda *args, **kwargs: pytest.fail("retriever built twice"))
+
+    assert bot.lookup_cached_answer("what is backpropagation?", "alice") == (None, None)
+    assert bot.has_user_documents("alice") and not bot.has_user_documents("bob")
+
+
+def test_loaded_user_index_is_reused_until_it_changes(storage, bot, monkeypatch):
+    loads = []
+    real_load_index = rag_service.load_index
+    monkeypatch.setattr(rag_service, "load_index", lambda *args, **kwargs: loads.append(args[0]) or real_load_index(*args, **kwargs))
+    upload(storage, "alice", "notes.md", NOTES)
+    user_ingest.ingest_user_docs("alice")
+
+    bot.get_user_retriever("alice")
+    bot.get_user_retriever("alice")
+    assert len(loads) == 1 and bot.user_index_cache.stats()["hits"] == 1
+
+    upload(storage, "alice", "docker.txt", DOCKER)
+    user_ingest.ingest_user_docs("alice")
+    bot.get_user_retriever("alice")
+    assert len(loads) == 2
+
+
+def test_shared_file_store_outlives_one_owner_deleting_it(storage, bot):
+    alices = upload(storage, "alice", "notes.md", NOTES)
+    upload(storage, "bob", "my-notes.md", NOTES)
+    user_ingest.ingest_user_docs("alice")
+    user_ingest.ingest_user_docs("bob")
+
+    os.remove(alices)
+    user_ingest.ingest_user_docs("alice")
+    assert content_store.collect_garbage(min_age=0)[0] == 0
+    assert content_store.has_file_store(content_store.sha256_text(NOTES))
+
+    os.remove(str(storage / "data" / "users" / "bob" / "docs" / "my-notes.md"))
+    user_ingest.ingest_user_docs("bob")
+    assert content_store.collect_garbage(min_age=0)[0] == 1
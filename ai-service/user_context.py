@@ -0,0 +1,112 @@
+import os
+import logging
+from dataclasses import dataclass
+from bson import ObjectId
+from Crypto.Cipher import AES
+from dotenv import load_dotenv
+from cache import LRUCache
+from telemetry import span
+
+# Load environment variables
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+# Configuration
+USER_CONTEXT_TTL_SECONDS = float(os.getenv("USER_CONTEXT_TTL_SECONDS", "60"))
+USER_CONTEXT_CACHE_SIZE = int(os.getenv("USER_CONTEXT_CACHE_SIZE", "10000"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UserContext:
+    """What the chat path needs to know about a user."""
+    approved: bool = False
+    api_key: str | None = None
+
+
+ANONYMOUS = UserContext()
+
+
+def decrypt_api_key(encrypted_data, encryption_key):
+    """
+    Decrypt API key using AES-256-GCM
+    Format: iv.authTag.encrypted (all hex encoded)
+    """
+    try:
+        parts = encrypted_data.split(".")
+        if len(parts) != 3:
+            return None
+
+        iv_hex, auth_tag_hex, encrypted_hex = parts
+        iv = bytes.fromhex(iv_hex)
+        auth_tag = bytes.fromhex(auth_tag_hex)
+        encrypted = bytes.fromhex(encrypted_hex)
+
+        cipher = AES.new(
+            bytes.fromhex(encryption_key),
+            AES.MODE_GCM,
+            nonce=iv
+        )
+        cipher.update(auth_tag)  # For GCM verification
+
+        decrypted = cipher.decrypt_and_verify(encrypted, auth_tag)
+        return decrypted.decode("utf-8")
+    except Exception as e:
+        logger.error("❌ Error decrypting API key: %s", e)
+        return None
+
+
+class UserContextLoader:
+    """
+    Loads approval status and the decrypted Gemini API key with a single
+    projected find_one, and keeps the result in a short-TTL cache.
+    Call invalidate() whenever the user's key or approval changes.
+    """
+
+    def __init__(self, users_collection, encryption_key, ttl=USER_CONTEXT_TTL_SECONDS):
+        self.users_collection = users_collection
+        self.encryption_key = encryption_key
+        self.cache = LRUCache(max_entries=USER_CONTEXT_CACHE_SIZE, ttl=ttl)
+
+    def load(self, user_id):
+        """Returns the UserContext for user_id (ANONYMOUS if logged out or not found)."""
+        if not user_id:
+            return ANONYMOUS
+
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            return cached
+
+        # Convert string ID to ObjectId
+        try:
+            user_obj_id = ObjectId(user_id)
+        except Exception:
+            user_obj_id = user_id  # Fallback to string if conversion fails
+
+        try:
+            with span("mongo_lookup"):
+                user = self.users_collection.find_one(
+                    {"_id": user_obj_id},
+                    projection={"approved": 1, "geminiApiKey": 1},
+                )
+        except Exception as e:
+            # Don't cache lookup failures, the next request retries
+            logger.error("❌ Error fetching user context: %s", e)
+            return ANONYMOUS
+
+        if not user:
+            logger.warning("⚠️ User not found with ID: %s", user_id)
+            context = ANONYMOUS
+        else:
+            api_key = None
+            if user.get("geminiApiKey"):
+                with span("decrypt"):
+                    api_key = decrypt_api_key(user["geminiApiKey"], self.encryption_key)
+            context = UserContext(approved=bool(user.get("approved", False)), api_key=api_key)
+
+        self.cache.put(user_id, context)
+        return context
+
+    def invalidate(self, user_id):
+        self.cache.pop(user_id)
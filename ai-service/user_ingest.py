@@ -1,85 +1,232 @@
 import os
 import sys
+import logging
+import hashlib
+from itertools import groupby
 from dotenv import load_dotenv
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from cache import user_index_generations
+from embeddings import get_embeddings
+from telemetry import configure_logging
+import index_factory
+from ingest_pipeline import stream_chunks, index_chunks, TEXT_EXTENSIONS, PDF_EXTENSIONS
+from index_store import current_version, load_index, publish_index, remove_index
+from content_store import (
+    EmbeddingCache, CachedDocumentEmbeddings, chunk_id, neutral_source, has_file_store, publish_file_store,
+    load_file_store, stored_vectors, read_user_manifest, write_user_manifest, remove_user_manifest, USER_INDEX_DIR,
+)
 
 # Load environment variables
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
 # Configuration
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+STORAGE_DIR = os.getenv("AI_STORAGE_DIR", BASE_DIR)  # indexes and uploaded user data
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + PDF_EXTENSIONS
+MANIFEST_FILE = "manifest.json"  # pre-content-store user indexes
 
-def ingest_user_docs(user_id: str):
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path):
+    """Content hash of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_user_files(docs_dir):
+    """Returns {relative path: absolute path} for every supported file under docs_dir."""
+    files = {}
+    for root, _, names in os.walk(docs_dir):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, docs_dir)] = path
+    return files
+
+
+def remove_legacy_index(user_data_dir):
+    """Deletes a user's own FAISS index from before the content store."""
+    index_dir = os.path.join(user_data_dir, "faiss_index")
+    remove_index(index_dir)
+    legacy_manifest_path = os.path.join(user_data_dir, MANIFEST_FILE)
+    if os.path.exists(legacy_manifest_path):
+        os.remove(legacy_manifest_path)
+
+
+def seed_from_legacy_index(user_data_dir, embeddings, cache):
+    """Moves a pre-content-store index's vectors into the embedding cache so migrating skips re-embedding."""
+    index_dir = os.path.join(user_data_dir, "faiss_index")
+    if current_version(index_dir) is None:
+        return
+    try:
+        seeded = cache.seed_from_store(load_index(index_dir, embeddings, writable=True))
+        logger.info("♻️ Reusing %d vectors from the user's previous index", seeded)
+    except Exception as e:
+        logger.warning("⚠️ Could not reuse vectors of the previous user index: %s", e)
+
+
+def build_file_stores(paths, embeddings, report, counters):
+    """
+    Parses, splits and embeds the files {path: sha256} into one content store
+    entry each. embeddings is a CachedDocumentEmbeddings, so chunks embedded
+    before (in any file) aren't embedded again.
+    """
+    failed = set()
+
+    def on_error(path, e):
+        logger.warning("⚠️ Error loading %s: %s", os.path.basename(path), e)
+        failed.add(path)
+
+    def on_parsed(path):
+        if path not in failed:
+            counters["files_parsed"] += 1
+            report(**counters)
+
+    def on_batch(n):
+        counters["chunks_embedded"] = embeddings.embedded
+        counters["chunks_reused"] = embeddings.reused
+        logger.info("🧠 Embedded %s chunks (%s reused)...", embeddings.embedded, embeddings.reused)
+        report(**counters)
+
+    # stream_chunks yields files in order, so each file's chunks arrive together
+    for path, file_chunks in groupby(stream_chunks(list(paths), on_error=on_error, on_parsed=on_parsed),
+                                     key=lambda item: item[0]):
+        file_sha = paths[path]
+
+        def chunks():
+            for seq, (_, doc) in enumerate(file_chunks):
+                doc.metadata["source"] = neutral_source(file_sha, path)
+                yield chunk_id(file_sha, seq), doc
+
+        vectorstore = index_chunks(chunks(), embeddings, on_batch=on_batch)
+        if path in failed or vectorstore is None:
+            continue  # partially parsed files are never published
+        index_factory.maybe_upgrade_index(vectorstore)
+        publish_file_store(vectorstore, file_sha)
+
+
+def build_user_index(user_data_dir, files, embeddings):
+    """
+    Copies the chunks of a user's files ({relative path: {"sha256": ...}})
+    out of the content store into the user's own search_index, labeled with
+    the user's paths. A file linked under several names is included once.
+    Vectors are copied, not re-embedded.
+    """
+    docs_dir = os.path.join(user_data_dir, "docs")
+    documents, vectors, ids, seen = [], [], [], set()
+    for rel, entry in sorted(files.items()):
+        if entry["sha256"] in seen:
+            continue
+        seen.add(entry["sha256"])
+        for doc_id, doc, vector in stored_vectors(load_file_store(entry["sha256"], embeddings, writable=True)):
+            doc.metadata["source"] = os.path.join(docs_dir, rel)
+            documents.append(doc)
+            vectors.append(vector)
+            ids.append(doc_id)
+    vectorstore = index_factory.from_embeddings(documents, vectors, embeddings, ids=ids)
+    version = publish_index(vectorstore, os.path.join(user_data_dir, USER_INDEX_DIR))
+    logger.info("🗂️  User search index rebuilt: %s chunks from %s file(s) (version %s)", len(ids), len(seen), version)
+
+
+def ingest_user_docs(user_id: str, full: bool = False, progress=None):
     """
     Ingests documents for a specific user from `data/users/<user_id>/docs`
-    and saves the index to `data/users/<user_id>/faiss_index`.
+    into the shared content store and links them in `data/users/<user_id>/files.json`.
+
+    Files are identified by content hash: a file already in the content store
+    (uploaded before, by this or any other user) is linked without parsing or
+    embedding, and chunks already embedded elsewhere are reused. Incremental:
+    only files whose hash changed since the last run are looked at. Pass
+    full=True to re-link every file from scratch. The linked files' chunks
+    are then copied into the user's merged search_index, which chat queries.
+    progress, if given, is called with a dict of counters as work advances.
     """
-    user_data_dir = os.path.join(BASE_DIR, "data/users", user_id)
+    def report(**counters):
+        if progress:
+            progress(counters)
+
+    user_data_dir = os.path.join(STORAGE_DIR, "data/users", user_id)
     docs_dir = os.path.join(user_data_dir, "docs")
-    index_dir = os.path.join(user_data_dir, "faiss_index")
-    
+
     if not os.path.exists(docs_dir):
-        print(f"❌ User docs directory not found: {docs_dir}")
+        logger.error("❌ User docs directory not found: %s", docs_dir)
         return False
 
-    print(f"📚 Loading documents for User {user_id}...")
-    
-    documents = []
-    
-    # Load Markdown files
-    try:
-        loader = DirectoryLoader(docs_dir, glob="**/*.md", loader_cls=TextLoader)
-        documents.extend(loader.load())
-    except Exception as e:
-        print(f"⚠️ Error loading .md files: {e}")
-        
-    # Load Text files
-    try:
-        loader = DirectoryLoader(docs_dir, glob="**/*.txt", loader_cls=TextLoader)
-        documents.extend(loader.load())
-    except Exception as e:
-        print(f"⚠️ Error loading .txt files: {e}")
-        
-    # Load PDF files
-    # Note: Requires pypdf
-    try:
-        loader = DirectoryLoader(docs_dir, glob="**/*.pdf", loader_cls=PyPDFLoader)
-        documents.extend(loader.load())
-    except Exception as e:
-        print(f"⚠️ Error loading .pdf files (ensure pypdf is installed): {e}")
+    logger.info("📚 Scanning documents for User %s...", user_id)
+    manifest = None if full else read_user_manifest(user_id)
+    if manifest is None:
+        manifest = {"files": {}}
+    ingested = manifest["files"]
+
+    current_files = list_user_files(docs_dir)
+    current_hashes = {rel: file_sha256(path) for rel, path in current_files.items()}
+    changed = [rel for rel, digest in current_hashes.items() if ingested.get(rel, {}).get("sha256") != digest]
+    removed = [rel for rel in ingested if rel not in current_hashes]
+
+    search_index_dir = os.path.join(user_data_dir, USER_INDEX_DIR)
+    if not changed and not removed and (not ingested or current_version(search_index_dir) is not None):
+        logger.info("✅ User index already up to date.")
+        return bool(ingested)
+
+    # Only content nobody has uploaded before is parsed and embedded (once, even if under several names)
+    to_build = {}
+    for rel in changed:
+        if not has_file_store(current_hashes[rel]) and current_hashes[rel] not in to_build.values():
+            to_build[current_files[rel]] = current_hashes[rel]
+    logger.info("%s new/changed file(s) (%s new content), %s removed file(s).", len(changed), len(to_build), len(removed))
+    counters = {"files_total": len(changed), "files_parsed": len(changed) - len(to_build),
+                "files_reused": len(changed) - len(to_build), "chunks_embedded": 0, "chunks_reused": 0}
+    report(**counters)
 
-    if not documents:
-        print("⚠️ No documents found to ingest.")
+    if to_build:
+        embeddings = get_embeddings()
+        cache = EmbeddingCache()
+        seed_from_legacy_index(user_data_dir, embeddings, cache)
+        try:
+            build_file_stores(to_build, CachedDocumentEmbeddings(embeddings, cache), report, counters)
+        except Exception as e:
+            # Nothing has been linked; the user's files.json stays as it was
+            logger.error("❌ Failed to embed user documents: %s", e)
+            return False
+
+    for rel in removed:
+        ingested.pop(rel, None)
+    for rel in changed:
+        if has_file_store(current_hashes[rel]):
+            ingested[rel] = {"sha256": current_hashes[rel]}
+        else:
+            ingested.pop(rel, None)  # failed to load; retried on the next run
+
+    # Nothing left to search: remove the index so chat falls back to global RAG
+    if not ingested:
+        logger.warning("⚠️ No documents found to ingest.")
+        remove_user_manifest(user_id)
+        remove_index(search_index_dir)
+        remove_legacy_index(user_data_dir)
+        user_index_generations.bump(user_id)
         return False
-        
-    print(f"✅ Loaded {len(documents)} documents.")
-
-    # Split documents
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = text_splitter.split_documents(documents)
-    print(f"✂️ Split into {len(splits)} chunks.")
-
-    # Embed and Store
-    print("🧠 Embedding documents... (This runs locally, may take a moment)")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-    
+
     try:
-        vectorstore = FAISS.from_documents(splits, embeddings)
-        vectorstore.save_local(index_dir)
-        print("✅ User Index created successfully!")
+        # Index first: files.json never lists files its search_index doesn't have
+        build_user_index(user_data_dir, ingested, get_embeddings())
+        write_user_manifest(user_id, manifest)
+        # Chat now reads files.json; the user's own pre-content-store index is no longer used
+        remove_legacy_index(user_data_dir)
+        user_index_generations.bump(user_id)
+        logger.info("✅ User Index updated successfully! (%s files)", len(ingested))
         return True
     except Exception as e:
-        print(f"❌ Failed to create vector store: {e}")
+        logger.error("❌ Failed to save user index: %s", e)
         return False
-        
+
 if __name__ == "__main__":
+    configure_logging()
     if len(sys.argv) < 2:
-        print("Usage: python user_ingest.py <user_id>")
+        print("Usage: python user_ingest.py <user_id> [--full]")
         sys.exit(1)
-    
+
     user_id = sys.argv[1]
-    ingest_user_docs(user_id)
+    ingest_user_docs(user_id, full="--full" in sys.argv[2:])
@@ -1,6 +1,7 @@
 import { db } from "../lib/auth.js";
 import crypto from "crypto";
 import { ObjectId } from "mongodb";
+import { invalidateAIUserCache } from "../lib/aiService.js";
 
 const usersCollection = db.collection("user");
 
@@ -99,6 +100,8 @@ export const saveApiKey = async (req, res) => {
       return res.status(404).json({ error: "User not found in database" });
     }
 
+    invalidateAIUserCache(userId);
+
     res.json({
       status: "success",
       message: "API key saved securely",
@@ -174,6 +177,8 @@ export const deleteApiKey = async (req, res) => {
       }
     );
 
+    invalidateAIUserCache(userId);
+
     res.json({
       status: "success",
       message: "API key deleted",
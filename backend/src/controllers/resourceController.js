@@ -7,7 +7,7 @@ const AI_SERVICE_URL = process.env.AI_SERVICE_URL || "http://localhost:8000";
  */
 async function triggerRAGIngestion() {
   try {
-    const response = await fetch(`${AI_SERVICE_URL}/ingest`, {
+    const response = await fetch(`${AI_SERVICE_URL}/ingest?mode=incremental`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
     });
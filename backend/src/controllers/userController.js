@@ -1,6 +1,7 @@
 import { ObjectId } from "mongodb";
 import { db } from "../lib/auth.js";
 import { sendWelcomeEmail } from "../lib/emailService.js";
+import { invalidateAIUserCache } from "../lib/aiService.js";
 
 export const getUsers = async (req, res) => {
   try {
@@ -46,6 +47,8 @@ export const toggleApproval = async (req, res) => {
       return res.status(404).json({ error: "User not found" });
     }
 
+    invalidateAIUserCache(req.params.id);
+
     // Send welcome email when user is approved (not on un-approval)
     if (approved && result.email) {
       sendWelcomeEmail({ to: result.email, userName: result.name }).catch(
@@ -0,0 +1,20 @@
+const AI_SERVICE_URL = process.env.AI_SERVICE_URL || "http://localhost:8000";
+
+/**
+ * Tell the AI service to drop its cached copy of a user's approval status
+ * and API key. Fire-and-forget: the AI service cache also expires on its own.
+ */
+export async function invalidateAIUserCache(userId) {
+  try {
+    const response = await fetch(`${AI_SERVICE_URL}/user/cache/invalidate`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ userId: String(userId) }),
+    });
+    if (!response.ok) {
+      console.warn(`⚠️ AI user cache invalidation response: ${response.status}`);
+    }
+  } catch (error) {
+    console.warn(`⚠️ Could not invalidate AI user cache: ${error.message}`);
+  }
+}
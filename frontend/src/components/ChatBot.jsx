@@ -27,9 +27,11 @@ const ChatBot = () => {
         setMessages(prev => [...prev, { role: "user", content: userMessage }]);
         setInput("");
         setIsLoading(true);
+        let answerOpened = false; // set once "meta" has added the assistant bubble
 
         try {
-            const response = await fetch("http://localhost:8000/chat", {
+            // Streamed over SSE: a "meta" event, then "token" events as they are generated
+            const response = await fetch("http://localhost:8000/chat/stream", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -38,20 +40,51 @@ const ChatBot = () => {
                 }),
             });
 
-            const data = await response.json();
+            if (!response.ok || !response.body) throw new Error(`Chat request failed: ${response.status}`);
 
-            if (data.error) throw new Error(data.error);
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
 
-            setMessages(prev => [...prev, {
-                role: "assistant",
-                content: data.response,
-                mode: data.mode // 'rag' or 'personalized'
-            }]);
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const frames = buffer.split("\n\n");
+                buffer = frames.pop();
+                for (const frame of frames) {
+                    const dataLine = frame.split("\n").find(line => line.startsWith("data: "));
+                    if (!dataLine) continue;
+                    const event = JSON.parse(dataLine.slice(6));
+
+                    if (event.type === "error") throw Object.assign(new Error(event.message), { code: event.code });
+                    if (event.type === "meta") {
+                        answerOpened = true;
+                        setIsLoading(false);
+                        setMessages(prev => [...prev, {
+                            role: "assistant",
+                            content: "",
+                            mode: event.mode === "user_rag" ? "personalized" : "rag"
+                        }]);
+                    } else if (event.type === "token") {
+                        setMessages(prev => {
+                            const last = prev[prev.length - 1];
+                            return [...prev.slice(0, -1), { ...last, content: last.content + event.text }];
+                        });
+                    }
+                }
+            }
         } catch (error) {
-            setMessages(prev => [...prev, {
-                role: "assistant",
-                content: "Sorry, I encountered an error. Please try again later."
-            }]);
+            const content = error.code === "busy"
+                ? error.message
+                : "Sorry, I encountered an error. Please try again later.";
+            setMessages(prev => {
+                const last = prev[prev.length - 1];
+                if (!answerOpened) return [...prev, { role: "assistant", content }];
+                // Fill the bubble "meta" opened rather than leaving it empty next to a second one
+                return [...prev.slice(0, -1), { ...last, content: last.content ? `${last.content}\n\n${content}` : content }];
+            });
             console.error("Chat Error:", error);
         } finally {
             setIsLoading(false);
@@ -119,12 +119,30 @@ export default function Profile() {
       });
       const data = await res.json();
 
-      if (res.ok) {
-        showMessage('success', "File uploaded and indexed successfully! You can now ask questions about it.");
-        setFileStart(null);
-      } else {
+      if (!res.ok) {
         throw new Error(data.detail || "Upload failed");
       }
+
+      // Indexing runs in the background; poll the job until it finishes
+      showMessage('success', "File uploaded! Indexing it now...");
+      setFileStart(null);
+      let job = data;
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const statusRes = await fetch(`http://localhost:8000/user/ingest/status/${data.jobId}`);
+        if (!statusRes.ok) throw new Error("Could not check indexing status");
+        job = await statusRes.json();
+      }
+
+      if (job.status === "failed") {
+        throw new Error(job.error || "Indexing failed");
+      }
+      if (job.indexed === false) {
+        // The job finished but left nothing searchable (e.g. a scanned PDF with no text)
+        showMessage('error', "File uploaded, but no text could be indexed from it. Make sure it contains selectable text (.pdf, .md or .txt).");
+        return;
+      }
+      showMessage('success', "File uploaded and indexed successfully! You can now ask questions about it.");
     } catch (error) {
       console.error("Upload error:", error);
       showMessage('error', "Failed to upload file: " + error.message);